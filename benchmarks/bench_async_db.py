@@ -0,0 +1,98 @@
+"""
+Concurrent throughput of GET /api/contacts style reads with a blocking Session vs an AsyncSession.
+
+Every request first runs ``SELECT sleep()``, an SQL function that holds the connection for ``--query-ms``
+milliseconds, to stand in for a slow Postgres query. With the blocking Session the event loop is frozen for
+the whole query, so concurrent requests are served one at a time. Run with::
+
+    python -m benchmarks.bench_async_db --requests 200 --concurrency 50 --query-ms 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+
+
+def register_sleep(engine, query_ms: float):
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("sleep", 0, lambda: time.sleep(query_ms / 1000) or 1)
+
+
+def seed(url: str, contacts: int) -> User:
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        user = User(username="bench", email="bench@example.com", password="secret")
+        db.add(user)
+        db.flush()
+        db.add_all(Contact(first_name=f"First{i}", last_name=f"Last{i}", email=f"c{i}@example.com",
+                           birth_date=date(1990, 1, 1), user_id=user.id) for i in range(contacts))
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return User(id=user_id)
+
+
+async def run(handler, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    user = seed(f"sqlite:///{path}", args.contacts)
+
+    sync_engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    register_sleep(sync_engine, args.query_ms)
+    SyncSessionLocal = sessionmaker(bind=sync_engine)
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    register_sleep(async_engine.sync_engine, args.query_ms)
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def blocking_handler():
+        # the previous repository code: sync Session calls inside ``async def``
+        with SyncSessionLocal() as db:
+            db.execute(select(func.sleep()))
+            db.query(Contact).filter(Contact.user_id == user.id).limit(args.limit).offset(0).all()
+
+    async def async_handler():
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(func.sleep()))
+            await repository_contacts.get_contacts(args.limit, 0, None, None, None, None, user, db)
+
+    blocking = await run(blocking_handler, args.requests, args.concurrency)
+    non_blocking = await run(async_handler, args.requests, args.concurrency)
+    await async_engine.dispose()
+    print(f"requests={args.requests} concurrency={args.concurrency} query_ms={args.query_ms} limit={args.limit}")
+    print(f"blocking Session: {blocking:8.1f} req/s")
+    print(f"AsyncSession:     {non_blocking:8.1f} req/s")
+    print(f"speedup:          {non_blocking / blocking:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--query-ms", type=float, default=20)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
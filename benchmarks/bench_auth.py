@@ -0,0 +1,44 @@
+"""
+Per-request overhead of Auth.get_current_user with the verified-token cache on and off.
+
+The user itself is served from the warm in-process user cache, as it is for a client that keeps sending the
+same access token, so the numbers are the cost of token verification plus the cache lookups. Run with::
+
+    python -m benchmarks.bench_auth --requests 20000 --tokens 100
+"""
+import argparse
+import asyncio
+import time
+
+from src.database.models import User
+from src.services.auth import Auth
+from src.services.lru import LRUCache
+
+
+async def run(auth: Auth, tokens: list, requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        await auth.get_current_user(tokens[i % len(tokens)], None)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+async def main(args):
+    auth = Auth()
+    auth.user_cache = LRUCache(maxsize=args.tokens, ttl=3600)
+    tokens = []
+    for i in range(args.tokens):
+        email = f"user{i}@example.com"
+        auth.user_cache.set(email, User(id=i, email=email))
+        tokens.append(await auth.create_access_token(data={"sub": email}))
+
+    print(f"requests={args.requests} tokens={args.tokens}")
+    for name, size in (("cache off", 0), ("cache on", args.tokens)):
+        auth.token_cache = LRUCache(maxsize=size, ttl=900)
+        print(f"{name:9} {await run(auth, tokens, args.requests):8.1f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Bytes on the wire and CPU time of response compression by response size, encoding and level.
+
+Bodies are contact pages as GET /api/contacts returns them and a CSV export streamed in batches, compressed with
+the encoders of CompressionMiddleware, so streamed rows pay for the flush after every chunk. Run with::
+
+    python -m benchmarks.bench_compression --sizes 10 100 1000 --gzip-levels 1 6 9 --brotli-qualities 1 4 --repeat 20
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from src.services import compression
+from src.services.compression import BrotliEncoder, GzipEncoder
+from src.services.exporter import to_csv
+
+
+def make_contacts(count: int) -> list:
+    rng = random.Random(count)
+    names = ["Anna", "Bohdan", "Olena", "Taras", "Iryna", "Mykola", "Sofiia", "Andrii"]
+    return [{"id": i, "first_name": rng.choice(names), "last_name": f"Contact{rng.randrange(10000)}",
+             "email": f"user{i}@example.com", "birth_date": str(date(1970, 1, 1) + timedelta(days=rng.randrange(15000))),
+             "favorite": rng.random() < 0.1, "phone": f"+380{rng.randrange(10 ** 9):09d}", "version": 1}
+            for i in range(count)]
+
+
+def encoders(args) -> list:
+    result = [(f"gzip-{level}", lambda level=level: GzipEncoder(level)) for level in args.gzip_levels]
+    if compression.brotli is not None:
+        result += [(f"br-{quality}", lambda quality=quality: BrotliEncoder(quality))
+                   for quality in args.brotli_qualities]
+    return result
+
+
+def measure(make_encoder, chunks: list, repeat: int) -> tuple:
+    start = time.process_time()
+    for _ in range(repeat):
+        encoder = make_encoder()
+        size = sum(len(encoder.compress(chunk, i == len(chunks) - 1)) for i, chunk in enumerate(chunks))
+    return size, (time.process_time() - start) / repeat * 1_000_000
+
+
+def report(title: str, chunks: list, args):
+    raw = sum(len(chunk) for chunk in chunks)
+    print(f"{title}: {raw} bytes in {len(chunks)} chunk(s)")
+    for name, make_encoder in encoders(args):
+        size, cpu = measure(make_encoder, chunks, args.repeat)
+        print(f"  {name:<8} {size:>9} bytes  ratio={raw / size:6.2f}  cpu={cpu:10.1f} us/response")
+
+
+def main(args):
+    if compression.brotli is None:
+        print("brotli is not installed, only gzip is measured")
+    for count in args.sizes:
+        contacts = make_contacts(count)
+        report(f"page of {count} contacts", [json.dumps(contacts).encode("utf-8")], args)
+        rows = [list(contact.values())[1:-1] for contact in contacts]
+        batches = [to_csv(rows[i:i + args.batch]).encode("utf-8") for i in range(0, count, args.batch)]
+        report(f"csv export of {count} contacts", batches + [b""], args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--gzip-levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--brotli-qualities", type=int, nargs="+", default=[1, 4, 11])
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
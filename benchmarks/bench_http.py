@@ -0,0 +1,485 @@
+"""
+End-to-end latency and throughput of every API route over HTTP, checked against a JSON baseline.
+
+The app is served by uvicorn in a background thread. It runs on a fresh SQLite database, or on --database-url,
+seeded with --users users of --contacts contacts each. No external service is needed:
+
+- Redis is an in-memory fakeredis.
+- SMTP is a local aiosmtpd server.
+- Cloudinary uploads are replaced by a stub that sleeps --upload-ms.
+
+An httpx client drives each route of the contacts, birthdays, auth and users routers on its own, with
+--concurrency requests in flight. Then a mixed phase runs the common routes of all routers together.
+The p50/p95/p99 latency and the requests per second of every route are printed and written to --output.
+With --baseline, the run exits with status 1 if any route has errors, or if its p95 grows or its throughput
+drops by more than --threshold. Run with::
+
+    python -m benchmarks.bench_http --users 10 --contacts 1000 --requests 200 --output baseline.json
+    python -m benchmarks.bench_http --users 10 --contacts 1000 --requests 200 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import httpx
+
+PASSWORD = "secret1"
+
+
+class SMTPSink:
+
+    def __init__(self):
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure(args, database_url: str, smtp_port: int):
+    # must run before the first import of src: the settings are read once, at import time
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": database_url,
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": str(smtp_port),
+        "MAIL_SSL_TLS": "false",
+        "MAIL_STARTTLS": "false",
+        "MAIL_USE_CREDENTIALS": "false",
+        "AVATAR_STORAGE": "cloudinary",
+        "RATE_LIMIT_DEFAULT": "1000000/1",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    })
+
+
+def use_fakes(upload_ms: float):
+    import cloudinary.uploader
+    from fakeredis import FakeServer, aioredis
+
+    from src.conf.config import settings
+    from src.services import redis_client
+
+    create_redis = redis_client.create_redis
+    server = FakeServer()
+
+    def create_fake_redis():
+        client = create_redis()
+        client.connection_pool = redis_client.MonitoredConnectionPool(
+            connection_class=aioredis.FakeConnection, server=server,
+            max_connections=settings.redis_max_connections, timeout=settings.redis_pool_timeout)
+        return client
+
+    # the startup handler creates the shared client; main is imported later and picks this one up
+    redis_client.create_redis = create_fake_redis
+
+    def upload(file, public_id, **options):
+        time.sleep(upload_ms / 1000)
+        return {"secure_url": f"https://res.cloudinary.com/bench/image/upload/{public_id}.jpg"}
+
+    cloudinary.uploader.upload = upload
+
+
+def seed(database_url: str, users: int, contacts: int) -> list:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from src.database.models import Base, Contact, User
+    from src.services.auth import auth_service
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    password = auth_service.pwd_context.hash(PASSWORD)
+    seeded = []
+    with sessionmaker(bind=engine)() as db:
+        for u in range(users):
+            user = User(username=f"bench{u}", email=f"bench{u}@example.com", password=password, confirmed=True)
+            user_contacts = [Contact(first_name=f"First{k}", last_name=f"Last{k}", email=f"c{k}@example.com",
+                                     birth_date=date(1990, 1, 1) + timedelta(days=k % 365), user=user)
+                             for k in range(contacts)]
+            db.add_all([user, *user_contacts])
+            db.flush()
+            seeded.append((user.email, [contact.id for contact in user_contacts]))
+        db.commit()
+    engine.dispose()
+    return seeded
+
+
+def start_server(port: int):
+    import uvicorn
+
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server did not start")
+        time.sleep(0.01)
+    return server, thread
+
+
+def avatar_image() -> bytes:
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new('RGB', (1024, 768), (200, 120, 40)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def percentile(values: list, q: float) -> float:
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)] if values else 0.0
+
+
+def summarize(timings: list, errors: int, elapsed: float) -> dict:
+    timings = sorted(timings)
+    return {"requests": len(timings), "errors": errors, "p50_ms": percentile(timings, 50) * 1000,
+            "p95_ms": percentile(timings, 95) * 1000, "p99_ms": percentile(timings, 99) * 1000,
+            "rps": len(timings) / elapsed if elapsed else 0.0}
+
+
+class Workload:
+    """The requests of the benchmark. Every route is a method that sends one request of the route."""
+
+    def __init__(self, http: httpx.AsyncClient, users: list, image: bytes):
+        self.http = http
+        self.users = users
+        self.image = image
+        self.timings = {}
+        self.errors = {}
+        self.created = []
+        self.signups = []
+        self.sequence = 0
+
+    def user(self, i: int) -> dict:
+        return self.users[i % len(self.users)]
+
+    def headers(self, user: dict) -> dict:
+        return {"Authorization": f"Bearer {user['access_token']}"}
+
+    def next(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        The request function sends one request and records its latency under the route template.
+
+        :param self: Represent the instance of the class
+        :param route: str: The method and path template, e.g. GET /api/contacts/{contact_id}
+        :param method: str: The HTTP method
+        :param url: str: The path with the parameters filled in
+        :param **kwargs: Passed on to httpx
+        :return: The response
+        :doc-author: Trelent
+        """
+        start = time.perf_counter()
+        response = await self.http.request(method, url, **kwargs)
+        self.timings.setdefault(route, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    def contact_body(self, k: int, **changes) -> dict:
+        body = {"first_name": f"First{k}", "last_name": f"Last{k}", "email": f"c{k}@example.com",
+                "birth_date": str(date(1990, 1, 1) + timedelta(days=k % 365)), "phone": ""}
+        return dict(body, **changes)
+
+    async def list_contacts(self, i: int):
+        await self.request("GET /api/contacts/", "GET", "/api/contacts/",
+                           params={"limit": 20, "offset": i % 10 * 20}, headers=self.headers(self.user(i)))
+
+    async def search_contacts(self, i: int):
+        await self.request("GET /api/contacts/search", "GET", "/api/contacts/search",
+                           params={"q": f"first{i % 100}"}, headers=self.headers(self.user(i)))
+
+    async def export_contacts(self, i: int):
+        await self.request("GET /api/contacts/export", "GET", "/api/contacts/export",
+                           params={"format": "csv"}, headers=self.headers(self.user(i)))
+
+    async def get_contact(self, i: int):
+        user = self.user(i)
+        await self.request("GET /api/contacts/{contact_id}", "GET",
+                           f"/api/contacts/{user['contacts'][i % len(user['contacts'])]}", headers=self.headers(user))
+
+    async def create_contact(self, i: int):
+        user = self.user(i)
+        response = await self.request("POST /api/contacts/", "POST", "/api/contacts/",
+                                      json=self.contact_body(self.next(), email=f"new{self.next()}@example.com"),
+                                      headers=self.headers(user))
+        if response.status_code == 201:
+            self.created.append((user, response.json()["id"]))
+
+    async def import_contacts(self, i: int):
+        rows = "".join(json.dumps(self.contact_body(k, email=f"import{self.next()}@example.com")) + "\n"
+                       for k in range(20))
+        await self.request("POST /api/contacts/bulk", "POST", "/api/contacts/bulk", content=rows,
+                           headers=dict(self.headers(self.user(i)), **{"Content-Type": "application/x-ndjson"}))
+
+    async def update_contact(self, i: int):
+        user = self.user(i)
+        k = i % len(user['contacts'])
+        await self.request("PUT /api/contacts/{contact_id}", "PUT", f"/api/contacts/{user['contacts'][k]}",
+                           json=self.contact_body(k, last_name=f"Edited{i}"), headers=self.headers(user))
+
+    async def favorite_contact(self, i: int):
+        user = self.user(i)
+        await self.request("PATCH /api/contacts/{contact_id}", "PATCH",
+                           f"/api/contacts/{user['contacts'][i % len(user['contacts'])]}",
+                           json={"favorite": i % 2 == 0}, headers=self.headers(user))
+
+    async def favorite_contacts(self, i: int):
+        user = self.user(i)
+        start = i * 20 % len(user['contacts'])
+        await self.request("PATCH /api/contacts/batch/favorite", "PATCH", "/api/contacts/batch/favorite",
+                           json={"ids": user['contacts'][start:start + 20], "favorite": i % 2 == 0},
+                           headers=self.headers(user))
+
+    async def update_contacts(self, i: int):
+        user = self.user(i)
+        ks = [(i * 10 + n) % len(user['contacts']) for n in range(10)]
+        items = [dict(self.contact_body(k, last_name=f"Batch{i}"), id=user['contacts'][k]) for k in dict.fromkeys(ks)]
+        await self.request("PUT /api/contacts/batch", "PUT", "/api/contacts/batch", json={"contacts": items},
+                           headers=self.headers(user))
+
+    async def remove_contact(self, i: int):
+        user, contact_id = self.created.pop() if self.created else (self.user(i), 0)
+        await self.request("DELETE /api/contacts/{contact_id}", "DELETE", f"/api/contacts/{contact_id}",
+                           headers=self.headers(user))
+
+    async def remove_contacts(self, i: int):
+        user = self.user(i)
+        start = i // len(self.users) * 10 % len(user['contacts'])
+        await self.request("POST /api/contacts/batch/delete", "POST", "/api/contacts/batch/delete",
+                           json={"ids": user['contacts'][start:start + 10]}, headers=self.headers(user))
+
+    async def birthdays(self, i: int):
+        await self.request("GET /api/birthdays/", "GET", "/api/birthdays/", params={"days": 30},
+                           headers=self.headers(self.user(i)))
+
+    async def signup(self, i: int):
+        n = self.next()
+        response = await self.request("POST /api/auth/signup", "POST", "/api/auth/signup",
+                                      json={"username": f"signup{n}", "email": f"signup{n}@example.com",
+                                            "password": PASSWORD})
+        if response.status_code == 201:
+            self.signups.append(f"signup{n}@example.com")
+
+    async def login(self, i: int):
+        user = self.user(i)
+        # a login replaces the refresh token of the user too
+        async with user['lock']:
+            response = await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                                          data={"username": user['email'], "password": PASSWORD})
+            if response.status_code == 200:
+                user['refresh_token'] = response.json()["refresh_token"]
+
+    async def refresh_token(self, i: int):
+        user = self.user(i)
+        # every refresh replaces the refresh token of the user, so refreshes and logins of one user must not overlap
+        async with user['lock']:
+            response = await self.request("GET /api/auth/refresh_token", "GET", "/api/auth/refresh_token",
+                                          headers={"Authorization": f"Bearer {user['refresh_token']}"})
+            if response.status_code == 200:
+                user['refresh_token'] = response.json()["refresh_token"]
+
+    async def request_email(self, i: int):
+        email = self.signups[i % len(self.signups)] if self.signups else self.user(i)['email']
+        await self.request("POST /api/auth/request_email", "POST", "/api/auth/request_email", json={"email": email})
+
+    async def confirmed_email(self, i: int):
+        from src.services.auth import auth_service
+
+        email = self.signups[i % len(self.signups)] if self.signups else self.user(i)['email']
+        token = auth_service.create_email_token({"sub": email})
+        await self.request("GET /api/auth/confirmed_email/{token}", "GET", f"/api/auth/confirmed_email/{token}")
+
+    async def me(self, i: int):
+        await self.request("GET /api/users/me/", "GET", "/api/users/me/", headers=self.headers(self.user(i)))
+
+    async def avatar(self, i: int):
+        await self.request("PATCH /api/users/avatar", "PATCH", "/api/users/avatar",
+                           files={"file": ("avatar.jpg", self.image, "image/jpeg")},
+                           headers=self.headers(self.user(i)))
+
+    async def run(self, calls: list, requests: int, concurrency: int) -> float:
+        """
+        The run function sends requests requests, cycling through calls, with at most concurrency in flight.
+
+        :param self: Represent the instance of the class
+        :param calls: list: The route methods to call
+        :param requests: int: How many requests to send
+        :param concurrency: int: How many requests may be in flight at once
+        :return: The wall clock time of the run in seconds
+        :doc-author: Trelent
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                await calls[i % len(calls)](i)
+
+        self.timings, self.errors = {}, {}
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start
+
+
+async def login_users(http: httpx.AsyncClient, seeded: list) -> list:
+    users = []
+    for email, contacts in seeded:
+        response = await http.post("/api/auth/login", data={"username": email, "password": PASSWORD})
+        response.raise_for_status()
+        users.append(dict(response.json(), email=email, contacts=contacts, lock=asyncio.Lock()))
+    return users
+
+
+async def benchmark(args, port: int, seeded: list) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as http:
+        load = Workload(http, await login_users(http, seeded), avatar_image())
+        # (calls, number of requests); bcrypt and image processing routes get --slow-requests
+        phases = [
+            ([load.list_contacts], args.requests),
+            ([load.get_contact], args.requests),
+            ([load.search_contacts], args.requests),
+            ([load.export_contacts], args.requests),
+            ([load.birthdays], args.requests),
+            ([load.me], args.requests),
+            ([load.create_contact], args.requests),
+            ([load.import_contacts], args.requests),
+            ([load.update_contact], args.requests),
+            ([load.favorite_contact], args.requests),
+            ([load.favorite_contacts], args.requests),
+            ([load.update_contacts], args.requests),
+            ([load.refresh_token], args.requests),
+            ([load.signup], args.slow_requests),
+            ([load.request_email], args.requests),
+            ([load.confirmed_email], args.requests),
+            ([load.login], args.slow_requests),
+            ([load.avatar], args.slow_requests),
+        ]
+        mixed = [load.list_contacts, load.get_contact, load.search_contacts, load.birthdays, load.me,
+                 load.favorite_contact, load.update_contact, load.refresh_token]
+        cleanup = [([load.remove_contact], args.requests), ([load.remove_contacts], args.requests)]
+
+        await load.run(mixed, args.warmup, args.concurrency)
+        routes = {}
+        for calls, requests in phases:
+            elapsed = await load.run(calls, requests, args.concurrency)
+            for route, timings in load.timings.items():
+                routes[route] = summarize(timings, load.errors.get(route, 0), elapsed)
+        elapsed = await load.run(mixed, args.requests * len(mixed), args.concurrency)
+        mixed_summary = summarize([t for timings in load.timings.values() for t in timings],
+                                  sum(load.errors.values()), elapsed)
+        for calls, requests in cleanup:
+            elapsed = await load.run(calls, requests, args.concurrency)
+            for route, timings in load.timings.items():
+                routes[route] = summarize(timings, load.errors.get(route, 0), elapsed)
+    return {"routes": routes, "mixed": mixed_summary}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    The compare function lists the routes of the current run that regressed against the baseline:
+    errors, a p95 latency more than threshold above the baseline, or throughput more than threshold below it.
+
+    :param current: dict: The results of this run
+    :param baseline: dict: The results of the baseline run
+    :param threshold: float: The allowed relative change, e.g. 0.25 for 25%
+    :return: A list of messages, empty if nothing regressed
+    :doc-author: Trelent
+    """
+    problems = []
+    current_routes = dict(current["routes"], mixed=current["mixed"])
+    for route, base in dict(baseline["routes"], mixed=baseline["mixed"]).items():
+        result = current_routes.get(route)
+        if result is None:
+            problems.append(f"{route}: missing from this run")
+            continue
+        if result["errors"]:
+            problems.append(f"{route}: {result['errors']} failed requests")
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            problems.append(f"{route}: p95 {result['p95_ms']:.1f} ms, baseline {base['p95_ms']:.1f} ms")
+        if result["rps"] < base["rps"] * (1 - threshold):
+            problems.append(f"{route}: {result['rps']:.1f} req/s, baseline {base['rps']:.1f} req/s")
+    return problems
+
+
+def report(results: dict):
+    print(f"{'route':40} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for route, result in [*results["routes"].items(), ("mixed", results["mixed"])]:
+        print(f"{route:40} {result['requests']:8} {result['errors']:6} {result['p50_ms']:8.1f} "
+              f"{result['p95_ms']:8.1f} {result['p99_ms']:8.1f} {result['rps']:8.1f}")
+
+
+def main(args) -> int:
+    from aiosmtpd.controller import Controller
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    sink = SMTPSink()
+    smtp = Controller(sink, hostname='127.0.0.1', port=free_port())
+    smtp.start()
+    configure(args, database_url, smtp.port)
+    use_fakes(args.upload_ms)
+    seeded = seed(database_url, args.users, args.contacts)
+    port = free_port()
+    server, thread = start_server(port)
+    try:
+        results = asyncio.run(benchmark(args, port, seeded))
+    finally:
+        server.should_exit = True
+        thread.join()
+        smtp.stop()
+
+    params = {name: getattr(args, name) for name in
+              ("users", "contacts", "requests", "slow_requests", "concurrency", "bcrypt_rounds", "upload_ms")}
+    results = dict(params=params, **results)
+    report(results)
+    print(f"emails delivered: {sink.messages}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["params"] != params:
+        print(f"warning: baseline was recorded with {baseline['params']}")
+    problems = compare(results, baseline, args.threshold)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--slow-requests", type=int, default=40, help="requests per signup, login and avatar route")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--upload-ms", type=float, default=100, help="latency of the fake Cloudinary upload")
+    parser.add_argument("--database-url", help="a scratch database; its tables are dropped and recreated")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+Concurrent login throughput with bcrypt run inline on the event loop vs in the bounded hash pool.
+
+Every simulated login verifies one password, like POST /api/auth/login. While the logins run, a probe task
+stands in for a contacts request: it sleeps 1 ms in a loop and records how late it wakes up. With inline bcrypt
+the loop is frozen for every hash, so logins are serialized and the probe stalls. Run with::
+
+    python -m benchmarks.bench_login --logins 64 --concurrency 32 --rounds 12 --workers 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from src.services.auth import Auth
+
+
+async def probe(lags: list, done: asyncio.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def run(login, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    lags, done = [], asyncio.Event()
+
+    async def one():
+        async with semaphore:
+            await login()
+
+    probe_task = asyncio.create_task(probe(lags, done))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    lags.sort()
+    return logins / elapsed, lags[int(len(lags) * 0.99) - 1] if lags else 0.0, max(lags, default=0.0)
+
+
+async def main(args):
+    auth = Auth()
+    auth.pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds)
+    auth.hash_executor = ThreadPoolExecutor(max_workers=args.workers)
+    hashed = auth.pwd_context.hash("123456789")
+
+    async def inline_login():
+        # the previous route code: a sync passlib call inside ``async def login``
+        auth.pwd_context.verify("123456789", hashed)
+
+    async def pooled_login():
+        await auth.verify_password("123456789", hashed)
+
+    print(f"logins={args.logins} concurrency={args.concurrency} rounds={args.rounds} workers={args.workers}")
+    for name, login in (("inline", inline_login), ("pool", pooled_login)):
+        rate, p99, worst = await run(login, args.logins, args.concurrency)
+        print(f"{name:6} {rate:8.1f} logins/s   event loop lag p99 {p99:8.1f} ms   max {worst:8.1f} ms")
+    auth.hash_executor.shutdown()
+    print(f"single hash: {statistics.mean(timeit(auth, hashed) for _ in range(3)):.1f} ms")
+
+
+def timeit(auth: Auth, hashed: str) -> float:
+    start = time.perf_counter()
+    auth.pwd_context.verify("123456789", hashed)
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
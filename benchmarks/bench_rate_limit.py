@@ -0,0 +1,54 @@
+"""
+Rate limiter cost per request with and without the in-process lease tier.
+
+Runs against an in-memory Redis (fakeredis) with a simulated network round trip added to every script call,
+so the numbers show how many Redis calls the limiter makes and what they cost a request. Run with::
+
+    python -m benchmarks.bench_rate_limit --requests 5000 --clients 50 --rtt-ms 0.5 --batch 10
+"""
+import argparse
+import asyncio
+import time
+
+from fakeredis import FakeServer, aioredis
+
+from src.services.rate_limit import Limiter
+
+
+def with_latency(limiter: Limiter, rtt: float) -> Limiter:
+    script = limiter.script
+
+    async def call(**kwargs):
+        await asyncio.sleep(rtt)
+        return await script(**kwargs)
+
+    limiter.script = call
+    return limiter
+
+
+async def run(limiter: Limiter, requests: int, clients: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        await limiter.acquire(f'rl:bench:user:{i % clients}', 1_000_000, 60)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+async def main(args):
+    print(f"requests={args.requests} clients={args.clients} rtt={args.rtt_ms}ms")
+    for batch in (1, args.batch):
+        client = aioredis.FakeRedis(server=FakeServer())
+        limiter = with_latency(Limiter(client, local_batch=batch, local_size=args.clients), args.rtt_ms / 1000)
+        elapsed = await run(limiter, args.requests, args.clients)
+        stats = limiter.stats()
+        print(f"local_batch={batch:<4} {elapsed:8.1f} us/request  "
+              f"redis calls/request={stats['redis_calls'] / args.requests:.3f}")
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--batch", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""
+Round trips and latency per contact write: SELECT-then-mutate ORM writes vs single ... RETURNING statements.
+
+Every SQL statement sent to the database sleeps ``--rtt-ms`` milliseconds before it runs, to stand in for the
+network round trip to Postgres; COMMIT is not counted. Run with::
+
+    python -m benchmarks.bench_writes --writes 200 --rtt-ms 1
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel, ContactFavoriteStatus
+
+
+# the previous repository code: load the contact, change it, commit and refresh
+async def legacy_create(body, user, db):
+    contact = Contact(**body.dict(), user_id=user.id)
+    db.add(contact)
+    await db.commit()
+    await db.refresh(contact)
+    return contact
+
+
+async def legacy_update(body, contact_id, user, db):
+    contact = await repository_contacts.get_contact(contact_id, user, db)
+    if contact:
+        for field, value in body.dict().items():
+            setattr(contact, field, value)
+        await db.commit()
+    return contact
+
+
+async def legacy_update_favorite(body, contact_id, user, db):
+    contact = await repository_contacts.get_contact(contact_id, user, db)
+    if contact:
+        contact.favorite = body.favorite
+        await db.commit()
+    return contact
+
+
+async def legacy_remove(contact_id, user, db):
+    contact = await repository_contacts.get_contact(contact_id, user, db)
+    if contact:
+        await db.delete(contact)
+        await db.commit()
+    return contact
+
+
+LEGACY = (legacy_create, legacy_update, legacy_update_favorite, legacy_remove)
+RETURNING = (repository_contacts.create_contact, repository_contacts.update_contact,
+             repository_contacts.update_favorite_contact, repository_contacts.remove_contact)
+
+
+async def run(functions, SessionLocal, user: User, writes: int, counter: list):
+    create, update_, update_favorite, remove = functions
+    results = {}
+    for name in ("create", "update", "favorite", "remove"):
+        results[name] = [0, 0.0]
+    for i in range(writes):
+        body = ContactModel(first_name="First", last_name="Last", email=f"c{i}@example.com",
+                            birth_date=date(1990, 1, 1))
+        changed = body.copy(update={"first_name": "Changed"})
+        steps = (("create", lambda db: create(body, user, db)),
+                 ("update", lambda db: update_(changed, contact.id, user, db)),
+                 ("favorite", lambda db: update_favorite(ContactFavoriteStatus(favorite=True), contact.id, user, db)),
+                 ("remove", lambda db: remove(contact.id, user, db)))
+        for name, step in steps:
+            # a new session per write, like a request
+            async with SessionLocal() as db:
+                counter[0] = 0
+                start = time.perf_counter()
+                result = await step(db)
+                results[name][1] += time.perf_counter() - start
+                results[name][0] += counter[0]
+            if name == "create":
+                contact = result
+    return {name: (statements / writes, elapsed / writes * 1000) for name, (statements, elapsed) in results.items()}
+
+
+async def main(args):
+    engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+    async with SessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", password="secret")
+        db.add(user)
+        await db.commit()
+
+    counter = [0]
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+        time.sleep(args.rtt_ms / 1000)
+
+    print(f"writes={args.writes} rtt_ms={args.rtt_ms}")
+    for label, functions in (("select + mutate", LEGACY), ("RETURNING", RETURNING)):
+        for name, (statements, ms) in (await run(functions, SessionLocal, user, args.writes, counter)).items():
+            print(f"{label:15} {name:8} {statements:4.1f} statements/write {ms:8.2f} ms/write")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -1,15 +1,27 @@
-import time
+import os
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST
 from sqlalchemy import text
-from fastapi_limiter import FastAPILimiter
-import redis.asyncio as redis
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, engine, replica_router
+from src.database.pool import pool_status
 from src.routes import contacts, birthdays, auth, users
 from src.conf.config import settings
+from src.schemas import PoolStatusResponse, CacheStatsResponse, RedisStatusResponse, MailStatusResponse, \
+    RateLimitStatusResponse, ReplicaStatusResponse
+from src.services.cache import contacts_cache
+from src.services.compression import CompressionMiddleware
+from src.services.mailer import mailer
+from src.services.metrics import MetricsMiddleware, latest
+from src.services.rate_limit import limiter
+from src.services.sql_profile import SQLProfileMiddleware
+from src.services.uploads import FORM_OVERHEAD, ContentLengthLimitMiddleware
+from src.services.auth import auth_service
+from src.services.redis_client import create_redis, redis_status, close_redis
 
 app = FastAPI()
 
@@ -17,31 +29,22 @@ origins = [
     "http://localhost:3000"
     ]
 
+# oversized avatars are refused from their Content-Length, before the form is read
+app.add_middleware(ContentLengthLimitMiddleware,
+                   limits={"/api/users/avatar": settings.avatar_max_bytes + FORM_OVERHEAD})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """
-    The add_process_time_header function adds a header to the response called &quot;My-Process-Time&quot;
-    that contains the time it took for this function to run. This is useful for debugging purposes.
-
-    :param request: Request: Access the request object
-    :param call_next: Call the next middleware in the chain
-    :return: A response object
-    :doc-author: Trelent
-    """
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["My-Process-Time"] = str(process_time)
-    return response
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(SQLProfileMiddleware)
 
 
 @app.get("/", name='Корінь проекту')
@@ -57,19 +60,20 @@ def read_root():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is a simple function that checks if the database is configured correctly.
     It does this by making a request to the database and checking if it returns any results.
     If there are no results, then we know something went wrong with our configuration.
 
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with a message
     :doc-author: Trelent
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = await db.execute(text("SELECT 1"))
+        result = result.fetchone()
         print(result)
         if result is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -81,20 +85,126 @@ def healthchecker(db: Session = Depends(get_db)):
                             detail="Error connecting to the database")
 
 
+@app.get("/api/healthchecker/pool", response_model=PoolStatusResponse, response_model_exclude_none=True)
+def pool_checker():
+    """
+    The pool_checker function reports the live state of the database connection pool:
+    checked-out, idle and overflow connections and how long requests waited for a connection.
+    Use it to size db_pool_size and db_max_overflow from data.
+
+    :return: A dictionary with the pool metrics
+    :doc-author: Trelent
+    """
+    return pool_status(engine.pool)
+
+
+@app.get("/api/healthchecker/cache", response_model=CacheStatsResponse)
+def cache_checker():
+    """
+    The cache_checker function reports the hit, miss and error counters of the contacts cache in this worker.
+
+    :return: A dictionary with the cache counters
+    :doc-author: Trelent
+    """
+    return contacts_cache.stats()
+
+
+@app.get("/api/healthchecker/redis", response_model=RedisStatusResponse)
+def redis_checker():
+    """
+    The redis_checker function reports the shared Redis connection pool usage and the latency of every
+    Redis command sent by this worker.
+
+    :return: A dictionary with the pool usage and per-command stats
+    :doc-author: Trelent
+    """
+    return redis_status(app.state.redis)
+
+
+@app.get("/api/healthchecker/mail", response_model=MailStatusResponse)
+def mail_checker():
+    """
+    The mail_checker function reports the mail queue of this worker: how many emails were queued, sent,
+    retried and given up on, how many SMTP connections were opened and how long sends take.
+
+    :return: A dictionary with the mail queue stats
+    :doc-author: Trelent
+    """
+    return mailer.status()
+
+
+@app.get("/api/healthchecker/limiter", response_model=RateLimitStatusResponse)
+def limiter_checker():
+    """
+    The limiter_checker function reports the rate limiter of this worker: how many requests were admitted
+    and rejected, how many were admitted from a local lease without Redis, and how long the Redis calls take.
+
+    :return: A dictionary with the rate limiter stats
+    :doc-author: Trelent
+    """
+    return limiter.stats()
+
+
+@app.get("/api/healthchecker/replicas", response_model=ReplicaStatusResponse)
+def replicas_checker():
+    """
+    The replicas_checker function reports the read replicas as this worker sees them: whether the last check
+    passed, how far each replica lags and whether it takes reads, and where the reads of GET requests went.
+
+    :return: A dictionary with the replica states and read counters
+    :doc-author: Trelent
+    """
+    return replica_router.status()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    The metrics function exposes the metrics of this worker in the Prometheus text format:
+    request counts, latency and requests in progress per route, SQL, Redis and rate limiter timings.
+
+    :return: The metrics as text
+    :doc-author: Trelent
+    """
+    return Response(latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.on_event("startup")
 async def startup():
     """
     The startup function is called when the application starts up.
     It's a good place to initialize things that are used by the app, such as databases or caches.
+    The shared Redis client is created here and handed to auth, the contacts cache, the rate limiter and the
+    replica router; the mail workers are started, and the read replicas are checked before they take reads.
 
     :return: A list of objects to be passed to the application
     :doc-author: Trelent
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    app.state.redis = create_redis()
+    auth_service.r = contacts_cache.client = limiter.client = replica_router.client = app.state.redis
+    await mailer.start()
+    await replica_router.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It sends the queued emails, stops checking the read replicas and closes the shared Redis connection pool.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    await mailer.stop()
+    await replica_router.stop()
+    await close_redis(app.state.redis)
 
 app.include_router(contacts.router, prefix='/api')
 app.include_router(birthdays.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+
+if settings.avatar_storage == 'local':
+    # avatars written by LocalStorage are served by the app itself
+    os.makedirs(settings.avatar_dir, exist_ok=True)
+    app.mount(settings.avatar_url, StaticFiles(directory=settings.avatar_dir), name="avatars")
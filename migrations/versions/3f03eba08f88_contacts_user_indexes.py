@@ -0,0 +1,36 @@
+"""contacts user indexes
+
+Revision ID: 3f03eba08f88
+Revises: 5865f0ec8b6d
+Create Date: 2026-10-18 10:12:41.208533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f03eba08f88'
+down_revision = '5865f0ec8b6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # pattern_ops lets Postgres serve prefix LIKE 'abc%' from the index regardless of the database collation
+    op.create_index('ix_contacts_user_id_first_name', 'contacts', ['user_id', 'first_name'], unique=False,
+                    postgresql_ops={'first_name': 'varchar_pattern_ops'})
+    op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False,
+                    postgresql_ops={'last_name': 'varchar_pattern_ops'})
+    op.create_index('ix_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=False,
+                    postgresql_ops={'email': 'varchar_pattern_ops'})
+    # ordinary btree for the (last_name, first_name, id) keyset sort of GET /api/contacts?cursor=
+    op.create_index('ix_contacts_user_id_sort', 'contacts', ['user_id', 'last_name', 'first_name', 'id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_sort', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_email', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_first_name', table_name='contacts')
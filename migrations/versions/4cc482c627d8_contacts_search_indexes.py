@@ -0,0 +1,60 @@
+"""contacts search indexes
+
+Revision ID: 4cc482c627d8
+Revises: ea719731899f
+Create Date: 2026-10-18 13:25:04.118392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4cc482c627d8'
+down_revision = 'ea719731899f'
+branch_labels = None
+depends_on = None
+
+# must stay identical to search_document in src/database/models.py, or the planner will not use the indexes
+SEARCH_DOCUMENT = "first_name || ' ' || last_name || ' ' || email || ' ' || coalesce(phone, '')"
+
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE contacts_fts USING fts5(first_name, last_name, email, phone, "
+    "content='contacts', content_rowid='id')",
+    "CREATE TRIGGER contacts_fts_insert AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+    "CREATE TRIGGER contacts_fts_delete AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); END",
+    "CREATE TRIGGER contacts_fts_update AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+    # index the existing contacts
+    "INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            op.execute(statement)
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_contacts_search_vector', 'contacts',
+                    [sa.text(f"to_tsvector('simple'::regconfig, {SEARCH_DOCUMENT})")], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_contacts_search_trgm', 'contacts', [sa.text(f"({SEARCH_DOCUMENT}) gin_trgm_ops")],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('contacts_fts_update', 'contacts_fts_delete', 'contacts_fts_insert'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS contacts_fts")
+        return
+    op.drop_index('ix_contacts_search_trgm', table_name='contacts')
+    op.drop_index('ix_contacts_search_vector', table_name='contacts')
@@ -0,0 +1,26 @@
+"""row versions
+
+Revision ID: b7e1c9d4a2f6
+Revises: 4cc482c627d8
+Create Date: 2026-10-18 17:42:51.309114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1c9d4a2f6'
+down_revision = '4cc482c627d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'version')
+    op.drop_column('contacts', 'version')
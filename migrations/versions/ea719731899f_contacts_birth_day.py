@@ -0,0 +1,33 @@
+"""contacts birth_day
+
+Revision ID: ea719731899f
+Revises: 3f03eba08f88
+Create Date: 2026-10-18 11:02:17.640215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ea719731899f'
+down_revision = '3f03eba08f88'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birth_day', sa.SmallInteger(), nullable=True))
+    # backfill MMDD from the existing birth dates
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET birth_day = CAST(strftime('%m%d', birth_date) AS INTEGER)")
+    else:
+        op.execute("UPDATE contacts SET birth_day = EXTRACT(MONTH FROM birth_date) * 100 + EXTRACT(DAY FROM birth_date)")
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.alter_column('birth_day', existing_type=sa.SmallInteger(), nullable=False)
+    op.create_index('ix_contacts_user_id_birth_day', 'contacts', ['user_id', 'birth_day'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birth_day', table_name='contacts')
+    op.drop_column('contacts', 'birth_day')
@@ -1,20 +1,75 @@
+from typing import Dict, List
+
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlalchemy_replica_urls: List[str] = []
+    replica_max_lag: float = 5
+    replica_check_interval: float = 5
+    replica_check_timeout: float = 2
+    replica_sticky_seconds: float = 20
+    sql_profile: bool = False
+    sql_query_budget: int = 0
+    sql_repeat_threshold: int = 3
+    sql_slowest: int = 3
+    compression_encodings: List[str] = ['br', 'gzip']
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
     secret_key: str
     algorithm: str
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
     mail_username: str
     mail_password: str
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    mail_use_credentials: bool = True
+    mail_validate_certs: bool = True
+    mail_timeout: float = 10
+    mail_workers: int = 2
+    mail_queue_size: int = 1000
+    mail_batch_size: int = 20
+    mail_max_attempts: int = 4
+    mail_retry_delay: float = 1
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    redis_max_connections: int = 50
+    redis_pool_timeout: float = 5
+    redis_socket_timeout: float = 2
+    redis_connect_timeout: float = 2
+    redis_error_log_interval: float = 60
+    rate_limit_default: str = '10/60'
+    rate_limits: Dict[str, str] = {}
+    rate_limit_local_batch: int = 1
+    rate_limit_local_size: int = 10000
+    contacts_cache_ttl: int = 300
+    contacts_fast_json: bool = False
+    user_cache_size: int = 1024
+    user_cache_ttl: float = 60
+    token_cache_size: int = 4096
+    token_cache_ttl: float = 900
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    avatar_storage: str = 'cloudinary'
+    avatar_dir: str = 'static/avatars'
+    avatar_url: str = '/static/avatars'
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_max_pixels: int = 40_000_000
+    avatar_size: int = 250
+    avatar_workers: int = 2
+    contacts_import_batch_size: int = 1000
 
     class Config:
         env_file = ".env"
@@ -1,25 +1,117 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from src.conf.config import settings
+from src.database.pool import MonitoredQueuePool
+from src.database.replicas import Replica, ReplicaRouter
+from src.services.metrics import instrument_engine
+from src.services.sql_profile import profile_engine
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def get_async_url(url: str) -> str:
+    """
+    The get_async_url function maps a synchronous database url onto its async driver.
+        Alembic keeps using the synchronous url from the settings, while the application talks to the
+        same database through asyncpg (Postgres) or aiosqlite (SQLite).
+
+    :param url: str: The database url from the settings
+    :return: The database url with an async driver
+    :doc-author: Trelent
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+
+def get_pool_options(url: str) -> dict:
+    """
+    The get_pool_options function builds the connection pool arguments of the engine from the settings.
+        In-memory SQLite keeps its default single-connection pool, so no options are returned for it.
+
+    :param url: str: The async database url
+    :return: Keyword arguments for create_async_engine
+    :doc-author: Trelent
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    return dict(
+        poolclass=MonitoredQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+def create_database_engine(url: str):
+    """
+    The create_database_engine function creates the async engine of a database url from the settings,
+    with the pool options, metrics and SQL profiling of the application.
+
+    :param url: str: The database url from the settings
+    :return: An AsyncEngine
+    :doc-author: Trelent
+    """
+    url = get_async_url(url)
+    async_engine = create_async_engine(url, **get_pool_options(url))
+    instrument_engine(async_engine.sync_engine)
+    profile_engine(async_engine.sync_engine)
+    return async_engine
+
+
+ASYNC_DATABASE_URL = get_async_url(SQLALCHEMY_DATABASE_URL)
+engine = create_database_engine(SQLALCHEMY_DATABASE_URL)
+
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# the Redis client is set on startup, see main.py
+replica_router = ReplicaRouter([Replica(create_database_engine(url)) for url in settings.sqlalchemy_replica_urls],
+                               None, max_lag=settings.replica_max_lag,
+                               check_interval=settings.replica_check_interval,
+                               check_timeout=settings.replica_check_timeout, sticky=settings.replica_sticky_seconds)
 
 
 # Dependency
-def get_db():
+async def get_db(request: Request):
     """
-    The get_db function is a context manager that returns the database session.
+    The get_db function is an async generator that returns the database session.
     It also ensures that the connection to the database is closed after each request.
+    GET and HEAD requests get a session of a read replica when replicas are configured, see ReplicaRouter;
+    a GET route that writes must use get_primary_db instead. Once the session is closed, after a write commits,
+    the user's reads are kept on the primary for another settings.replica_sticky_seconds.
 
-    :return: A database session
+    :param request: Request: The request the session is for
+    :return: An async database session
     :doc-author: Trelent
     """
-    db = SessionLocal()
+    authorization = request.headers.get('Authorization')
+    session_factory = await replica_router.session_factory(request.method, authorization)
     try:
-        yield db
+        async with (session_factory or SessionLocal)() as db:
+            yield db
     finally:
-        db.close()
+        await replica_router.request_done(request.method, authorization)
+
+
+async def get_primary_db():
+    """
+    The get_primary_db function returns a session of the primary database whatever the request method,
+    for GET routes that write or must not read stale data.
+
+    :return: An async database session
+    :doc-author: Trelent
+    """
+    async with SessionLocal() as db:
+        yield db
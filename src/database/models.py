@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, func, DateTime, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, func, DateTime, UniqueConstraint, Index, DDL, \
+    event, literal_column, text
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import Date
 from sqlalchemy.ext.declarative import declarative_base
@@ -7,21 +8,92 @@ from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 
+def get_birth_day(birth_date) -> int:
+    """
+    The get_birth_day function turns a birth date into its month and day as a sortable MMDD number,
+    e.g. 24 December becomes 1224. The year is dropped, so the number can be indexed and compared
+    against the upcoming days of any year.
+
+    :param birth_date: date: The birth date
+    :return: The month and day as an integer
+    :doc-author: Trelent
+    """
+    return birth_date.month * 100 + birth_date.day
+
+
 class Contact(Base):
     __tablename__ = "contacts"
     __table_args__ = (
         UniqueConstraint('email', 'user_id', name='unique_contact_user'),
+        Index('ix_contacts_user_id_first_name', 'user_id', 'first_name',
+              postgresql_ops={'first_name': 'varchar_pattern_ops'}),
+        Index('ix_contacts_user_id_last_name', 'user_id', 'last_name',
+              postgresql_ops={'last_name': 'varchar_pattern_ops'}),
+        Index('ix_contacts_user_id_email', 'user_id', 'email',
+              postgresql_ops={'email': 'varchar_pattern_ops'}),
+        Index('ix_contacts_user_id_sort', 'user_id', 'last_name', 'first_name', 'id'),
+        Index('ix_contacts_user_id_birth_day', 'user_id', 'birth_day'),
     )
     id = Column(Integer, primary_key=True)
     first_name = Column(String(50), nullable=False)
     last_name = Column(String(50), nullable=False)
     email = Column(String(50), nullable=False)
     birth_date = Column(Date, nullable=False)
+    birth_day = Column(SmallInteger, nullable=False)
     favorite = Column(Boolean, default=False)
     phone = Column(String(12), default="")
+    # bumped by every write of the row; the ETag of the contact
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    @validates('birth_date')
+    def validate_birth_date(self, key, birth_date):
+        """
+        The validate_birth_date function keeps birth_day in sync whenever birth_date is set on a contact.
+
+        :param self: Represent the instance of the class
+        :param key: Name of the attribute being set
+        :param birth_date: date: The new birth date
+        :return: The birth date unchanged
+        :doc-author: Trelent
+        """
+        self.birth_day = get_birth_day(birth_date)
+        return birth_date
+
+
+# The text searched by GET /api/contacts/search. The separators are SQL literals rather than bound parameters, so that
+# Postgres can match the search query against the expression indexes below.
+SEARCH_SEPARATOR = literal_column("' '")
+search_document = (Contact.first_name + SEARCH_SEPARATOR + Contact.last_name + SEARCH_SEPARATOR + Contact.email
+                   + SEARCH_SEPARATOR + func.coalesce(Contact.phone, literal_column("''")))
+search_vector = func.to_tsvector(text("'simple'::regconfig"), search_document)
+
+# Postgres: full-text GIN index for word prefixes and pg_trgm GIN index for typo tolerant matches
+Index('ix_contacts_search_vector', search_vector, postgresql_using='gin').ddl_if(dialect='postgresql')
+Index('ix_contacts_search_trgm', search_document.label('search_document'), postgresql_using='gin',
+      postgresql_ops={'search_document': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
+# SQLite: FTS5 index over the same columns, kept in sync with contacts by triggers
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE contacts_fts USING fts5(first_name, last_name, email, phone, "
+    "content='contacts', content_rowid='id')",
+    "CREATE TRIGGER contacts_fts_insert AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+    "CREATE TRIGGER contacts_fts_delete AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); END",
+    "CREATE TRIGGER contacts_fts_update AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+)
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Contact.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -33,3 +105,5 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
+    # bumped when the profile changes; the ETag of GET /api/users/me/
+    version = Column(Integer, nullable=False, default=1, server_default='1')
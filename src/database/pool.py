@@ -0,0 +1,78 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.conf.config import settings
+
+
+class PoolStats:
+    """Checkout wait-time counters of a connection pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        """
+        The record function adds the wait time of one successful checkout to the counters.
+
+        :param self: Represent the instance of the class
+        :param wait: float: Seconds spent waiting for a connection
+        :return: None
+        :doc-author: Trelent
+        """
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that measures how long every checkout waits for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return entry
+
+
+def pool_status(pool) -> dict:
+    """
+    The pool_status function reports the live state of a connection pool.
+        Pools without a size limit (NullPool, StaticPool for in-memory SQLite) only report their class name.
+
+    :param pool: Pool: The pool of the engine, e.g. engine.pool
+    :return: A dictionary with checked-out, idle and overflow connections and checkout wait times
+    :doc-author: Trelent
+    """
+    status = {"pool": type(pool).__name__}
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return status
+    status.update(
+        size=pool.size(),
+        checked_out=pool.checkedout(),
+        idle=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        # the configured value that get_pool_options passes to the engine; QueuePool keeps its own privately
+        max_overflow=settings.db_max_overflow,
+    )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(
+            checkouts=stats.checkouts,
+            timeouts=stats.timeouts,
+            wait_avg_ms=stats.wait_total / stats.checkouts * 1000 if stats.checkouts else 0.0,
+            wait_max_ms=stats.wait_max * 1000,
+        )
+    return status
@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import List
+
+from jose import JWTError, jwt
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from src.services.redis_client import RedisErrorLog
+
+logger = logging.getLogger(__name__)
+log_redis_error = RedisErrorLog(logger)
+
+# Seconds the replica is behind the primary. On a replica with nothing left to replay the lag is 0, however long
+# ago the last transaction was; other databases (e.g. SQLite copies in development) report no lag.
+LAG_QUERIES = {
+    'postgresql': "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END",
+}
+READ_METHODS = {'GET', 'HEAD'}
+
+
+class Replica:
+    """A read replica: its engine, its sessions and the result of the last health check."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.name = make_url(str(engine.url)).render_as_string(hide_password=True)
+        self.SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+                                               info={'replica': self.name})
+        self.lag_query = text(LAG_QUERIES.get(engine.dialect.name, "SELECT 0"))
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.error = None
+
+    def usable(self, max_lag: float) -> bool:
+        return self.healthy and self.lag is not None and self.lag <= max_lag
+
+    def busy(self) -> int:
+        checkedout = getattr(self.engine.pool, 'checkedout', None)
+        return checkedout() if checkedout else 0
+
+
+def is_replica_session(session: AsyncSession) -> bool:
+    """
+    The is_replica_session function tells whether a session reads from a replica. What such a session reads
+    may be up to max_lag plus check_interval seconds old, so it must not fill caches keyed by current versions.
+
+    :param session: AsyncSession: The database session
+    :return: True for a session of a replica, False for the primary
+    :doc-author: Trelent
+    """
+    return 'replica' in session.info
+
+
+def token_subject(authorization: str | None) -> str | None:
+    """
+    The token_subject function reads the subject of a bearer token without verifying it.
+        The subject only decides which database a read goes to, so a forged token can do no more than send
+        its own reads to the primary; the route still verifies the token before it reads anything.
+
+    :param authorization: str | None: The Authorization header
+    :return: The email in the token, or None
+    :doc-author: Trelent
+    """
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get('sub')
+    except JWTError:
+        return None
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of GET requests to read replicas and everything else to the primary.
+    Replicas are checked every check_interval seconds in the background; one that fails the check or lags more
+    than max_lag seconds gets no reads until a later check passes. Among the usable replicas the one with the
+    fewest connections in use is chosen, taking turns on ties, and when none is usable reads go to the primary.
+    A user who wrote in the last sticky seconds reads from the primary. The marker is set when a write request
+    starts and again once it is done, after the commit; a usable replica can be up to max_lag plus check_interval
+    seconds behind by then, so sticky must be longer than that for read-your-writes. The marker is kept in Redis
+    so that it holds across workers; when Redis fails, reads go to the primary.
+    """
+
+    def __init__(self, replicas: List[Replica], client: Redis | None, max_lag: float, check_interval: float,
+                 check_timeout: float, sticky: float):
+        self.replicas = replicas
+        self.client = client
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.sticky = sticky
+        self.rotation = itertools.count()
+        self.task = None
+        self.reads = {'replica': 0, 'sticky': 0, 'fallback': 0}
+
+    @staticmethod
+    def writer_key(subject: str) -> str:
+        return f"replicas:writer:{subject}"
+
+    def choose(self) -> Replica | None:
+        """
+        The choose function picks the replica for the next read.
+
+        :param self: Represent the instance of the class
+        :return: The least busy usable replica, or None when no replica is usable
+        :doc-author: Trelent
+        """
+        usable = [replica for replica in self.replicas if replica.usable(self.max_lag)]
+        if not usable:
+            return None
+        start = next(self.rotation) % len(usable)
+        return min(usable[start:] + usable[:start], key=Replica.busy)
+
+    async def remember_write(self, subject: str | None):
+        """
+        The remember_write function sends the reads of a user to the primary for the next sticky seconds.
+
+        :param self: Represent the instance of the class
+        :param subject: str | None: The email of the user who writes
+        :return: None
+        :doc-author: Trelent
+        """
+        if not self.replicas or subject is None:
+            return
+        try:
+            await self.client.set(self.writer_key(subject), 1, px=int(self.sticky * 1000))
+        except RedisError as err:
+            log_redis_error(err)
+
+    async def wrote_recently(self, subject: str | None) -> bool:
+        if subject is None:
+            return False
+        try:
+            return bool(await self.client.exists(self.writer_key(subject)))
+        except RedisError as err:
+            log_redis_error(err)
+            return True
+
+    async def request_done(self, method: str, authorization: str | None):
+        """
+        The request_done function renews the writer marker once a write request is done, so the sticky
+        seconds count from the commit rather than from the start of the request.
+
+        :param self: Represent the instance of the class
+        :param method: str: The HTTP method of the request
+        :param authorization: str | None: The Authorization header of the request
+        :return: None
+        :doc-author: Trelent
+        """
+        if method not in READ_METHODS:
+            await self.remember_write(token_subject(authorization))
+
+    async def session_factory(self, method: str, authorization: str | None) -> async_sessionmaker | None:
+        """
+        The session_factory function decides where the database session of a request goes.
+            Requests other than GET and HEAD go to the primary and remember that the user wrote.
+
+        :param self: Represent the instance of the class
+        :param method: str: The HTTP method of the request
+        :param authorization: str | None: The Authorization header of the request
+        :return: The sessionmaker of a replica, or None for the primary
+        :doc-author: Trelent
+        """
+        if not self.replicas:
+            return None
+        subject = token_subject(authorization)
+        if method not in READ_METHODS:
+            await self.remember_write(subject)
+            return None
+        if await self.wrote_recently(subject):
+            self.reads['sticky'] += 1
+            return None
+        replica = self.choose()
+        if replica is None:
+            self.reads['fallback'] += 1
+            return None
+        self.reads['replica'] += 1
+        return replica.SessionLocal
+
+    async def check(self, replica: Replica):
+        """
+        The check function measures the lag of a replica; any error or a timeout marks it unhealthy.
+            A warning is logged when the replica becomes unhealthy, not on every failed check.
+
+        :param self: Represent the instance of the class
+        :param replica: Replica: The replica to check
+        :return: None
+        :doc-author: Trelent
+        """
+
+        async def measure() -> float:
+            async with replica.engine.connect() as conn:
+                return float(await conn.scalar(replica.lag_query) or 0)
+
+        was_healthy = replica.healthy or replica.checked_at is None
+        try:
+            replica.lag = await asyncio.wait_for(measure(), self.check_timeout)
+            replica.healthy, replica.error = True, None
+            if not was_healthy:
+                logger.info("Replica %s is healthy again", replica.name)
+        except Exception as err:
+            replica.healthy, replica.error = False, str(err) or type(err).__name__
+            # once per outage, not on every check
+            if was_healthy:
+                logger.warning("Replica %s is unhealthy: %s", replica.name, replica.error)
+        replica.checked_at = time.time()
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_all()
+
+    async def start(self):
+        """
+        The start function checks the replicas once, so they take reads from the first request on,
+        and then keeps checking them in the background. It warns when sticky is too short for read-your-writes.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        if not self.replicas:
+            return
+        if self.sticky <= self.max_lag + self.check_interval:
+            logger.warning("Replica sticky seconds (%s) do not exceed max lag plus check interval (%s): "
+                           "users may not read their own writes", self.sticky, self.max_lag + self.check_interval)
+        await self.check_all()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self) -> dict:
+        return {
+            "replicas": [{"name": replica.name, "healthy": replica.healthy, "lag": replica.lag,
+                          "usable": replica.usable(self.max_lag), "checked_at": replica.checked_at,
+                          "error": replica.error} for replica in self.replicas],
+            "max_lag": self.max_lag,
+            "reads": dict(self.reads),
+        }
@@ -1,14 +1,50 @@
-from datetime import datetime, timedelta
+import re
+from datetime import date, datetime, timedelta
+from typing import List
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, delete, and_, or_, case, tuple_, func, literal_column, table, column, \
+    text
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel, ContactFavoriteStatus
+from src.database.models import Contact, User, get_birth_day, search_document, search_vector
+from src.schemas import ContactModel, ContactFavoriteStatus, ContactBatchItem
+
+
+def filter_contacts(stmt, favorite: bool, first_name: str, last_name: str, email: str, user: User):
+    """
+    The filter_contacts function applies the filters of the contacts list to a select statement.
+        Contacts are always limited to the given user; favorite, first_name, last_name and email are only applied
+        when they are not None. Name and email filters are prefix matches.
+
+    :param stmt: Select: The statement to filter
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name prefix
+    :param last_name: str: Filter the contacts by last name prefix
+    :param email: str: Filter the contacts by email prefix
+    :param user: User: Get the user_id of the owner
+    :return: The filtered statement
+    :doc-author: Trelent
+    """
+    stmt = stmt.filter(Contact.user_id == user.id)
+    if favorite is not None:
+        stmt = stmt.filter(Contact.favorite == favorite)
+    if first_name is not None:
+        stmt = stmt.filter(Contact.first_name.like(f'{first_name}%'))
+    if last_name is not None:
+        stmt = stmt.filter(Contact.last_name.like(f'{last_name}%'))
+    if email is not None:
+        stmt = stmt.filter(Contact.email.like(f'{email}%'))
+    return stmt
+
+
+# The columns of ContactResponse in its field order, for reads that skip the ORM and return row tuples
+CONTACT_RESPONSE_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.birth_date,
+                            Contact.favorite, Contact.phone)
 
 
 async def get_contacts(limit: int, offset: int, favorite: bool, first_name: str, last_name: str, email: str
-                       , user: User, db: Session):
+                       , user: User, db: AsyncSession, columns: tuple | None = None):
     """
     The get_contacts function returns a list of contacts from the database.
         The function takes in limit, offset, favorite, first_name, last_name and email as parameters.
@@ -23,24 +59,154 @@ async def get_contacts(limit: int, offset: int, favorite: bool, first_name: str,
     :param last_name: str: Filter contacts by their last name
     :param email: str: Filter contacts by email
     :param user: User: Get the user_id from the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param columns: tuple | None: Select only these columns and return rows instead of Contact objects
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id)
-    if favorite is not None:
-        contacts = contacts.filter(Contact.favorite == favorite)
-    if first_name is not None:
-        contacts = contacts.filter(Contact.first_name.like(f'{first_name}%'))
-    if last_name is not None:
-        contacts = contacts.filter(Contact.last_name.like(f'{last_name}%'))
-    if email is not None:
-        contacts = contacts.filter(Contact.email.like(f'{email}%'))
-    contacts = contacts.limit(limit).offset(offset).all()
-    return contacts
+    stmt = filter_contacts(select(*columns) if columns else select(Contact), favorite, first_name, last_name, email,
+                           user)
+    contacts = await db.execute(stmt.limit(limit).offset(offset))
+    return contacts.all() if columns else contacts.scalars().all()
+
+
+CONTACT_SORT_KEY = (Contact.last_name, Contact.first_name, Contact.id)
+CONTACT_SORT_KEY_TYPES = (str, str, int)
+
+
+async def get_contacts_page(limit: int, after: tuple | None, favorite: bool, first_name: str, last_name: str,
+                            email: str, user: User, db: AsyncSession, columns: tuple | None = None):
+    """
+    The get_contacts_page function returns one page of contacts using keyset pagination.
+        Contacts are sorted by (last_name, first_name, id) and the page starts right after the sort key given in after,
+        so the database seeks straight to the page instead of scanning and discarding the skipped rows.
+        One extra row is fetched to find out whether there is a next page.
+
+    :param limit: int: Limit the number of contacts returned
+    :param after: tuple | None: The sort key of the last contact of the previous page, None for the first page
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name
+    :param last_name: str: Filter contacts by their last name
+    :param email: str: Filter contacts by email
+    :param user: User: Get the user_id from the database
+    :param db: AsyncSession: Pass the database session to the function
+    :param columns: tuple | None: Select only these columns, which must include the sort key, and return rows
+    :return: A list of contacts and the sort key to continue from, or None on the last page
+    :doc-author: Trelent
+    """
+    stmt = filter_contacts(select(*columns) if columns else select(Contact), favorite, first_name, last_name, email,
+                           user)
+    if after is not None:
+        stmt = stmt.filter(tuple_(*CONTACT_SORT_KEY) > tuple_(*after))
+    contacts = await db.execute(stmt.order_by(*CONTACT_SORT_KEY).limit(limit + 1))
+    contacts = contacts.all() if columns else contacts.scalars().all()
+    if len(contacts) <= limit:
+        return contacts, None
+    contacts = contacts[:limit]
+    if not contacts:
+        # a limit below 1 leaves no last contact to continue after
+        return contacts, None
+    last = contacts[-1]
+    return contacts, (last.last_name, last.first_name, last.id)
+
+
+def search_terms(q: str) -> List[str]:
+    """
+    The search_terms function splits a search query into lower case words, dropping punctuation and
+    full-text query syntax, e.g. 'Jo  Smi!' becomes ['jo', 'smi'].
+
+    :param q: str: The search query
+    :return: A list of words
+    :doc-author: Trelent
+    """
+    return re.findall(r'\w+', q.lower())
+
+
+def search_statement(q: str, terms: List[str], dialect: str):
+    """
+    The search_statement function builds the ranked search over the contacts of all users for the dialect.
+        On Postgres a contact matches when the full-text index finds every term as a word prefix, or when the
+        pg_trgm index finds the query as a similar word sequence, which tolerates typos; the rank is the better
+        of ts_rank and word_similarity. On SQLite the FTS5 table is queried for every term as a prefix and ranked
+        by bm25, without typo tolerance.
+
+    :param q: str: The search query
+    :param terms: List[str]: The words of the query
+    :param dialect: str: The name of the database dialect
+    :return: A select statement of contacts and the rank expression, higher is better
+    :doc-author: Trelent
+    """
+    if dialect == 'postgresql':
+        tsquery = func.to_tsquery(text("'simple'::regconfig"), ' & '.join(f'{term}:*' for term in terms))
+        rank = func.greatest(func.ts_rank(search_vector, tsquery), func.word_similarity(q, search_document))
+        stmt = select(Contact, rank).filter(or_(search_vector.op('@@')(tsquery), search_document.op('%>')(q)))
+        return stmt, rank
+    contacts_fts = table('contacts_fts', column('rowid'))
+    match = ' '.join(f'"{term}"*' for term in terms)
+    ranked = select(contacts_fts.c.rowid.label('id'), (-func.bm25(literal_column('contacts_fts'))).label('rank'))\
+        .filter(literal_column('contacts_fts').op('MATCH')(match)).subquery()
+    stmt = select(Contact, ranked.c.rank).join(ranked, ranked.c.id == Contact.id)
+    return stmt, ranked.c.rank
+
+
+async def search_contacts(q: str, limit: int, after: tuple | None, user: User, db: AsyncSession):
+    """
+    The search_contacts function finds the contacts of the user whose first name, last name, email or phone
+        match the query, best matches first, using keyset pagination over (rank, id).
+        One extra row is fetched to find out whether there is a next page.
+
+    :param q: str: The search query, e.g. 'jo smi'
+    :param limit: int: Limit the number of contacts returned
+    :param after: tuple | None: The (rank, id) of the last contact of the previous page, None for the first page
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of contacts and the key to continue from, or None on the last page
+    :doc-author: Trelent
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+    stmt, rank = search_statement(' '.join(terms), terms, db.get_bind().dialect.name)
+    stmt = stmt.filter(Contact.user_id == user.id)
+    if after is not None:
+        stmt = stmt.filter(or_(rank < after[0], and_(rank == after[0], Contact.id > after[1])))
+    rows = await db.execute(stmt.order_by(rank.desc(), Contact.id).limit(limit + 1))
+    rows = rows.all()
+    contacts = [contact for contact, _ in rows[:limit]]
+    if len(rows) <= limit:
+        return contacts, None
+    last, last_rank = rows[limit - 1]
+    return contacts, (last_rank, last.id)
+
+
+# the types of the (rank, id) key that search_contacts continues after
+SEARCH_KEY_TYPES = ((int, float), int)
+
+
+EXPORT_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.birth_date,
+                  Contact.favorite, Contact.phone)
+
+
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000):
+    """
+    The stream_contacts function reads all contacts of the user through a server-side cursor.
+        Rows are fetched from the database batch_size at a time and handed out as they arrive, so memory use
+        does not depend on the size of the address book. Only the exported columns are selected, as plain rows.
+
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: How many rows to fetch per round trip
+    :return: An async iterator of row batches, each a list of rows
+    :doc-author: Trelent
+    """
+    stmt = select(*EXPORT_COLUMNS).filter(Contact.user_id == user.id).order_by(Contact.id)\
+        .execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
 
 
-async def get_contact(contact_id: int, user: User, db: Session):
+async def get_contact(contact_id: int, user: User, db: AsyncSession):
     """
     The get_contact function takes in a contact_id and user, and returns the contact with that id.
         Args:
@@ -49,32 +215,100 @@ async def get_contact(contact_id: int, user: User, db: Session):
 
     :param contact_id: int: Filter the database query
     :param user: User: Get the user id from the token
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact object with the given id
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    return contact
+    stmt = select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
 
-async def create_contact(body: ContactModel, user: User, db: Session):
+async def create_contact(body: ContactModel, user: User, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database.
+        The row is inserted and read back with a single INSERT ... RETURNING statement.
 
     :param body: ContactModel: Get the data from the request body
     :param user: User: Get the user id from the jwt token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = Contact(**body.dict(), user_id=user.id)
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    stmt = insert(Contact).values(**body.dict(), birth_day=get_birth_day(body.birth_date), user_id=user.id)\
+        .returning(Contact)
+    contact = await db.execute(stmt)
+    contact = contact.scalars().first()
+    await db.commit()
     return contact
 
 
-async def update_contact(body: ContactModel, contact_id: int, user: User, db: Session):
+async def create_contacts(bodies: List[ContactModel], user: User, db: AsyncSession) -> List[int | None]:
+    """
+    The create_contacts function inserts many contacts with a single multi-row INSERT and commits them.
+        Rows whose email already exists for the user (the unique_contact_user constraint), either in the database
+        or earlier in the same list, are skipped with ON CONFLICT DO NOTHING instead of failing the whole insert.
+
+    :param bodies: List[ContactModel]: The validated contacts to insert
+    :param user: User: Get the user id from the jwt token
+    :param db: AsyncSession: Access the database
+    :return: The id of every inserted contact, in the order of bodies, and None for the skipped ones
+    :doc-author: Trelent
+    """
+    if not bodies:
+        return []
+    insert = postgresql.insert if db.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(Contact).on_conflict_do_nothing(index_elements=['email', 'user_id'])\
+        .returning(Contact.id, Contact.email)
+    values = [dict(body.dict(), birth_day=get_birth_day(body.birth_date), user_id=user.id) for body in bodies]
+    inserted = await db.execute(stmt, values)
+    ids = {}
+    for contact_id, email in inserted:
+        ids[email] = contact_id
+    await db.commit()
+    result = []
+    for body in bodies:
+        result.append(ids.pop(body.email, None))
+    return result
+
+
+def filter_contact(contact_id: int, user: User, versions: List[int] | None):
+    """
+    The filter_contact function builds the WHERE clause of a write of one contact. With versions the write
+    only applies while the contact still has one of them, which makes an If-Match check and the write atomic.
+
+    :param contact_id: int: The id of the contact
+    :param user: User: The owner of the contact
+    :param versions: List[int] | None: The accepted row versions, None for any
+    :return: The condition
+    :doc-author: Trelent
+    """
+    condition = and_(Contact.id == contact_id, Contact.user_id == user.id)
+    if versions is not None:
+        condition = and_(condition, Contact.version.in_(versions))
+    return condition
+
+
+async def execute_returning(stmt, db: AsyncSession):
+    """
+    The execute_returning function runs an UPDATE or DELETE ... RETURNING statement of a single contact and commits.
+        The statement both finds and changes the row, so a write takes one round trip besides the commit
+        instead of a SELECT of the contact followed by the write.
+
+    :param stmt: The UPDATE or DELETE statement, filtered by contact id and user id
+    :param db: AsyncSession: Access the database
+    :return: The contact as it is after the update or before the delete, or None if it was not found
+    :doc-author: Trelent
+    """
+    contact = await db.execute(stmt)
+    contact = contact.scalars().first()
+    if contact is not None:
+        await db.commit()
+    return contact
+
+
+async def update_contact(body: ContactModel, contact_id: int, user: User, db: AsyncSession,
+                         versions: List[int] | None = None):
     """
     The update_contact function updates a contact in the database.
         Args:
@@ -85,23 +319,19 @@ async def update_contact(body: ContactModel, contact_id: int, user: User, db: Se
     :param body: ContactModel: Get the contact information from the request body
     :param contact_id: int: Identify the contact to be deleted
     :param user: User: Get the user id from the token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param versions: List[int] | None: Only update the contact if it has one of these versions
     :return: The updated contact
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.birth_date = body.birth_date
-        contact.favorite = body.favorite
-        contact.phone = body.phone
-        db.commit()
-    return contact
+    stmt = update(Contact).filter(filter_contact(contact_id, user, versions))\
+        .values(**body.dict(), birth_day=get_birth_day(body.birth_date), version=Contact.version + 1)\
+        .returning(Contact)
+    return await execute_returning(stmt, db)
 
 
-async def update_favorite_contact(body: ContactFavoriteStatus, contact_id: int, user: User, db: Session):
+async def update_favorite_contact(body: ContactFavoriteStatus, contact_id: int, user: User, db: AsyncSession,
+                                  versions: List[int] | None = None):
     """
     The update_favorite_contact function updates the favorite status of a contact.
         Args:
@@ -112,18 +342,17 @@ async def update_favorite_contact(body: ContactFavoriteStatus, contact_id: int,
     :param body: ContactFavoriteStatus: Pass the data to the function
     :param contact_id: int: Identify the contact that is being updated
     :param user: User: Get the user id from the token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param versions: List[int] | None: Only update the contact if it has one of these versions
     :return: The contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        contact.favorite = body.favorite
-        db.commit()
-    return contact
+    stmt = update(Contact).filter(filter_contact(contact_id, user, versions))\
+        .values(favorite=body.favorite, version=Contact.version + 1).returning(Contact)
+    return await execute_returning(stmt, db)
 
 
-async def remove_contact(contact_id: int, user: User, db: Session):
+async def remove_contact(contact_id: int, user: User, db: AsyncSession, versions: List[int] | None = None):
     """
     The remove_contact function removes a contact from the database.
         Args:
@@ -133,33 +362,105 @@ async def remove_contact(contact_id: int, user: User, db: Session):
 
     :param contact_id: int: Identify the contact to be removed
     :param user: User: Get the user from the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param versions: List[int] | None: Only remove the contact if it has one of these versions
     :return: The contact that was removed
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        db.delete(contact)
-        db.commit()
-    return contact
+    stmt = delete(Contact).filter(filter_contact(contact_id, user, versions)).returning(Contact)
+    return await execute_returning(stmt, db)
 
 
-async def get_birthday_contacts(user: User, db: Session):
+async def execute_batch(stmt, db: AsyncSession) -> set:
     """
-    The get_birthday_contacts function returns a list of contacts whose birthdays are within the next 7 days.
-        The function takes in two parameters: user and db. User is an object that contains information about the current
-        user, such as their id, email address, hashed password etc. Db is a Session object that allows us to query our
-        database for data.
+    The execute_batch function runs an UPDATE or DELETE ... RETURNING id statement over many contacts and commits.
 
+    :param stmt: The UPDATE or DELETE statement, filtered by user id and a list of contact ids
+    :param db: AsyncSession: Access the database
+    :return: The ids of the contacts that were found and changed
+    :doc-author: Trelent
+    """
+    found = await db.execute(stmt.returning(Contact.id).execution_options(synchronize_session=False))
+    found = set(found.scalars().all())
+    if found:
+        await db.commit()
+    return found
+
+
+async def update_favorite_contacts(ids: List[int], favorite: bool, user: User, db: AsyncSession) -> set:
+    """
+    The update_favorite_contacts function sets the favorite status of many contacts of the user with one UPDATE.
+
+    :param ids: List[int]: The ids of the contacts
+    :param favorite: bool: The new favorite status
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Access the database
+    :return: The ids of the contacts that were found
+    :doc-author: Trelent
+    """
+    stmt = update(Contact).filter(and_(Contact.user_id == user.id, Contact.id.in_(ids)))\
+        .values(favorite=favorite, version=Contact.version + 1)
+    return await execute_batch(stmt, db)
+
+
+async def update_contacts(bodies: List[ContactBatchItem], user: User, db: AsyncSession) -> set:
+    """
+    The update_contacts function replaces many contacts of the user with one UPDATE.
+        Every column is set with a CASE on the contact id, so each contact gets its own values
+        in a single statement on both Postgres and SQLite.
+
+    :param bodies: List[ContactBatchItem]: The new contacts, each with the id of the contact to replace
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Access the database
+    :return: The ids of the contacts that were found
+    :doc-author: Trelent
+    """
+    rows = {body.id: dict(body.dict(exclude={'id'}), birth_day=get_birth_day(body.birth_date)) for body in bodies}
+    columns = next(iter(rows.values())).keys()
+    values = {name: case({contact_id: row[name] for contact_id, row in rows.items()}, value=Contact.id)
+              for name in columns}
+    stmt = update(Contact).filter(and_(Contact.user_id == user.id, Contact.id.in_(rows)))\
+        .values(**values, version=Contact.version + 1)
+    return await execute_batch(stmt, db)
+
+
+async def remove_contacts(ids: List[int], user: User, db: AsyncSession) -> set:
+    """
+    The remove_contacts function deletes many contacts of the user with one DELETE.
+
+    :param ids: List[int]: The ids of the contacts
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Access the database
+    :return: The ids of the contacts that were found
+    :doc-author: Trelent
+    """
+    stmt = delete(Contact).filter(and_(Contact.user_id == user.id, Contact.id.in_(ids)))
+    return await execute_batch(stmt, db)
+
+
+async def get_birthday_contacts(days: int, user: User, db: AsyncSession, today: date | None = None):
+    """
+    The get_birthday_contacts function returns a list of contacts whose birthdays are within the next days days.
+        The lookup uses the indexed birth_day column (MMDD) instead of formatting every birth date, and a window
+        that runs past 31 December continues from 1 January. Contacts are sorted by the next occurrence of their
+        birthday, starting from today.
+
+    :param days: int: How many days ahead to look, today included
     :param user: User: Get the user id from the database
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param today: date | None: The first day of the window, defaults to the current date
     :return: A list of contacts
     :doc-author: Trelent
     """
-    today = datetime.now().date()
-    last_day = today + timedelta(7)
-    contacts = db.query(Contact).filter(Contact.user_id == user.id)\
-        .where(func.to_char(Contact.birth_date, 'MM-DD').between(datetime.strftime(today, "%m-%d"),
-                                                                 datetime.strftime(last_day, "%m-%d"))).all()
-    return contacts
-
+    today = today or datetime.now().date()
+    first_day = get_birth_day(today)
+    last_day = get_birth_day(today + timedelta(days))
+    stmt = select(Contact).filter(Contact.user_id == user.id)
+    if days < 365:
+        if first_day <= last_day:
+            stmt = stmt.where(Contact.birth_day.between(first_day, last_day))
+        else:
+            stmt = stmt.where(or_(Contact.birth_day >= first_day, Contact.birth_day <= last_day))
+    next_year = case((Contact.birth_day < first_day, 1), else_=0)
+    contacts = await db.execute(stmt.order_by(next_year, Contact.birth_day, Contact.id))
+    return contacts.scalars().all()
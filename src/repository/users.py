@@ -1,81 +1,116 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.database.models import User
 from src.schemas import UserModel
 
 
-async def get_user_by_email(email: str, db: Session) -> User:
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists,
     it will return None.
 
     :param email: str: Pass in the email address of the user we want to retrieve
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    user = await db.execute(select(User).filter(User.email == email))
+    return user.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
 
     :param body: UserModel: Create a new user object
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The new user object
     :doc-author: Trelent
     """
     new_user = User(**body.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def write_user(user: User, db: AsyncSession, **values) -> None:
+    """
+    The write_user function stores a change of the fields that /users/me returns and bumps the user version,
+    which is the ETag of /users/me. The version is incremented in the same UPDATE and read back with RETURNING,
+    so concurrent writes of one user each get a version of their own. Callers drop the user from the auth caches.
+
+    :param user: User: The user to change
+    :param db: AsyncSession: Pass the database session to the function
+    :param values: The new values of the changed columns
+    :return: None
+    :doc-author: Trelent
+    """
+    stmt = update(User).filter(User.id == user.id).values(**values, version=User.version + 1)\
+        .returning(User.version).execution_options(synchronize_session=False)
+    version = (await db.execute(stmt)).scalar_one()
+    await db.commit()
+    for key, value in dict(values, version=version).items():
+        set_committed_value(user, key, value)
+
+
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Identify the user that is being updated
     :param token: str | None: Specify the type of the token parameter
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None, but it updates the user's refresh token in the database
     :doc-author: Trelent
     """
+    # the refresh token is not part of /users/me, so the version stays
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+
+
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    The update_password function replaces the password hash of a user, e.g. after a rehash with a new bcrypt cost.
+
+    :param user: User: Identify the user that is being updated
+    :param password: str: The new password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: Trelent
+    """
+    await write_user(user, db, password=password)
 
 
-async def confirmed_email(email: str, db: Session) -> User:
+async def confirmed_email(email: str, db: AsyncSession) -> User:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
 
 
     :param email: str: Pass in the email address of the user that is trying to confirm their account
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+    await write_user(user, db, confirmed=True)
     return user
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: Find the user in the database
     :param url: str: Specify that the url parameter is a string
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: A user object, which is the same as what we get from the get_user_by_email function
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
-    user.avatar = url
-    db.commit()
+    await write_user(user, db, avatar=url)
     return user
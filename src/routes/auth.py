@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_primary_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
@@ -13,7 +13,7 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes in a UserModel object, which is validated by pydantic.
@@ -24,28 +24,29 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     :param body: UserModel: Get the user data from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base_url of the server
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the user and a detail message
     :doc-author: Trelent
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
     background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
     return {"user": new_user, "detail": "User successfully created"}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
         It takes the username and password from the request body,
         verifies them against the database, and returns an access token if successful.
+        A password hash made with an outdated bcrypt cost is replaced by a hash with the configured cost.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dict with the access_token, refresh_token and token type
     :doc-author: Trelent
     """
@@ -54,8 +55,12 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
+        await auth_service.forget_user(user.email)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
@@ -64,7 +69,8 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security),
+                        db: AsyncSession = Depends(get_primary_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
@@ -72,7 +78,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
         or creating tokens then an HTTPException will be raised.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the headers
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get a session of the primary database, the stored refresh token must not be stale
     :return: A dict with the access_token, refresh_token and token_type
     :doc-author: Trelent
     """
@@ -90,7 +96,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_primary_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
         It takes the token from the URL and uses it to get the user's email address.
@@ -100,7 +106,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
             confirmed_email function which sets the 'confirmed' field of that particular record to True
 
     :param token: str: Get the token from the url
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the primary database, this GET route writes
     :return: A dict with a message
     :doc-author: Trelent
     """
@@ -111,12 +117,13 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     await repository_users.confirmed_email(email, db)
+    await auth_service.forget_user(email)
     return {"message": "Email confirmed"}
 
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that they can click on
     to confirm their email address. The function takes in a RequestEmail object, which contains the
@@ -127,7 +134,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :param body: RequestEmail: Validate the request body
     :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the request
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message to the user
     :doc-author: Trelent
     """
@@ -1,7 +1,7 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
@@ -13,19 +13,23 @@ router = APIRouter(prefix='/birthdays', tags=['birthdays'])
 
 
 @router.get("/", response_model=List[ContactResponse])
-async def get_birthday_contacts(current_user: User = Depends(auth_service.get_current_user),
-                                db: Session = Depends(get_db)):
+async def get_birthday_contacts(days: int = Query(7, ge=0, le=365),
+                                current_user: User = Depends(auth_service.get_current_user),
+                                db: AsyncSession = Depends(get_db)):
     """
-    The get_birthday_contacts function returns a list of contacts that have birthdays in the current month.
-        The function takes two parameters:
+    The get_birthday_contacts function returns a list of contacts that have birthdays in the next days days,
+    sorted by the next occurrence of the birthday. The window continues into January at the end of the year.
+        The function takes these parameters:
+            - days: How many days ahead to look, 7 by default.
             - current_user: A User object representing the currently logged-in user. This is passed by default to all
                             endpoints, and is used to determine which contacts belong to this user. It's also used for
                             authorization purposes (i.e., only users with an admin role can access certain endpoints).
 
+    :param days: int: How many days ahead to look
     :param current_user: User: Get the current user from the auth_service
-    :param db: Session: Get the database session
-    :return: A list of contacts with birthdays today
+    :param db: AsyncSession: Get the database session
+    :return: A list of contacts with upcoming birthdays
     :doc-author: Trelent
     """
-    contacts = await repository_contact.get_birthday_contacts(current_user, db)
+    contacts = await repository_contact.get_birthday_contacts(days, current_user, db)
     return contacts
@@ -1,147 +1,390 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
-from src.schemas import ContactResponse, ContactFavoriteStatus, ContactModel
+from src.database.replicas import is_replica_session
+from src.schemas import ContactResponse, ContactFavoriteStatus, ContactModel, ContactImportResponse, \
+    ContactBatchIds, ContactBatchFavorite, ContactBatchUpdate, ContactBatchResponse
 from src.repository import contacts as repository_contact
 from src.services.auth import auth_service
+from src.services.rate_limit import RateLimit
+from src.services.pagination import encode_cursor, decode_cursor
+from src.services.responses import FastJSONResponse
+from src.services.etag import contact_etag, contacts_etag, etag_matches, if_match_versions, not_modified
+from src.services import importer, exporter, cache
+from src.conf.config import settings
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 
 
 @router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contacts(limit: int = Query(10, le=1000), offset: int = 0, favorite: bool = None, first_name: str = None,
-                       last_name: str = None, email: str = None,
-                       current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+            dependencies=[Depends(RateLimit('contacts:list'))])
+async def get_contacts(response: Response, limit: int = Query(10, ge=1, le=1000), offset: int = 0, cursor: str = None,
+                       favorite: bool = None, first_name: str = None, last_name: str = None, email: str = None,
+                       if_none_match: str = Header(None),
+                       current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The get_contacts function returns a list of contacts.
+        Without cursor the list is paged with limit and offset. With cursor (pass an empty cursor for the first page)
+        contacts are sorted by last name, first name and id and paged by keyset; the cursor of the next page
+        is returned in the X-Next-Cursor header, which is absent on the last page.
+        The ETag changes with every write of the user's contacts; when If-None-Match still matches it,
+        304 Not Modified is returned without touching the database.
+        With settings.contacts_fast_json the contacts are read as row tuples and encoded straight to JSON
+        with orjson, skipping the ORM objects and the response model; the JSON is the same.
 
+    :param response: Response: Set the X-Next-Cursor header
     :param limit: int: Limit the number of contacts returned
     :param le: Specify the maximum value of a parameter
     :param offset: int: Skip the first n contacts
+    :param cursor: str: Continue after the page that returned this X-Next-Cursor value
     :param favorite: bool: Filter the contacts by favorite
     :param first_name: str: Filter the contacts by first name
     :param last_name: str: Filter the contacts by last name
     :param email: str: Filter the contacts by email
+    :param if_none_match: str: The ETag of the client's copy
     :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await repository_contact.get_contacts(limit, offset, favorite, first_name, last_name, email,
-                                                     current_user, db)
+    version = await cache.contacts_cache.version(current_user.id)
+    etag = contacts_etag(current_user.id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if etag is not None and not is_replica_session(db):
+        # a replica body may predate the version, so only primary reads carry the list ETag
+        response.headers["ETag"] = etag
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor, repository_contact.CONTACT_SORT_KEY_TYPES) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        get_page = cache.get_contacts_page_json if settings.contacts_fast_json else cache.get_contacts_page
+        contacts, next_key = await get_page(limit, after, favorite, first_name, last_name, email, current_user, db,
+                                            version)
+        if next_key is not None:
+            response.headers["X-Next-Cursor"] = encode_cursor(next_key)
+    else:
+        get_list = cache.get_contacts_json if settings.contacts_fast_json else cache.get_contacts
+        contacts = await get_list(limit, offset, favorite, first_name, last_name, email, current_user, db, version)
+    if settings.contacts_fast_json:
+        # the body is final already, and returning a response skips the validation against response_model
+        return FastJSONResponse(contacts, headers=dict(response.headers))
     return contacts
 
 
+@router.get("/search", response_model=List[ContactResponse], description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimit('contacts:search'))])
+async def search_contacts(response: Response, q: str = Query(min_length=1, max_length=100),
+                          limit: int = Query(10, ge=1, le=100), cursor: str = '',
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The search_contacts function finds contacts by words of their name, email or phone, e.g. q=jo smi.
+        Every word may be a prefix; on Postgres small typos are tolerated too. The best matches come first and
+        the cursor of the next page is returned in the X-Next-Cursor header, which is absent on the last page.
+
+    :param response: Response: Set the X-Next-Cursor header
+    :param q: str: The search query
+    :param limit: int: Limit the number of contacts returned
+    :param cursor: str: Continue after the page that returned this X-Next-Cursor value
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: A list of contacts
+    :doc-author: Trelent
+    """
+    try:
+        after = decode_cursor(cursor, repository_contact.SEARCH_KEY_TYPES) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    contacts, next_key = await repository_contact.search_contacts(q, limit, after, current_user, db)
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_key)
+    return contacts
+
+
+@router.get("/export", response_class=StreamingResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimit('contacts:export'))])
+async def export_contacts(format: str = Query('ndjson', regex='^(ndjson|csv)$'),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The export_contacts function streams all contacts of the current user as NDJSON or CSV.
+        Contacts are read through a server-side cursor and written out batch by batch, so memory stays flat
+        however large the address book is and the first bytes go out before the query has finished.
+
+    :param format: str: ndjson or csv
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: A streaming response with the contacts
+    :doc-author: Trelent
+    """
+    batches = repository_contact.stream_contacts(current_user, db)
+    return StreamingResponse(exporter.export_contacts(batches, format), media_type=exporter.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'})
+
+
 @router.get("/{contact_id}", response_model=ContactResponse, description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contact(contact_id: int = Path(1, ge=1), current_user: User = Depends(auth_service.get_current_user),
-                      db: Session = Depends(get_db)):
+            dependencies=[Depends(RateLimit('contacts:get'))])
+async def get_contact(response: Response, contact_id: int = Path(1, ge=1), if_none_match: str = Header(None),
+                      current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The get_contact function returns a contact by its id.
         If the user is not logged in, an error will be returned.
         If the contact does not exist, an error will be returned.
+        The ETag is the row version of the contact; when If-None-Match still matches it, 304 Not Modified
+        is returned before the contact is serialized, and without a query when the contact is cached.
 
+    :param response: Response: Set the ETag header
     :param contact_id: int: Get the contact_id from the url path
     :param ge: Specify the minimum value of the parameter
+    :param if_none_match: str: The ETag of the client's copy
     :param current_user: User: Get the current user from the database
-    :param db: Session: Create a database session
+    :param db: AsyncSession: Create a database session
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = await repository_contact.get_contact(contact_id, current_user, db)
+    contact = await cache.get_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    etag = contact_etag(contact)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if etag is not None:
+        response.headers["ETag"] = etag
     return contact
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED, description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+            dependencies=[Depends(RateLimit('contacts:create'))])
 async def create_contact(body: ContactModel, current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+                         db: AsyncSession = Depends(get_db)):
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Get the data from the request body
     :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A contactmodel object
     :doc-author: Trelent
     """
     contact = await repository_contact.create_contact(body, current_user, db)
+    await cache.contacts_cache.invalidate(current_user.id)
     return contact
 
 
-@router.put("/{contact_id}", response_model=ContactResponse, description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def update_contact(body: ContactModel, contact_id: int = Path(1, ge=1),
-                         current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+@router.post("/bulk", response_model=ContactImportResponse, description='No more than 10 requests per minute',
+             dependencies=[Depends(RateLimit('contacts:import'))])
+async def import_contacts(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The import_contacts function creates many contacts from one request body.
+        The body is a JSON array (application/json), newline-delimited JSON (application/x-ndjson) or CSV with
+        a header row (text/csv). It is read as a stream: rows are validated against ContactModel as they arrive and
+        inserted in batches, so large address books never have to fit in memory. Invalid rows and emails that
+        already exist are reported per row and do not stop the import.
+
+    :param request: Request: Read the request body as a stream
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The number of created and failed rows and the errors per row
+    :doc-author: Trelent
+    """
+    parser = importer.get_parser(request.headers.get('content-type'))
+    if parser is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Expected application/json, application/x-ndjson or text/csv")
+    result = await importer.import_contacts(parser(request.stream()), current_user, db,
+                                            settings.contacts_import_batch_size)
+    if result['created']:
+        await cache.contacts_cache.invalidate(current_user.id)
+    return result
+
+
+def batch_results(ids: List[int], found: set, done: str) -> dict:
+    """
+    The batch_results function reports the outcome of a batch operation for every requested id, in request order.
+
+    :param ids: List[int]: The requested ids
+    :param found: set: The ids that were found and changed
+    :param done: str: The status of a changed contact, e.g. updated
+    :return: A dictionary with the result of every id
+    :doc-author: Trelent
+    """
+    return {"results": [{"id": contact_id, "status": done if contact_id in found else "not_found"}
+                        for contact_id in dict.fromkeys(ids)]}
+
+
+@router.patch("/batch/favorite", response_model=ContactBatchResponse, description='No more than 10 requests per minute',
+              dependencies=[Depends(RateLimit('contacts:batch_favorite'))])
+async def update_favorite_contacts(body: ContactBatchFavorite,
+                                   current_user: User = Depends(auth_service.get_current_user),
+                                   db: AsyncSession = Depends(get_db)):
+    """
+    The update_favorite_contacts function sets the favorite status of up to 1000 contacts in one request.
+
+    :param body: ContactBatchFavorite: The ids of the contacts and the new favorite status
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The status of every id: updated or not_found
+    :doc-author: Trelent
+    """
+    found = await repository_contact.update_favorite_contacts(body.ids, body.favorite, current_user, db)
+    if found:
+        await cache.contacts_cache.invalidate(current_user.id)
+    return batch_results(body.ids, found, "updated")
+
+
+@router.put("/batch", response_model=ContactBatchResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimit('contacts:batch_update'))])
+async def update_contacts(body: ContactBatchUpdate, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The update_contacts function replaces up to 1000 contacts in one request.
+        If the new emails collide with other contacts of the user nothing is changed and 409 is returned.
+
+    :param body: ContactBatchUpdate: The new contacts, each with its id
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The status of every id: updated or not_found
+    :doc-author: Trelent
+    """
+    try:
+        found = await repository_contact.update_contacts(body.contacts, current_user, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this email already exists")
+    if found:
+        await cache.contacts_cache.invalidate(current_user.id)
+    return batch_results([contact.id for contact in body.contacts], found, "updated")
+
+
+@router.post("/batch/delete", response_model=ContactBatchResponse, description='No more than 10 requests per minute',
+             dependencies=[Depends(RateLimit('contacts:batch_delete'))])
+async def remove_contacts(body: ContactBatchIds, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The remove_contacts function deletes up to 1000 contacts in one request.
+
+    :param body: ContactBatchIds: The ids of the contacts
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The status of every id: deleted or not_found
+    :doc-author: Trelent
+    """
+    found = await repository_contact.remove_contacts(body.ids, current_user, db)
+    if found:
+        await cache.contacts_cache.invalidate(current_user.id)
+    return batch_results(body.ids, found, "deleted")
+
+
+async def raise_missing(contact_id: int, versions: List[int] | None, user: User, db: AsyncSession):
+    """
+    The raise_missing function explains why a conditional write of a contact changed nothing:
+    412 when the contact exists but If-Match did not match its version, 404 when there is no such contact.
+
+    :param contact_id: int: The id of the contact
+    :param versions: List[int] | None: The versions accepted by If-Match, None without a precondition
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Access the database
+    :return: Never returns
+    :doc-author: Trelent
+    """
+    if versions is not None and await repository_contact.get_contact(contact_id, user, db) is not None:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Precondition Failed")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+@router.put("/{contact_id}",response_model=ContactResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimit('contacts:update'))])
+async def update_contact(body: ContactModel, response: Response, contact_id: int = Path(1, ge=1),
+                         if_match: str = Header(None),
+                         current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The update_contact function updates a contact in the database.
         The function takes an id, and a body containing the updated information for that contact.
         It then checks if there is already a user with that id, and if so it updates their information to match what was passed in the body.
+        With If-Match the contact is only updated if its ETag still matches, otherwise 412 Precondition Failed
+        is returned, so concurrent edits do not overwrite each other.
 
     :param body: ContactModel: Get the data from the request body
+    :param response: Response: Set the ETag header
     :param contact_id: int: Identify the contact to be deleted
     :param ge: Set a minimum value for the path parameter
+    :param if_match: str: The ETag the client's edit is based on
     :param current_user: User: Get the user who is making the request
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A contactmodel object
     :doc-author: Trelent
     """
-    contact = await repository_contact.update_contact(body, contact_id, current_user, db)
+    versions = if_match_versions(if_match, contact_id)
+    contact = await repository_contact.update_contact(body, contact_id, current_user, db, versions)
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        await raise_missing(contact_id, versions, current_user, db)
+    await cache.contacts_cache.invalidate(current_user.id)
+    response.headers["ETag"] = contact_etag(contact)
     return contact
 
 
 @router.patch("/{contact_id}", response_model=ContactResponse, description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def update_contact(body: ContactFavoriteStatus, contact_id: int = Path(1, ge=1),
-                         current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+            dependencies=[Depends(RateLimit('contacts:favorite'))])
+async def update_contact(body: ContactFavoriteStatus, response: Response, contact_id: int = Path(1, ge=1),
+                         if_match: str = Header(None),
+                         current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The update_contact function updates the favorite status of a contact.
         The function takes in a ContactFavoriteStatus object, which contains the new favorite status of the contact.
         It also takes in an integer representing the id of the contact to be updated and a User object representing
-        who is making this request (the current user). Finally, it takes in an SQLAlchemy Session object that will be used
-        to make changes to our database.
+        who is making this request (the current user). Finally, it takes in an SQLAlchemy AsyncSession object that will be used
+        to make changes to our database. If-Match works as in the PUT route.
 
     :param body: ContactFavoriteStatus: Pass the data that is sent in the request body
+    :param response: Response: Set the ETag header
     :param contact_id: int: Specify the id of the contact to be updated
     :param ge: Specify that the path parameter must be greater than or equal to 1
+    :param if_match: str: The ETag the client's edit is based on
     :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The updated contact
     :doc-author: Trelent
     """
-    contact = await repository_contact.update_favorite_contact(body, contact_id, current_user, db)
+    versions = if_match_versions(if_match, contact_id)
+    contact = await repository_contact.update_favorite_contact(body, contact_id, current_user, db, versions)
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        await raise_missing(contact_id, versions, current_user, db)
+    await cache.contacts_cache.invalidate(current_user.id)
+    response.headers["ETag"] = contact_etag(contact)
     return contact
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT, description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def remove_contact(contact_id: int = Path(1, ge=1), current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+            dependencies=[Depends(RateLimit('contacts:delete'))])
+async def remove_contact(contact_id: int = Path(1, ge=1), if_match: str = Header(None),
+                         current_user: User = Depends(auth_service.get_current_user),
+                         db: AsyncSession = Depends(get_db)):
     """
     The remove_contact function removes a contact from the database.
         The function takes in an integer representing the id of the contact to be removed,
         and returns a dictionary containing information about that contact.
+        If-Match works as in the PUT route.
 
     :param contact_id: int: Specify the id of the contact to be removed
     :param ge: Check if the contact_id is greater than or equal to 1
+    :param if_match: str: The ETag the client's delete is based on
     :param current_user: User: Get the current user from the auth_service
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = await repository_contact.remove_contact(contact_id, current_user, db)
+    versions = if_match_versions(if_match, contact_id)
+    contact = await repository_contact.remove_contact(contact_id, current_user, db, versions)
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        await raise_missing(contact_id, versions, current_user, db)
+    await cache.contacts_cache.invalidate(current_user.id)
     return contact
@@ -1,53 +1,60 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Header, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.conf.config import settings
+from src.services.avatars import avatar_storage, save_avatar, AvatarTooLarge, InvalidImage
+from src.services.etag import etag_matches, not_modified, user_etag
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(response: Response, if_none_match: str = Header(None),
+                        current_user: User = Depends(auth_service.get_current_user)):
     """
     The read_users_me function is a GET endpoint that returns the current user's information.
+        The ETag changes when the avatar does; when If-None-Match still matches it, 304 Not Modified is returned.
 
+    :param response: Response: Set the ETag header
+    :param if_none_match: str: The ETag of the client's copy
     :param current_user: User: Get the current user
     :return: The current user
     :doc-author: Trelent
     """
+    etag = user_etag(current_user)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return current_user
 
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function is used to update the avatar of a user.
         The function takes in an UploadFile object, which is a file that has been uploaded by the client.
         It also takes in the current_user and db objects as dependencies.
+        The image is read with a size cap, cropped to a square avatar off the event loop and written to the configured
+        avatar storage (Cloudinary or a local directory). A request whose Content-Length is already too large
+        is refused by ContentLengthLimitMiddleware before the form is read.
 
     :param file: UploadFile: Get the file from the request
     :param current_user: User: Get the current user from the database
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: The user object
     :doc-author: Trelent
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill')
+    try:
+        src_url = await save_avatar(file, str(current_user.id), avatar_storage)
+    except AvatarTooLarge as err:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(err))
+    except InvalidImage as err:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(err))
     user = await repository_users.update_avatar(current_user.email, src_url, db)
+    await auth_service.forget_user(current_user.email)
     return user
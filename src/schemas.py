@@ -1,6 +1,6 @@
 from datetime import date, datetime
-from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, EmailStr, validator
 
 
 class ContactModel(BaseModel):
@@ -29,6 +29,48 @@ class ContactResponse(BaseModel):
         orm_mode = True
 
 
+class ContactImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class ContactImportResponse(BaseModel):
+    created: int
+    failed: int
+    errors: List[ContactImportError]
+
+
+class ContactBatchIds(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=1000)
+
+
+class ContactBatchFavorite(ContactBatchIds):
+    favorite: bool
+
+
+class ContactBatchItem(ContactModel):
+    id: int
+
+
+class ContactBatchUpdate(BaseModel):
+    contacts: List[ContactBatchItem] = Field(min_items=1, max_items=1000)
+
+    @validator('contacts')
+    def unique_ids(cls, contacts):
+        if len({contact.id for contact in contacts}) != len(contacts):
+            raise ValueError('every id may appear only once')
+        return contacts
+
+
+class ContactBatchResult(BaseModel):
+    id: int
+    status: str
+
+
+class ContactBatchResponse(BaseModel):
+    results: List[ContactBatchResult]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: str
@@ -58,3 +100,76 @@ class TokenModel(BaseModel):
 
 class RequestEmail(BaseModel):
     email: EmailStr
+
+
+class PoolStatusResponse(BaseModel):
+    pool: str
+    size: Optional[int] = None
+    checked_out: Optional[int] = None
+    idle: Optional[int] = None
+    overflow: Optional[int] = None
+    max_overflow: Optional[int] = None
+    checkouts: Optional[int] = None
+    timeouts: Optional[int] = None
+    wait_avg_ms: Optional[float] = None
+    wait_max_ms: Optional[float] = None
+
+
+class CacheStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    errors: int
+
+
+class RedisCommandStats(BaseModel):
+    calls: int
+    errors: int
+    total_ms: float
+    max_ms: float
+    avg_ms: float
+
+
+class RedisStatusResponse(BaseModel):
+    max_connections: int
+    connections: int
+    in_use: int
+    idle: int
+    commands: Dict[str, RedisCommandStats]
+
+
+class MailStatusResponse(BaseModel):
+    queued: int
+    sent: int
+    retried: int
+    failed: int
+    batches: int
+    connections: int
+    send_avg_ms: float
+    send_max_ms: float
+    queue_size: int
+    waiting_retry: int
+    workers: int
+
+
+class RateLimitStatusResponse(BaseModel):
+    allowed: int
+    denied: int
+    local: int
+    redis_calls: int
+    errors: int
+    redis_avg_ms: float
+
+
+class ReplicaStatus(BaseModel):
+    name: str
+    healthy: bool
+    lag: Optional[float] = None
+    usable: bool
+    checked_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ReplicaStatusResponse(BaseModel):
+    replicas: List[ReplicaStatus]
+    max_lag: float
+    reads: Dict[str, int]
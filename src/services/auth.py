@@ -1,27 +1,58 @@
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
-import pickle
-import redis
+from redis.exceptions import RedisError
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
+from src.database.models import User
+from src.database.replicas import is_replica_session
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.lru import LRUCache
+from src.services.redis_client import RedisErrorLog
+
+log_redis_error = RedisErrorLog(logging.getLogger(__name__))
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # hashes made with any other cost than bcrypt_rounds need an update, so they are rehashed on the next login
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=settings.bcrypt_rounds,
+                               bcrypt__min_rounds=settings.bcrypt_rounds, bcrypt__max_rounds=settings.bcrypt_rounds)
+    hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host='localhost', port=6379, db=0)
+    r = None  # the shared Redis client, set on startup, see main.py
+    user_cache = LRUCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+    token_cache = LRUCache(maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl)
+    USER_FIELDS = ('id', 'username', 'email', 'avatar', 'confirmed', 'version')
+
+    async def run_in_pool(self, func, *args):
+        """
+        The run_in_pool function runs a CPU bound password function in the bounded hash_executor, so that bcrypt
+        does not block the event loop. bcrypt releases the GIL, so up to password_hash_workers hashes run in parallel
+        and further calls wait in the executor queue.
+
+        :param self: Represent the instance of the class
+        :param func: The function to run
+        :param *args: The arguments of the function
+        :return: The result of the function
+        :doc-author: Trelent
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.hash_executor, func, *args)
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
@@ -33,9 +64,66 @@ class Auth:
         :return: A boolean value
         :doc-author: Trelent
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self.run_in_pool(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+        """
+        The verify_and_update_password function verifies the password like verify_password and, when the stored
+        hash was made with another bcrypt cost than the configured one, also returns a new hash of the password.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Store the password that is entered by the user
+        :param hashed_password: Store the hashed password in the database
+        :return: A tuple of whether the password matches and the new hash to store, or None
+        :doc-author: Trelent
+        """
+        return await self.run_in_pool(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
+    def dump_user(self, user: User) -> str:
+        """
+        The dump_user function serializes the fields of a user that the routes need as compact JSON.
+        Password hash and refresh token are left out.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user loaded from the database
+        :return: A JSON string
+        :doc-author: Trelent
+        """
+        data = {field: getattr(user, field) for field in self.USER_FIELDS}
+        data['created_at'] = user.created_at.isoformat() if user.created_at else None
+        return json.dumps(data, separators=(',', ':'))
+
+    def load_user(self, data: str | bytes) -> User:
+        """
+        The load_user function builds a detached User from the JSON made by dump_user.
+
+        :param self: Represent the instance of the class
+        :param data: str | bytes: The JSON string
+        :return: A user object that is not bound to any database session
+        :doc-author: Trelent
+        """
+        data = json.loads(data)
+        if data['created_at'] is not None:
+            data['created_at'] = datetime.fromisoformat(data['created_at'])
+        return User(**data)
 
-    def get_password_hash(self, password: str):
+    async def forget_user(self, email: str):
+        """
+        The forget_user function drops a user from both cache tiers after the user has changed.
+        Other workers keep their in-process copy for at most user_cache_ttl seconds.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+        self.user_cache.pop(email)
+        try:
+            await self.r.delete(f"user:{email}")
+        except RedisError as err:
+            log_redis_error(err)
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
         The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
@@ -45,7 +133,7 @@ class Auth:
         :return: A hashed password
         :doc-author: Trelent
         """
-        return self.pwd_context.hash(password)
+        return await self.run_in_pool(self.pwd_context.hash, password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -115,15 +203,45 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def verify_access_token(self, token: str) -> str | None:
+        """
+        The verify_access_token function checks the signature, expiry and scope of an access token and returns
+        its subject. Verified tokens are kept in the in-process token_cache under a SHA-256 digest of the token until
+        their exp at the latest, so a token that is reused for every request is decoded only once.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The email of the user, or None if the token is not a valid access token
+        :doc-author: Trelent
+        """
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        email = self.token_cache.get(key)
+        if email is not None:
+            return email
+        try:
+            # Decode JWT
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            return None
+        email = payload.get("sub")
+        if payload.get('scope') != 'access_token' or email is None:
+            return None
+        ttl = self.token_cache.ttl
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        self.token_cache.set(key, email, ttl=ttl)
+        return email
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             if it's valid, otherwise raises an HTTPException with status code 401.
+            The user is looked up in the in-process cache first, then in Redis and only then in the database.
 
         :param self: Refer to the current object
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
+        :param db: AsyncSession: Get the database session
         :return: A user object
         :doc-author: Trelent
         """
@@ -133,26 +251,31 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        email = self.verify_access_token(token)
+        if email is None:
             raise credentials_exception
-        user = self.r.get(f"user:{email}")
-        if user is None:
+        user = self.user_cache.get(email)
+        if user is not None:
+            return user
+        try:
+            data = await self.r.get(f"user:{email}")
+        except RedisError as err:
+            log_redis_error(err)
+            data = None
+        if data is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            data = self.dump_user(user)
+            if is_replica_session(db):
+                # may predate the last write of the user, which forget_user has already evicted
+                return self.load_user(data)
+            try:
+                await self.r.set(f"user:{email}", data, ex=900)
+            except RedisError as err:
+                log_redis_error(err)
+        user = self.load_user(data)
+        self.user_cache.set(email, user)
         return user
 
     def create_email_token(self, data: dict):
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import io
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AvatarTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class AvatarStorage(ABC):
+    """Where processed avatars are kept. save stores the JPEG bytes under a key and returns the public URL."""
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes) -> str:
+        ...
+
+
+class CloudinaryStorage(AvatarStorage):
+    """Avatars in Cloudinary. The SDK is configured once and its blocking upload runs in the executor."""
+
+    def __init__(self, folder: str, executor: ThreadPoolExecutor):
+        self.folder = folder
+        self.executor = executor
+        cloudinary.config(
+            cloud_name=settings.cloudinary_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret,
+            secure=True
+        )
+
+    async def save(self, key: str, data: bytes) -> str:
+        """
+        The save function uploads the avatar to Cloudinary, replacing the previous avatar of the key.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar, unique per user
+        :param data: bytes: The JPEG image
+        :return: The versioned https URL of the uploaded image
+        :doc-author: Trelent
+        """
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: cloudinary.uploader.upload(io.BytesIO(data), public_id=f'{self.folder}/{key}',
+                                                              overwrite=True))
+        return result['secure_url']
+
+
+class LocalStorage(AvatarStorage):
+    """Avatars as files in a local directory that the app serves as static files. For tests and single-node use."""
+
+    def __init__(self, root: str | Path, base_url: str, executor: ThreadPoolExecutor):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+        self.executor = executor
+
+    def write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def save(self, key: str, data: bytes) -> str:
+        """
+        The save function writes the avatar to root/key.jpg. The file is replaced atomically,
+        and the URL carries a content hash so that browsers do not keep showing the old avatar.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar, unique per user
+        :param data: bytes: The JPEG image
+        :return: The URL of the image
+        :doc-author: Trelent
+        """
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.write, self.root / f'{key}.jpg', data)
+        return f'{self.base_url}/{key}.jpg?v={hashlib.sha1(data).hexdigest()[:12]}'
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """
+    The read_upload function reads an uploaded file in chunks and stops as soon as it exceeds max_bytes,
+    so an oversized upload is never held in memory in full.
+
+    :param file: UploadFile: The uploaded file
+    :param max_bytes: int: The largest accepted size
+    :return: The content of the file
+    :doc-author: Trelent
+    """
+    data = bytearray()
+    while chunk := await file.read(CHUNK_SIZE):
+        data += chunk
+        if len(data) > max_bytes:
+            raise AvatarTooLarge(f'Avatar is larger than {max_bytes} bytes')
+    return bytes(data)
+
+
+def resize_image(data: bytes, size: int, max_pixels: int) -> bytes:
+    """
+    The resize_image function decodes an image, crops it to a centered square of size x size pixels
+    and encodes it as JPEG. It is CPU bound and runs in the avatar executor.
+
+    :param data: bytes: The uploaded image in any format Pillow can read
+    :param size: int: The width and height of the avatar
+    :param max_pixels: int: The largest accepted width * height, against decompression bombs
+    :return: The avatar as JPEG
+    :doc-author: Trelent
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > max_pixels:
+            raise InvalidImage('Image has too many pixels')
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as err:
+        raise InvalidImage('Not a valid image') from err
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+def create_storage() -> AvatarStorage:
+    """
+    The create_storage function builds the storage backend selected by the avatar_storage setting.
+
+    :return: The avatar storage
+    :doc-author: Trelent
+    """
+    if settings.avatar_storage == 'local':
+        return LocalStorage(settings.avatar_dir, settings.avatar_url, avatar_executor)
+    return CloudinaryStorage('NotesApp', avatar_executor)
+
+
+async def save_avatar(file: UploadFile, key: str, storage: AvatarStorage) -> str:
+    """
+    The save_avatar function runs the avatar pipeline: read the upload with a size cap, resize it
+    off the event loop and store the result.
+
+    :param file: UploadFile: The uploaded image
+    :param key: str: The name of the avatar, unique per user
+    :param storage: AvatarStorage: Where to store the avatar
+    :return: The URL of the stored avatar
+    :doc-author: Trelent
+    """
+    data = await read_upload(file, settings.avatar_max_bytes)
+    data = await asyncio.get_running_loop().run_in_executor(avatar_executor, resize_image, data, settings.avatar_size,
+                                                            settings.avatar_max_pixels)
+    return await storage.save(key, data)
+
+
+avatar_executor = ThreadPoolExecutor(max_workers=settings.avatar_workers, thread_name_prefix="avatar")
+avatar_storage = create_storage()
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import logging
+import random
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.database.replicas import is_replica_session
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactResponse
+from src.services.redis_client import RedisErrorLog
+
+log_redis_error = RedisErrorLog(logging.getLogger(__name__))
+
+
+def new_version() -> int:
+    return random.getrandbits(48)
+
+
+class ContactsCache:
+    """
+    Redis cache of contact reads. Every key embeds a per-user version, so a write only has to replace that
+    version to invalidate all cached pages of the user at once; stale keys expire by ttl. The version is also
+    the list ETag. It is a random number rather than a counter: should the key be evicted or flushed, the new
+    version is drawn again instead of restarting at a value an old ETag may still hold. Versions are kept
+    even with ttl 0, which only turns off the cached reads.
+    Redis errors are counted and the reads fall through to the database. The read functions below only fill
+    the cache from the primary: a replica may still return what the current version has replaced.
+    """
+
+    def __init__(self, client: Redis | None, ttl: int):
+        self.client = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def version_key(user_id: int) -> str:
+        return f"contacts:{user_id}:version"
+
+    @staticmethod
+    def key(user_id: int, version: int, name: str, params: dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"contacts:{user_id}:{version}:{name}:{digest}"
+
+    async def version(self, user_id: int) -> int | None:
+        """
+        The version function reads the current version of the user's contacts.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contacts
+        :return: The version, or None when Redis is unavailable
+        :doc-author: Trelent
+        """
+        key = self.version_key(user_id)
+        try:
+            version = await self.client.get(key)
+            if version is None:
+                # first read, or the key was lost: concurrent readers agree on whichever seed is set first
+                version = new_version()
+                if not await self.client.set(key, version, nx=True):
+                    version = await self.client.get(key)
+            return int(version)
+        except RedisError as err:
+            self.errors += 1
+            log_redis_error(err)
+            return None
+
+    async def get(self, user_id: int, name: str, params: dict, version: int | None = None, raw: bool = False):
+        """
+        The get function looks up a cached read of the user.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contacts
+        :param name: str: Which read is cached, e.g. list or contact
+        :param params: dict: The arguments of the read
+        :param version: int | None: The version of the user's contacts if the caller has read it already
+        :param raw: bool: Return the cached bytes as they are instead of decoding the JSON
+        :return: A tuple of the cache key to store a miss under and the cached value, or (key, None) on a miss;
+            the key is None when the cache is disabled or unavailable
+        :doc-author: Trelent
+        """
+        if not self.ttl:
+            return None, None
+        if version is None:
+            version = await self.version(user_id)
+            if version is None:
+                return None, None
+        key = self.key(user_id, version, name, params)
+        try:
+            value = await self.client.get(key)
+        except RedisError as err:
+            self.errors += 1
+            log_redis_error(err)
+            return None, None
+        if value is None:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        return key, value if raw else json.loads(value)
+
+    async def set(self, key: str | None, value: str | bytes):
+        """
+        The set function stores an already serialized read under the key returned by get.
+
+        :param self: Represent the instance of the class
+        :param key: str | None: The cache key from get, nothing is stored if it is None
+        :param value: str | bytes: The JSON to cache
+        :return: None
+        :doc-author: Trelent
+        """
+        if key is None:
+            return
+        try:
+            await self.client.set(key, value, ex=self.ttl)
+        except RedisError as err:
+            self.errors += 1
+            log_redis_error(err)
+
+    async def invalidate(self, user_id: int):
+        """
+        The invalidate function replaces the version of the user, which invalidates every cached read of the user
+        and the list ETag with a single SET, whatever the number of cached pages.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contacts that changed
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            await self.client.set(self.version_key(user_id), new_version())
+        except RedisError as err:
+            self.errors += 1
+            log_redis_error(err)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+def dump_contacts(contacts) -> str:
+    return '[' + ','.join(ContactResponse.from_orm(contact).json() for contact in contacts) + ']'
+
+
+def dump_contact(contact) -> str:
+    # the row version is kept next to the response fields for the ETag; the response model drops it
+    return json.dumps(dict(ContactResponse.from_orm(contact).dict(), version=contact.version), default=str)
+
+
+async def get_contacts(limit: int, offset: int, favorite: bool, first_name: str, last_name: str, email: str,
+                       user: User, db: AsyncSession, version: int | None = None):
+    """
+    The get_contacts function is repository.contacts.get_contacts behind the cache.
+
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Determine how many contacts to skip before returning the results
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name
+    :param last_name: str: Filter contacts by their last name
+    :param email: str: Filter contacts by email
+    :param user: User: Get the user_id from the database
+    :param db: AsyncSession: Pass the database session to the repository
+    :param version: int | None: The version of the user's contacts if the caller has read it already
+    :return: A list of contacts, as dictionaries when they come from the cache
+    :doc-author: Trelent
+    """
+    params = dict(limit=limit, offset=offset, favorite=favorite, first_name=first_name, last_name=last_name,
+                  email=email)
+    key, contacts = await contacts_cache.get(user.id, 'list', params, version)
+    if contacts is not None:
+        return contacts
+    contacts = await repository_contacts.get_contacts(limit, offset, favorite, first_name, last_name, email, user, db)
+    if not is_replica_session(db):
+        await contacts_cache.set(key, dump_contacts(contacts))
+    return contacts
+
+
+async def get_contacts_page(limit: int, after: tuple | None, favorite: bool, first_name: str, last_name: str,
+                            email: str, user: User, db: AsyncSession, version: int | None = None):
+    """
+    The get_contacts_page function is repository.contacts.get_contacts_page behind the cache.
+
+    :param limit: int: Limit the number of contacts returned
+    :param after: tuple | None: The sort key of the last contact of the previous page
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name
+    :param last_name: str: Filter contacts by their last name
+    :param email: str: Filter contacts by email
+    :param user: User: Get the user_id from the database
+    :param db: AsyncSession: Pass the database session to the repository
+    :param version: int | None: The version of the user's contacts if the caller has read it already
+    :return: A list of contacts and the sort key to continue from, or None on the last page
+    :doc-author: Trelent
+    """
+    params = dict(limit=limit, after=after, favorite=favorite, first_name=first_name, last_name=last_name,
+                  email=email)
+    key, page = await contacts_cache.get(user.id, 'page', params, version)
+    if page is not None:
+        return page['contacts'], page['next'] and tuple(page['next'])
+    contacts, next_key = await repository_contacts.get_contacts_page(limit, after, favorite, first_name, last_name,
+                                                                     email, user, db)
+    if not is_replica_session(db):
+        await contacts_cache.set(key, f'{{"contacts":{dump_contacts(contacts)},"next":{json.dumps(next_key)}}}')
+    return contacts, next_key
+
+
+def encode_rows(rows) -> bytes:
+    # the rows hold the ContactResponse columns in field order, and orjson writes dates as ISO strings like pydantic
+    fields = ContactResponse.__fields__.keys()
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+async def get_contacts_json(limit: int, offset: int, favorite: bool, first_name: str, last_name: str, email: str,
+                            user: User, db: AsyncSession, version: int | None = None) -> bytes:
+    """
+    The get_contacts_json function is the fast path of get_contacts: it returns the response body itself.
+        Only the response columns are selected, as rows rather than Contact objects, and encoded with orjson
+        without building a ContactResponse per contact. The body is cached as it is, so a hit costs no decoding.
+
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Determine how many contacts to skip before returning the results
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name
+    :param last_name: str: Filter contacts by their last name
+    :param email: str: Filter contacts by email
+    :param user: User: Get the user_id from the database
+    :param db: AsyncSession: Pass the database session to the repository
+    :param version: int | None: The version of the user's contacts if the caller has read it already
+    :return: The JSON array of the contacts
+    :doc-author: Trelent
+    """
+    params = dict(limit=limit, offset=offset, favorite=favorite, first_name=first_name, last_name=last_name,
+                  email=email)
+    key, body = await contacts_cache.get(user.id, 'list.json', params, version, raw=True)
+    if body is not None:
+        return body
+    rows = await repository_contacts.get_contacts(limit, offset, favorite, first_name, last_name, email, user, db,
+                                                  repository_contacts.CONTACT_RESPONSE_COLUMNS)
+    body = encode_rows(rows)
+    if not is_replica_session(db):
+        await contacts_cache.set(key, body)
+    return body
+
+
+async def get_contacts_page_json(limit: int, after: tuple | None, favorite: bool, first_name: str, last_name: str,
+                                 email: str, user: User, db: AsyncSession, version: int | None = None):
+    """
+    The get_contacts_page_json function is the fast path of get_contacts_page, see get_contacts_json.
+        The page is cached as the JSON of the next sort key and the body on separate lines,
+        so a hit only decodes the short first line.
+
+    :param limit: int: Limit the number of contacts returned
+    :param after: tuple | None: The sort key of the last contact of the previous page
+    :param favorite: bool: Filter the contacts by favorite status
+    :param first_name: str: Filter the contacts by first name
+    :param last_name: str: Filter contacts by their last name
+    :param email: str: Filter contacts by email
+    :param user: User: Get the user_id from the database
+    :param db: AsyncSession: Pass the database session to the repository
+    :param version: int | None: The version of the user's contacts if the caller has read it already
+    :return: The JSON array of the contacts and the sort key to continue from, or None on the last page
+    :doc-author: Trelent
+    """
+    params = dict(limit=limit, after=after, favorite=favorite, first_name=first_name, last_name=last_name,
+                  email=email)
+    key, page = await contacts_cache.get(user.id, 'page.json', params, version, raw=True)
+    if page is not None:
+        next_key, body = page.split(b'\n', 1)
+        next_key = orjson.loads(next_key)
+        return body, next_key and tuple(next_key)
+    rows, next_key = await repository_contacts.get_contacts_page(limit, after, favorite, first_name, last_name,
+                                                                 email, user, db,
+                                                                 repository_contacts.CONTACT_RESPONSE_COLUMNS)
+    body = encode_rows(rows)
+    if not is_replica_session(db):
+        await contacts_cache.set(key, orjson.dumps(next_key) + b'\n' + body)
+    return body, next_key
+
+
+async def get_contact(contact_id: int, user: User, db: AsyncSession):
+    """
+    The get_contact function is repository.contacts.get_contact behind the cache. Missing contacts are cached too.
+
+    :param contact_id: int: The id of the contact
+    :param user: User: Get the user id from the token
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: The contact, as a dictionary when it comes from the cache, or None
+    :doc-author: Trelent
+    """
+    key, contact = await contacts_cache.get(user.id, 'contact', {'id': contact_id})
+    if contact is not None:
+        return contact or None
+    contact = await repository_contacts.get_contact(contact_id, user, db)
+    if not is_replica_session(db):
+        await contacts_cache.set(key, dump_contact(contact) if contact else '{}')
+    return contact
+
+
+# the Redis client is set on startup, see main.py
+contacts_cache = ContactsCache(None, settings.contacts_cache_ttl)
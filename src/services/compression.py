@@ -0,0 +1,158 @@
+import zlib
+from typing import List
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.services.etag import encoded_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Media types worth compressing. Images and other already compressed bodies would only cost CPU.
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml")
+UNCOMPRESSED_STATUSES = {204, 304}
+
+
+class GzipEncoder:
+    """Incremental gzip stream. Every chunk but the last ends with a sync flush, so it can be decoded on arrival."""
+
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    """Incremental brotli stream, flushed after every chunk like GzipEncoder."""
+
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        body = self.compressor.process(data)
+        return body + (self.compressor.finish() if final else self.compressor.flush())
+
+
+def make_encoder(encoding: str):
+    if encoding == "br":
+        return BrotliEncoder(settings.compression_brotli_quality)
+    return GzipEncoder(settings.compression_gzip_level)
+
+
+def available_encodings() -> List[str]:
+    """
+    The available_encodings function lists the configured encodings this process can produce, in order of preference.
+    br is skipped when the brotli package is not installed.
+
+    :return: The content codings to offer
+    :doc-author: Trelent
+    """
+    return [encoding for encoding in settings.compression_encodings
+            if encoding == "gzip" or (encoding == "br" and brotli is not None)]
+
+
+def choose_encoding(accept_encoding: str, encodings: List[str]) -> str | None:
+    """
+    The choose_encoding function picks the first of our encodings that the client accepts.
+        Quality values only decide whether a coding is acceptable (q=0 refuses it); among the acceptable ones
+        the server's order wins, so br is used whenever both sides support it.
+
+    :param accept_encoding: str: The Accept-Encoding header of the request
+    :param encodings: List[str]: The encodings we can produce, preferred first
+    :return: The encoding to use, or None to send the body as it is
+    :doc-author: Trelent
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(status_code: int, headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").lower()
+    return (status_code not in UNCOMPRESSED_STATUSES and "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "").lower()
+            and (content_type.startswith(COMPRESSIBLE_TYPES) or content_type.split(";")[0].endswith("+json")))
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses response bodies with brotli or gzip, as the client accepts.
+    A complete body is compressed when it has at least settings.compression_minimum_size bytes.
+    A streamed body, whose size is unknown up front, is always compressed chunk by chunk as the app sends it:
+    nothing is buffered, and every chunk is flushed so the client can decode it before the stream ends.
+    The ETag of a compressed body gets a -<coding> suffix, so each representation keeps a strong validator
+    of its own; a 304 answering a suffixed If-None-Match repeats the suffixed tag.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), available_encodings())
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        start_message = None
+        encoder = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    headers = MutableHeaders(scope=message)
+                    etag = headers.get("etag")
+                    if etag and encoded_etag(etag, encoding) in request_headers.get("if-none-match", ""):
+                        headers["ETag"] = encoded_etag(etag, encoding)
+                elif compressible(message["status"], Headers(raw=message["headers"])):
+                    # held back until the first body chunk tells whether the body is streamed and how large it is
+                    start_message = message
+                    return
+            elif message["type"] == "http.response.body" and (start_message is not None or encoder is not None):
+                body, more_body = message.get("body", b""), message.get("more_body", False)
+                if encoder is None:
+                    start, start_message = start_message, None
+                    if not more_body and len(body) < settings.compression_minimum_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    encoder = make_encoder(encoding)
+                    body = encoder.compress(body, not more_body)
+                    headers = MutableHeaders(scope=start)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if "etag" in headers:
+                        headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                    del headers["Content-Length"]
+                    if not more_body:
+                        headers["Content-Length"] = str(len(body))
+                    await send(start)
+                else:
+                    body = encoder.compress(body, not more_body)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,25 +1,34 @@
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.mailer import mailer
 from src.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'), autoescape=select_autoescape())
+
+
+def build_message(email: str, subject: str, template_name: str, **context) -> EmailMessage:
+    """
+    The build_message function renders an HTML template into an email to one recipient.
+
+    :param email: str: The address of the recipient
+    :param subject: str: The subject line
+    :param template_name: str: The file name of the template in the templates folder
+    :param **context: The variables of the template
+    :return: The email message
+    :doc-author: Trelent
+    """
+    message = EmailMessage()
+    message["From"] = formataddr(("Desired Name", settings.mail_from))
+    message["To"] = email
+    message["Subject"] = subject
+    message.set_content(templates.get_template(template_name).render(**context), subtype="html")
+    return message
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -29,23 +38,15 @@ async def send_email(email: EmailStr, username: str, host: str):
             -email: EmailStr, the user's email address.
             -username: str, the username of the user who is registering for an account.  This will be used in a greeting message within the body of the email sent to them.
             -host: str, this is where we are hosting our application (i.e., localhost).  This will be used as part of a URL that users can click on within their emails.
+        The message is handed to the mail queue, which delivers it over a pooled SMTP connection and retries failures.
 
     :param email: EmailStr: Validate the email address
     :param username: str: Pass the username of the user who is registering to the email template
     :param host: str: Pass the hostname of the server to be used in the email template
-    :return: A coroutine, which is a special type of object that can be used with await or yield from
+    :return: None
     :doc-author: Trelent
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = auth_service.create_email_token({"sub": email})
+    message = build_message(email, "Confirm your email ", "email_template.html",
+                            host=host, username=username, token=token_verification)
+    await mailer.send(message)
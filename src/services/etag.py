@@ -0,0 +1,111 @@
+from typing import List
+
+from fastapi import Response, status
+
+# Strong ETags made from row and per-user versions, so a conditional request is answered by comparing
+# two short strings: nothing is serialized or hashed, and a fresh version needs no query of its own.
+# A compressed body is another representation with its own strong ETag, the tag with a -<coding> suffix.
+CONTENT_CODINGS = ('gzip', 'br')
+
+
+def contact_etag(contact) -> str | None:
+    """
+    The contact_etag function builds the ETag of a contact from its id and row version.
+
+    :param contact: The contact, as a Contact or as the dictionary cached for it
+    :return: The quoted ETag, or None for a cached contact without a version
+    :doc-author: Trelent
+    """
+    if isinstance(contact, dict):
+        contact_id, version = contact.get('id'), contact.get('version')
+    else:
+        contact_id, version = contact.id, contact.version
+    return f'"{contact_id}.{version}"' if version is not None else None
+
+
+def contacts_etag(user_id: int, version: int | None) -> str | None:
+    """
+    The contacts_etag function builds the ETag of the contact lists of a user from the version of the contacts cache,
+    which every write of the user's contacts replaces.
+
+    :param user_id: int: The owner of the contacts
+    :param version: int | None: The version from ContactsCache.version, None when it is unknown
+    :return: The quoted ETag, or None when the version is unknown
+    :doc-author: Trelent
+    """
+    return f'"list.{user_id}.{version}"' if version is not None else None
+
+
+def user_etag(user) -> str:
+    return f'"user.{user.id}.{user.version}"'
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    The encoded_etag function gives the ETag of a representation compressed with a content coding,
+    e.g. "list.1.10" becomes "list.1.10-gzip".
+
+    :param etag: str: The quoted ETag of the uncompressed body
+    :param encoding: str: The content coding, gzip or br
+    :return: The quoted ETag of the compressed body
+    :doc-author: Trelent
+    """
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decoded_etag(tag: str) -> str:
+    """
+    The decoded_etag function turns the ETag of a compressed representation back into the ETag of the resource,
+    dropping a weak prefix too.
+
+    :param tag: str: A quoted ETag from a request header
+    :return: The quoted ETag without W/ and coding suffix
+    :doc-author: Trelent
+    """
+    tag = tag.strip().removeprefix('W/')
+    for encoding in CONTENT_CODINGS:
+        if tag.endswith(f'-{encoding}"'):
+            return tag[:-len(encoding) - 2] + '"'
+    return tag
+
+
+def etag_matches(header: str | None, etag: str | None) -> bool:
+    """
+    The etag_matches function checks an If-None-Match header against the current ETag, with the weak comparison
+    that RFC 9110 prescribes for If-None-Match.
+
+    :param header: str | None: The If-None-Match header
+    :param etag: str | None: The current ETag
+    :return: True if the client's copy, compressed or not, is current
+    :doc-author: Trelent
+    """
+    if not header or etag is None:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in (decoded_etag(tag) for tag in header.split(','))
+
+
+def if_match_versions(header: str | None, contact_id: int) -> List[int] | None:
+    """
+    The if_match_versions function reads the versions of a contact that an If-Match header accepts.
+        Only strong ETags of this contact can match, of any of its compressed representations too;
+        weak and foreign tags are ignored.
+
+    :param header: str | None: The If-Match header
+    :param contact_id: int: The contact being written
+    :return: The accepted versions, possibly none, or None when there is no precondition (no header or *)
+    :doc-author: Trelent
+    """
+    if header is None or header.strip() == '*':
+        return None
+    versions = []
+    for tag in header.split(','):
+        tag_id, _, version = decoded_etag(tag).strip('"').partition('.')
+        if not tag.strip().startswith('W/') and tag_id == str(contact_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
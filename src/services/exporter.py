@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, List
+
+FIELDS = ['id', 'first_name', 'last_name', 'email', 'birth_date', 'favorite', 'phone']
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def to_ndjson(rows: List) -> str:
+    """
+    The to_ndjson function turns a batch of contact rows into newline-delimited JSON, one contact per line,
+    with the same fields as ContactResponse.
+
+    :param rows: List: Rows with the FIELDS columns
+    :return: The NDJSON text of the batch
+    :doc-author: Trelent
+    """
+    lines = []
+    for row in rows:
+        contact = dict(zip(FIELDS, row))
+        contact['birth_date'] = contact['birth_date'].isoformat()
+        lines.append(json.dumps(contact, ensure_ascii=False))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def to_csv(rows: List) -> str:
+    """
+    The to_csv function turns a batch of contact rows into CSV lines without a header.
+
+    :param rows: List: Rows with the FIELDS columns
+    :return: The CSV text of the batch
+    :doc-author: Trelent
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+async def export_contacts(batches: AsyncIterator[List], fmt: str) -> AsyncIterator[bytes]:
+    """
+    The export_contacts function encodes batches of contact rows as they come from the database,
+    so the first bytes can be sent before the query has finished.
+
+    :param batches: AsyncIterator[List]: Row batches from repository.contacts.stream_contacts
+    :param fmt: str: ndjson or csv
+    :return: An async iterator of encoded chunks
+    :doc-author: Trelent
+    """
+    encode = to_ndjson if fmt == 'ndjson' else to_csv
+    if fmt == 'csv':
+        yield (','.join(FIELDS) + '\n').encode('utf-8')
+    async for rows in batches:
+        yield encode(rows).encode('utf-8')
@@ -0,0 +1,250 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+MAX_ROW_SIZE = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """The stream itself is malformed, so no further rows can be read from it."""
+
+    def __init__(self, row: int, detail: str):
+        super().__init__(detail)
+        self.row = row
+        self.detail = detail
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    The iter_lines function splits a byte stream into text lines without reading the whole stream first.
+
+    :param chunks: AsyncIterator[bytes]: The request body as it arrives
+    :return: An async iterator of lines without the line break
+    :doc-author: Trelent
+    """
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+        if len(buffer) > MAX_ROW_SIZE:
+            raise ImportFormatError(0, 'Line is too long')
+    if buffer:
+        yield buffer.rstrip(b'\r').decode('utf-8')
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    The iter_ndjson function reads newline-delimited JSON, one contact object per line. Blank lines are skipped.
+
+    :param chunks: AsyncIterator[bytes]: The request body as it arrives
+    :return: An async iterator of (line number, decoded value or ValueError)
+    :doc-author: Trelent
+    """
+    row = 0
+    async for line in iter_lines(chunks):
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError as err:
+            yield row, err
+
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    The iter_csv function reads CSV with a header row naming the ContactModel fields.
+        Quoted values may span lines. Empty values are left out so the model defaults apply.
+
+    :param chunks: AsyncIterator[bytes]: The request body as it arrives
+    :return: An async iterator of (record number, dict of values or ValueError)
+    :doc-author: Trelent
+    """
+    header = None
+    row = 0
+    record = ''
+    async for line in iter_lines(chunks):
+        record = f'{record}\n{line}' if record else line
+        if record.count('"') % 2:
+            # an odd number of quotes means a quoted value continues on the next line
+            if len(record) > MAX_ROW_SIZE:
+                raise ImportFormatError(row + 1, 'Unterminated quoted value')
+            continue
+        values = next(csv.reader([record])) if record else []
+        record = ''
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not values:
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, ValueError(f'Expected {len(header)} values, got {len(values)}')
+            continue
+        yield row, {name: value for name, value in zip(header, values) if value != ''}
+    if record:
+        raise ImportFormatError(row + 1, 'Unterminated quoted value')
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    The iter_json_array function reads a JSON array of contact objects element by element,
+    so the whole array never has to be held in memory.
+
+    :param chunks: AsyncIterator[bytes]: The request body as it arrives
+    :return: An async iterator of (array index starting at 1, decoded value)
+    :doc-author: Trelent
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    state = 'start'
+    row = 0
+
+    def skip_whitespace(text, pos):
+        while pos < len(text) and text[pos] in ' \t\r\n':
+            pos += 1
+        return pos
+
+    async def more():
+        async for chunk in chunks:
+            yield utf8.decode(chunk)
+        yield utf8.decode(b'', final=True)
+
+    async for text in more():
+        buffer += text
+        pos = 0
+        while True:
+            pos = skip_whitespace(buffer, pos)
+            if pos == len(buffer):
+                break
+            if state == 'start':
+                if buffer[pos] != '[':
+                    raise ImportFormatError(0, 'Expected a JSON array')
+                state, pos = 'value_or_end', pos + 1
+            elif state in ('value_or_end', 'value'):
+                if state == 'value_or_end' and buffer[pos] == ']':
+                    state, pos = 'end', pos + 1
+                    continue
+                try:
+                    value, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # the element is probably cut off at the end of the chunk, wait for more data
+                    if len(buffer) - pos > MAX_ROW_SIZE:
+                        raise ImportFormatError(row + 1, 'Invalid JSON')
+                    break
+                row += 1
+                state = 'comma_or_end'
+                yield row, value
+            elif state == 'comma_or_end':
+                if buffer[pos] not in ',]':
+                    raise ImportFormatError(row + 1, 'Invalid JSON')
+                state, pos = ('value', pos + 1) if buffer[pos] == ',' else ('end', pos + 1)
+            else:
+                raise ImportFormatError(row, 'Unexpected data after the JSON array')
+        buffer = buffer[pos:]
+    if state != 'end':
+        raise ImportFormatError(row + 1, 'Invalid JSON')
+
+
+PARSERS = {
+    'json': iter_json_array,
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+}
+
+
+def get_parser(content_type: str | None):
+    """
+    The get_parser function picks the stream parser for the Content-Type of the request.
+
+    :param content_type: str | None: The Content-Type header, parameters such as charset are ignored
+    :return: The parser function, or None if the content type is not supported
+    :doc-author: Trelent
+    """
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    return PARSERS.get(CONTENT_TYPES.get(media_type))
+
+
+def format_validation_error(err: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in err.errors())
+
+
+async def import_contacts(rows: AsyncIterator[Tuple[int, object]], user: User, db: AsyncSession,
+                          batch_size: int) -> dict:
+    """
+    The import_contacts function validates parsed rows against ContactModel as they arrive and inserts them
+    in batches of batch_size. Invalid rows, duplicate emails and rows rejected by the database are reported
+    with their row number; they never abort the rest of the import.
+
+    :param rows: AsyncIterator[Tuple[int, object]]: Rows produced by one of the parsers
+    :param user: User: The owner of the imported contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: How many contacts to insert per statement
+    :return: A dictionary with the number of created and failed rows and the per-row errors
+    :doc-author: Trelent
+    """
+    result = {'created': 0, 'failed': 0, 'errors': []}
+
+    def fail(row, detail):
+        result['failed'] += 1
+        result['errors'].append({'row': row, 'detail': detail})
+
+    async def flush(batch):
+        try:
+            ids = await repository_contacts.create_contacts([body for _, body in batch], user, db)
+        except DBAPIError:
+            await db.rollback()
+            if len(batch) == 1:
+                fail(batch[0][0], 'Rejected by the database')
+                return
+            # find the offending rows by retrying one at a time
+            for item in batch:
+                await flush([item])
+            return
+        for (row, _), contact_id in zip(batch, ids):
+            if contact_id is None:
+                fail(row, 'Contact with this email already exists')
+            else:
+                result['created'] += 1
+
+    batch = []
+    try:
+        async for row, data in rows:
+            if isinstance(data, ValueError):
+                fail(row, str(data))
+                continue
+            if not isinstance(data, dict):
+                fail(row, 'Expected an object')
+                continue
+            try:
+                batch.append((row, ContactModel(**data)))
+            except ValidationError as err:
+                fail(row, format_validation_error(err))
+                continue
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+    except (ImportFormatError, UnicodeDecodeError) as err:
+        fail(getattr(err, 'row', 0), getattr(err, 'detail', 'Invalid encoding, expected UTF-8'))
+    if batch:
+        await flush(batch)
+    result['errors'].sort(key=lambda error: error['row'])
+    return result
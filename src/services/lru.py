@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Bounded in-process cache: entries expire after ttl seconds and the least recently used entry is dropped
+    once maxsize is reached. It is not shared between workers.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        The get function returns the cached value for key, or None if it is missing or expired.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The cache key
+        :return: The cached value or None
+        :doc-author: Trelent
+        """
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires <= time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        """
+        The set function caches value under key, evicting the least recently used entry when the cache is full.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The cache key
+        :param value: Any: The value to cache
+        :param ttl: float | None: Seconds until the entry expires, the cache ttl by default
+        :return: None
+        :doc-author: Trelent
+        """
+        if self.maxsize <= 0:
+            return
+        self.data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
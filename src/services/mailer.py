@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from email.message import EmailMessage
+from typing import Awaitable, Callable
+
+from aiosmtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException
+
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MailerStats:
+    """Counters of the mail queue: what was queued, sent, retried and given up on, and how long sends take."""
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.connections = 0
+        self.send_ms = 0.0
+        self.send_max_ms = 0.0
+
+    def record_send(self, elapsed: float):
+        """
+        The record_send function adds one delivered message to the counters.
+
+        :param self: Represent the instance of the class
+        :param elapsed: float: Seconds the SMTP transaction took
+        :return: None
+        :doc-author: Trelent
+        """
+        self.sent += 1
+        self.send_ms += elapsed * 1000
+        self.send_max_ms = max(self.send_max_ms, elapsed * 1000)
+
+    def summary(self) -> dict:
+        return {"queued": self.queued, "sent": self.sent, "retried": self.retried, "failed": self.failed,
+                "batches": self.batches, "connections": self.connections,
+                "send_avg_ms": self.send_ms / self.sent if self.sent else 0.0, "send_max_ms": self.send_max_ms}
+
+
+class Mailer:
+    """
+    Background delivery of emails. Messages wait in a bounded queue and are sent by a fixed number of workers,
+    each keeping one SMTP connection open between messages. A worker takes every queued message up to batch_size
+    at once and sends them over its connection without reconnecting. A failed message is queued again after
+    retry_delay seconds, twice as long after every further failure, and dropped after max_attempts.
+    Failures are logged to the src.services.mailer logger. A message that fails with an unexpected error,
+    e.g. a malformed address, is dropped at once; the worker carries on, and a worker that ended anyway
+    is replaced on the next send.
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[SMTP]], workers: int, queue_size: int, batch_size: int,
+                 max_attempts: int, retry_delay: float):
+        self.connect = connect
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stats = MailerStats()
+        self.queue = None
+        self.tasks = []
+        self.retries = set()
+
+    async def start(self):
+        """
+        The start function creates the queue and the workers in the running event loop.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """
+        The stop function waits up to timeout seconds for the queued messages to be sent, then stops the workers,
+        which close their SMTP connections. Messages still waiting for a retry are dropped.
+
+        :param self: Represent the instance of the class
+        :param timeout: float: Seconds to wait for the queue to drain
+        :return: None
+        :doc-author: Trelent
+        """
+        if not self.tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Mail queue not drained, %d messages dropped", self.queue.qsize())
+        for task in self.tasks + list(self.retries):
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.retries, return_exceptions=True)
+        self.tasks = []
+        self.retries.clear()
+
+    async def send(self, message: EmailMessage):
+        """
+        The send function queues a message for delivery. When the queue is full it waits for a free slot,
+        so a burst of emails slows its callers down instead of growing memory without limit.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message to send
+        :return: None
+        :doc-author: Trelent
+        """
+        if not self.tasks:
+            await self.start()
+        self.supervise()
+        await self.queue.put((message, 0))
+        self.stats.queued += 1
+
+    def supervise(self):
+        """
+        The supervise function replaces workers that have ended, so the queue always has consumers
+        and send does not block forever on a full queue.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        for i, task in enumerate(self.tasks):
+            if task.done():
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("Mail worker ended", exc_info=task.exception())
+                self.tasks[i] = asyncio.create_task(self.worker())
+
+    async def worker(self):
+        smtp = None
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                self.stats.batches += 1
+                try:
+                    smtp = await self.deliver(smtp, batch)
+                except Exception:
+                    # deliver handles every message on its own; this only keeps the worker alive if it did not
+                    logger.exception("Mail batch failed")
+                    if smtp is not None:
+                        smtp.close()
+                    smtp = None
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+        finally:
+            if smtp is not None:
+                smtp.close()
+
+    async def deliver(self, smtp: SMTP | None, batch: list) -> SMTP | None:
+        """
+        The deliver function sends a batch of messages over the connection of a worker, opening a new connection
+        when there is none or the previous one failed.
+
+        :param self: Represent the instance of the class
+        :param smtp: SMTP | None: The open connection of the worker
+        :param batch: list: The (message, attempt) pairs to send
+        :return: The connection to keep for the next batch, or None
+        :doc-author: Trelent
+        """
+        for message, attempt in batch:
+            if smtp is None or not smtp.is_connected:
+                try:
+                    smtp = await self.connect()
+                    self.stats.connections += 1
+                except (SMTPException, OSError) as err:
+                    logger.warning("SMTP connection failed: %s", err)
+                    smtp = None
+                    self.retry(message, attempt + 1)
+                    continue
+                except Exception:
+                    logger.exception("SMTP connection failed")
+                    smtp = None
+                    self.retry(message, attempt + 1)
+                    continue
+            try:
+                start = time.perf_counter()
+                await smtp.send_message(message)
+                self.stats.record_send(time.perf_counter() - start)
+            except (SMTPResponseException, SMTPRecipientsRefused) as err:
+                # the server refused this message over a healthy connection; 5xx replies will not change on retry
+                logger.warning("Email to %s refused: %s", message['To'], err)
+                self.retry(message, self.max_attempts if is_permanent(err) else attempt + 1)
+            except (SMTPException, OSError) as err:
+                logger.warning("Sending email to %s failed: %s", message['To'], err)
+                if smtp is not None:
+                    smtp.close()
+                smtp = None
+                self.retry(message, attempt + 1)
+            except Exception:
+                # e.g. a header or address the client cannot encode; retrying the same message cannot help
+                logger.exception("Sending email to %s failed", message['To'])
+                self.retry(message, self.max_attempts)
+        return smtp
+
+    def retry(self, message: EmailMessage, attempt: int):
+        """
+        The retry function schedules a failed message to be queued again with exponential backoff,
+        or drops it once it has been tried max_attempts times.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message that failed
+        :param attempt: int: How many times the message has been tried
+        :return: None
+        :doc-author: Trelent
+        """
+        if attempt >= self.max_attempts:
+            self.stats.failed += 1
+            logger.error("Giving up on email to %s after %d attempts", message['To'], attempt)
+            return
+        self.stats.retried += 1
+        task = asyncio.create_task(self.requeue(message, attempt, self.retry_delay * 2 ** (attempt - 1)))
+        self.retries.add(task)
+        task.add_done_callback(self.retries.discard)
+
+    async def requeue(self, message: EmailMessage, attempt: int, delay: float):
+        await asyncio.sleep(delay)
+        await self.queue.put((message, attempt))
+
+    def status(self) -> dict:
+        return dict(self.stats.summary(), queue_size=self.queue.qsize() if self.queue else 0,
+                    waiting_retry=len(self.retries), workers=len(self.tasks))
+
+
+def is_permanent(err: SMTPException) -> bool:
+    """
+    The is_permanent function tells whether the server refused a message with a permanent (5xx) reply.
+
+    :param err: SMTPException: The refusal
+    :return: True if retrying will not help
+    :doc-author: Trelent
+    """
+    if isinstance(err, SMTPRecipientsRefused):
+        return all(recipient.code >= 500 for recipient in err.recipients)
+    return err.code >= 500
+
+
+async def connect_smtp() -> SMTP:
+    """
+    The connect_smtp function opens and authenticates a connection to the configured SMTP server.
+
+    :return: A connected SMTP client
+    :doc-author: Trelent
+    """
+    smtp = SMTP(hostname=settings.mail_server, port=settings.mail_port, use_tls=settings.mail_ssl_tls,
+                start_tls=settings.mail_starttls, validate_certs=settings.mail_validate_certs,
+                timeout=settings.mail_timeout)
+    await smtp.connect()
+    if settings.mail_use_credentials:
+        try:
+            await smtp.login(settings.mail_username, settings.mail_password)
+        except Exception:
+            smtp.close()
+            raise
+    return smtp
+
+
+mailer = Mailer(connect_smtp, workers=settings.mail_workers, queue_size=settings.mail_queue_size,
+                batch_size=settings.mail_batch_size, max_attempts=settings.mail_max_attempts,
+                retry_delay=settings.mail_retry_delay)
@@ -0,0 +1,141 @@
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import GCCollector, PlatformCollector, ProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Label values are route templates, SQL verbs and Redis command names, never raw paths or keys,
+# so the number of series stays bounded however many contacts and users there are.
+UNMATCHED_ROUTE = "<unmatched>"
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+PlatformCollector(registry=registry)
+GCCollector(registry=registry)
+
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests by route template and status code",
+                        ["method", "route", "status"], registry=registry)
+HTTP_DURATION = Histogram("http_request_duration_seconds",
+                          "Time to handle an HTTP request, until the last body chunk is sent", ["method", "route"],
+                          registry=registry,
+                          buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being handled", ["method", "route"],
+                         registry=registry)
+DB_QUERIES = Counter("db_queries", "SQL statements executed", ["operation"], registry=registry)
+DB_QUERY_ERRORS = Counter("db_query_errors", "SQL statements that raised an error", ["operation"], registry=registry)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Time to execute an SQL statement", ["operation"],
+                              registry=registry,
+                              buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+REDIS_COMMAND_DURATION = Histogram("redis_command_duration_seconds", "Round trip of a Redis command", ["command"],
+                                   registry=registry,
+                                   buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+REDIS_COMMAND_ERRORS = Counter("redis_command_errors", "Redis commands that raised an error", ["command"],
+                               registry=registry)
+RATE_LIMIT_DECISIONS = Counter("rate_limit_decisions", "Rate limiter decisions: admitted by Redis, admitted from "
+                               "a local lease, denied, or let through because Redis failed", ["result"],
+                               registry=registry)
+RATE_LIMIT_DURATION = Histogram("rate_limit_redis_duration_seconds", "Round trip of a rate limiter script call",
+                                registry=registry,
+                                buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+
+def route_template(scope: Scope) -> str:
+    """
+    The route_template function finds the path template of the route that will handle a request,
+    e.g. /api/contacts/{contact_id} for /api/contacts/42, in the same way the router will.
+        The template is kept in scope["route_template"], so the middlewares after the first one that asks
+        do not walk the routes again.
+
+    :param scope: Scope: The ASGI scope of the request
+    :return: The path of the matching route, or <unmatched> when no route matches
+    :doc-author: Trelent
+    """
+    if "route_template" not in scope:
+        partial = None
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope["route_template"] = route.path
+                break
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        else:
+            scope["route_template"] = partial or UNMATCHED_ROUTE
+    return scope["route_template"]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that counts requests by route template and status code, tracks requests in progress
+    and observes the time until the response has been sent in full, so streamed responses are measured too.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_template(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+
+
+def sql_operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine: Engine):
+    """
+    The instrument_engine function counts and times every SQL statement of an engine through its cursor events.
+    For an AsyncEngine pass engine.sync_engine.
+
+    :param engine: Engine: The engine to instrument
+    :return: None
+    :doc-author: Trelent
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = sql_operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is None or not context.connection.info.get("query_start"):
+            return
+        context.connection.info["query_start"].pop()
+        operation = sql_operation(context.statement or "")
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_ERRORS.labels(operation).inc()
+
+
+def latest() -> bytes:
+    return generate_latest(registry)
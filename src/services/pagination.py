@@ -0,0 +1,39 @@
+import base64
+import json
+
+
+def encode_cursor(key: tuple) -> str:
+    """
+    The encode_cursor function turns the sort key of the last row of a page into an opaque cursor token.
+
+    :param key: tuple: The sort key of the last row, e.g. (last_name, first_name, id)
+    :return: A url-safe cursor string
+    :doc-author: Trelent
+    """
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, types: tuple) -> tuple:
+    """
+    The decode_cursor function turns a cursor token back into the sort key it was made from.
+        It raises ValueError if the token is malformed, has a different number of fields than expected or
+        a field of another type, so a crafted cursor never reaches the query.
+
+    :param cursor: str: The cursor token sent by the client
+    :param types: tuple: The type of every field of the sort key, e.g. (str, str, int), or a tuple of types
+    :return: The sort key as a tuple
+    :doc-author: Trelent
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as err:
+        raise ValueError('Invalid cursor') from err
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError('Invalid cursor')
+    for value, kind in zip(key, types):
+        # JSON true and false decode to bool, a subclass of int, but no sort key has a boolean field
+        if isinstance(value, bool) or not isinstance(value, kind):
+            raise ValueError('Invalid cursor')
+    return tuple(key)
@@ -0,0 +1,164 @@
+import logging
+import math
+import time
+
+from fastapi import HTTPException, Request, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.lru import LRUCache
+from src.services.metrics import RATE_LIMIT_DECISIONS, RATE_LIMIT_DURATION
+from src.services.redis_client import RedisErrorLog
+
+log_redis_error = RedisErrorLog(logging.getLogger(__name__))
+
+# GCRA: the key holds the theoretical arrival time (TAT) in ms. A request is admitted while the TAT stays
+# within one period of now, so up to `times` requests may come at once and then one every `interval` ms.
+# More than one request can be admitted in one call, to lease tokens to the in-process tier.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local now = redis.call('TIME')
+now = now[1] * 1000 + math.floor(now[2] / 1000)
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local available = math.floor((period - (tat - now)) / interval)
+if available < 1 then
+    return {0, math.ceil(tat - now - period + interval)}
+end
+local granted = math.min(wanted, available)
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil(tat - now))
+return {granted, 0}
+"""
+
+
+class Limiter:
+    """
+    Rate limiter shared by all routes. Every decision is one atomic GCRA script call in Redis.
+    With local_batch above 1, a call admits up to local_batch requests at once and the spare ones are kept
+    in process as a lease, so a busy client costs one Redis round trip per local_batch requests; a lease
+    is dropped after one period. When Redis is unavailable requests are let through.
+    """
+
+    def __init__(self, client: Redis | None, local_batch: int, local_size: int):
+        self.client = client
+        self.local_batch = max(local_batch, 1)
+        self.leases = LRUCache(maxsize=local_size if local_batch > 1 else 0, ttl=0)
+        self.allowed = 0
+        self.denied = 0
+        self.local = 0
+        self.calls = 0
+        self.errors = 0
+        self.call_ms = 0.0
+
+    @property
+    def client(self) -> Redis | None:
+        return self._client
+
+    @client.setter
+    def client(self, client: Redis | None):
+        self._client = client
+        self.script = client.register_script(GCRA_SCRIPT) if client is not None else None
+
+    async def acquire(self, key: str, times: int, seconds: float) -> float:
+        """
+        The acquire function admits one request of key under the limit of times requests per seconds.
+
+        :param self: Represent the instance of the class
+        :param key: str: The bucket, e.g. the route and the user
+        :param times: int: How many requests are allowed per period
+        :param seconds: float: The period
+        :return: 0 if the request is admitted, otherwise the seconds to wait before the next one would be
+        :doc-author: Trelent
+        """
+        lease = self.leases.get(key)
+        if lease:
+            lease[0] -= 1
+            if not lease[0]:
+                self.leases.pop(key)
+            self.local += 1
+            self.allowed += 1
+            RATE_LIMIT_DECISIONS.labels("local").inc()
+            return 0
+        period = seconds * 1000
+        start = time.perf_counter()
+        try:
+            granted, retry_after = await self.script(keys=[key], args=[period / times, period, self.local_batch])
+        except RedisError as err:
+            self.errors += 1
+            RATE_LIMIT_DECISIONS.labels("error").inc()
+            log_redis_error(err)
+            return 0
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.call_ms += elapsed * 1000
+            RATE_LIMIT_DURATION.observe(elapsed)
+        if not granted:
+            self.denied += 1
+            RATE_LIMIT_DECISIONS.labels("denied").inc()
+            return retry_after / 1000
+        if granted > 1:
+            self.leases.set(key, [granted - 1], ttl=seconds)
+        self.allowed += 1
+        RATE_LIMIT_DECISIONS.labels("allowed").inc()
+        return 0
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "denied": self.denied, "local": self.local, "redis_calls": self.calls,
+                "errors": self.errors, "redis_avg_ms": self.call_ms / self.calls if self.calls else 0.0}
+
+
+def parse_limit(limit: str) -> tuple:
+    """
+    The parse_limit function reads a limit written as times/seconds, e.g. 10/60 for 10 requests per minute.
+
+    :param limit: str: The limit
+    :return: A tuple of times and seconds
+    :doc-author: Trelent
+    """
+    times, seconds = limit.split('/')
+    return int(times), float(seconds)
+
+
+def client_key(request: Request) -> str:
+    """
+    The client_key function identifies who a request counts against: the subject of a valid access token,
+    or the client address for anonymous requests. Verified tokens come from the auth token cache.
+
+    :param request: Request: The request
+    :return: The identity of the client
+    :doc-author: Trelent
+    """
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        email = auth_service.verify_access_token(token)
+        if email is not None:
+            return f'user:{email}'
+    return f'ip:{request.client.host if request.client else "unknown"}'
+
+
+class RateLimit:
+    """
+    Route dependency that applies the limit configured for name in settings.rate_limits, or
+    settings.rate_limit_default; a limit of 0 requests disables it. Every route name has its own bucket per client.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.times, self.seconds = parse_limit(settings.rate_limits.get(name, settings.rate_limit_default))
+
+    async def __call__(self, request: Request):
+        if self.times <= 0:
+            return
+        retry_after = await limiter.acquire(f'rl:{self.name}:{client_key(request)}', self.times, self.seconds)
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+# the Redis client is set on startup, see main.py
+limiter = Limiter(None, settings.rate_limit_local_batch, settings.rate_limit_local_size)
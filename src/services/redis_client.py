@@ -0,0 +1,168 @@
+import logging
+import time
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.services.metrics import REDIS_COMMAND_DURATION, REDIS_COMMAND_ERRORS
+
+
+class CommandStats:
+    """Call count and latency of every Redis command sent through a MonitoredRedis client."""
+
+    def __init__(self):
+        self.commands = {}
+
+    def record(self, command: str, elapsed: float, failed: bool):
+        """
+        The record function adds one command round trip to the counters.
+
+        :param self: Represent the instance of the class
+        :param command: str: The Redis command, e.g. GET
+        :param elapsed: float: Seconds the round trip took
+        :param failed: bool: Whether the command raised an error
+        :return: None
+        :doc-author: Trelent
+        """
+        stats = self.commands.setdefault(command, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += failed
+        stats["total_ms"] += elapsed * 1000
+        stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+
+    def summary(self) -> dict:
+        return {command: dict(stats, avg_ms=stats["total_ms"] / stats["calls"])
+                for command, stats in self.commands.items()}
+
+
+class RedisErrorLog:
+    """
+    Logs the Redis errors of one module at warning level, at most once every interval seconds. While Redis is
+    down every command fails, so the errors in between are only counted and reported with the next warning.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float | None = None):
+        self.logger = logger
+        self.interval = settings.redis_error_log_interval if interval is None else interval
+        self.logged_at = None
+        self.suppressed = 0
+
+    def __call__(self, err: Exception):
+        """
+        The __call__ function reports one Redis error.
+
+        :param self: Represent the instance of the class
+        :param err: Exception: The error Redis raised
+        :return: None
+        :doc-author: Trelent
+        """
+        now = time.monotonic()
+        if self.logged_at is not None and now - self.logged_at < self.interval:
+            self.suppressed += 1
+            return
+        if self.suppressed:
+            self.logger.warning("Redis error: %s (%d more since the last report)", err, self.suppressed)
+        else:
+            self.logger.warning("Redis error: %s", err)
+        self.logged_at, self.suppressed = now, 0
+
+
+class MonitoredRedis(redis.Redis):
+    """redis.asyncio client that measures the latency of every command it executes, also for /metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = CommandStats()
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            command = (args[0] if isinstance(args[0], str) else args[0].decode()).upper()
+            elapsed = time.perf_counter() - start
+            self.stats.record(command, elapsed, failed)
+            REDIS_COMMAND_DURATION.labels(command).observe(elapsed)
+            if failed:
+                REDIS_COMMAND_ERRORS.labels(command).inc()
+
+
+class MonitoredConnectionPool(redis.BlockingConnectionPool):
+    """BlockingConnectionPool that keeps count of its connections itself, so the status reads no redis-py internals."""
+
+    def reset(self):
+        super().reset()
+        self.created = 0
+        self.checked_out = set()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.created += 1
+        return connection
+
+    async def get_connection(self, command_name, *keys, **options):
+        connection = await super().get_connection(command_name, *keys, **options)
+        self.checked_out.add(connection)
+        return connection
+
+    async def release(self, connection):
+        # get_connection releases a connection that failed to connect before it was ever checked out
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
+
+def create_redis() -> MonitoredRedis:
+    """
+    The create_redis function builds the Redis client shared by auth, the rate limiter and the caches;
+        the application creates it on startup and closes it on shutdown, see main.py.
+        Connections are opened lazily from one bounded pool; when all max connections are busy, a command
+        waits up to redis_pool_timeout seconds for a free one instead of opening more.
+
+    :return: A Redis client
+    :doc-author: Trelent
+    """
+    pool = MonitoredConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=0,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+    )
+    return MonitoredRedis(connection_pool=pool)
+
+
+def redis_status(client: MonitoredRedis) -> dict:
+    """
+    The redis_status function reports the connection pool usage and command latencies of the client.
+
+    :param client: MonitoredRedis: The Redis client
+    :return: A dictionary with the pool size, connections in use and per-command stats
+    :doc-author: Trelent
+    """
+    pool = client.connection_pool
+    in_use = len(pool.checked_out)
+    return {
+        "max_connections": pool.max_connections,
+        "connections": pool.created,
+        "in_use": in_use,
+        "idle": pool.created - in_use,
+        "commands": client.stats.summary(),
+    }
+
+
+async def close_redis(client: MonitoredRedis):
+    """
+    The close_redis function closes the client and every pooled connection, used on application shutdown.
+
+    :param client: MonitoredRedis: The Redis client
+    :return: None
+    :doc-author: Trelent
+    """
+    await client.close()
+    await client.connection_pool.disconnect()
+
@@ -0,0 +1,12 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with orjson, compact and UTF-8 like the default encoding of FastAPI.
+    Bytes are taken to be JSON already, e.g. a body from the contacts cache, and sent as they are.
+    """
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else orjson.dumps(content)
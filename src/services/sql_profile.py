@@ -0,0 +1,135 @@
+import heapq
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.services.metrics import route_template
+
+logger = logging.getLogger("sql_profile")
+
+# The profile of the request being handled. SQLAlchemy runs the cursor events of an AsyncSession in a greenlet
+# that shares the context of the calling task, so statements are attributed to the request that issued them.
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+class QueryProfile:
+    """The SQL statements issued while handling one request: how many, how long, and which repeat."""
+
+    def __init__(self, slowest: int):
+        self.queries = 0
+        self.total = 0.0
+        self.statements = {}
+        self.slowest = []
+        self.keep = slowest
+
+    def record(self, statement: str, elapsed: float):
+        """
+        The record function adds one executed statement to the profile.
+
+        :param self: Represent the instance of the class
+        :param statement: str: The SQL text, with placeholders for the parameters
+        :param elapsed: float: Seconds the statement took
+        :return: None
+        :doc-author: Trelent
+        """
+        self.queries += 1
+        self.total += elapsed
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, (elapsed, self.queries, statement))
+        elif self.keep:
+            heapq.heappushpop(self.slowest, (elapsed, self.queries, statement))
+
+    def suspects(self, threshold: int) -> dict:
+        """
+        The suspects function lists the statements run at least threshold times. The same SQL text issued again
+        and again with other parameters is the signature of an N+1 pattern, e.g. a lazy load per row.
+
+        :param self: Represent the instance of the class
+        :param threshold: int: How many runs of one statement make it suspect
+        :return: A dictionary of the suspect statements and how many times each ran
+        :doc-author: Trelent
+        """
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+    def summary(self, threshold: int, budget: int) -> dict:
+        return {
+            "queries": self.queries,
+            "time_ms": round(self.total * 1000, 3),
+            "over_budget": bool(budget) and self.queries > budget,
+            "slowest": [{"statement": statement, "ms": round(elapsed * 1000, 3)}
+                        for elapsed, _, statement in sorted(self.slowest, reverse=True)],
+            "suspects": [{"statement": statement, "count": count}
+                         for statement, count in self.suspects(threshold).items()],
+        }
+
+
+def profile_engine(engine: Engine):
+    """
+    The profile_engine function attributes every SQL statement of an engine to the profile of the current request.
+    Outside of a profiled request the listeners return at once. For an AsyncEngine pass engine.sync_engine.
+
+    :param engine: Engine: The engine to profile
+    :return: None
+    :doc-author: Trelent
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and current_profile.get() is not None:
+            context.profile_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        start = getattr(context, "profile_start", None)
+        if profile is not None and start is not None:
+            profile.record(statement, time.perf_counter() - start)
+
+
+class SQLProfileMiddleware:
+    """
+    ASGI middleware that profiles the SQL of every request when settings.sql_profile is on. The query count,
+    DB time and number of N+1 suspects go into the X-SQL-Queries, X-SQL-Time-Ms and X-SQL-Suspects headers.
+    Statements issued after the headers were sent, e.g. while a response streams, are only in the log.
+    Every request is logged to the sql_profile logger as one JSON line, at warning level when it has
+    N+1 suspects or exceeds settings.sql_query_budget.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.sql_profile:
+            await self.app(scope, receive, send)
+            return
+        profile = QueryProfile(settings.sql_slowest)
+        route = route_template(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-SQL-Queries"] = str(profile.queries)
+                headers["X-SQL-Time-Ms"] = f"{profile.total * 1000:.3f}"
+                headers["X-SQL-Suspects"] = str(len(profile.suspects(settings.sql_repeat_threshold)))
+            await send(message)
+
+        token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            summary = profile.summary(settings.sql_repeat_threshold, settings.sql_query_budget)
+            level = logging.WARNING if summary["suspects"] or summary["over_budget"] else logging.INFO
+            logger.log(level, json.dumps(dict(method=scope["method"], route=route,
+                                              status=status_code, **summary)))
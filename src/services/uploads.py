@@ -0,0 +1,30 @@
+from typing import Dict
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# room for the multipart boundaries and part headers around an uploaded file
+FORM_OVERHEAD = 16 * 1024
+
+
+class ContentLengthLimitMiddleware:
+    """
+    ASGI middleware that answers 413 to a request whose Content-Length exceeds the limit of its path,
+    before any of the body is read. A route with an UploadFile parameter otherwise only sees the file
+    after Starlette has spooled the whole form; the route still caps what it reads, for chunked uploads.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is not None:
+            content_length = Headers(scope=scope).get("content-length", "")
+            if content_length.isdigit() and int(content_length) > limit:
+                response = JSONResponse({"detail": f"Request body is larger than {limit} bytes"}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,11 +1,16 @@
+from unittest.mock import MagicMock, patch
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
-from src.database.models import Base
-from src.database.db import get_db
+from src.database.models import Base, User
+from src.database.db import get_db, get_primary_db
+from src.services.sql_profile import profile_engine
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -15,6 +20,13 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request in its own event loop, so the app side gets fresh aiosqlite connections
+async_engine = create_async_engine(
+    "sqlite+aiosqlite:///./test.db", poolclass=NullPool
+)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+profile_engine(async_engine.sync_engine)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -34,17 +46,51 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_primary_db] = override_get_db
 
-    yield TestClient(app)
+    # the startup handler creates the shared Redis client
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture(scope="module")
 def user():
     return {"username": "deadpool", "email": "deadpool@example.com", "password": "123456789"}
+
+
+class FakeRedis:
+    """The Redis commands of the contacts cache on a dictionary; unlike fakeredis it works across event loops."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode() if isinstance(value, (str, int)) else value
+        return True
+
+
+@pytest.fixture(scope="module")
+def sign_in(client, session):
+    # signs up, confirms and logs in a user, returning the Authorization header of the access token
+
+    def sign_in(username: str) -> dict:
+        user = {"username": username, "email": f"{username}@example.com", "password": "12345678"}
+        with patch("src.routes.auth.send_email", MagicMock()):
+            client.post("/api/auth/signup", json=user)
+        session.query(User).filter(User.email == user["email"]).update({"confirmed": True})
+        session.commit()
+        response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return sign_in
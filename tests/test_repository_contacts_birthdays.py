@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import get_birthday_contacts
+
+
+class TestBirthdayContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "birthdays.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(email='usertest@gmail.com', password='secret')
+        self.session.add(self.user)
+        await self.session.flush()
+        birth_dates = {'Dec28': date(1990, 12, 28), 'Dec31': date(1985, 12, 31), 'Jan01': date(2000, 1, 1),
+                       'Jan03': date(1970, 1, 3), 'Jan10': date(1995, 1, 10), 'Feb29': date(1996, 2, 29),
+                       'Jun15': date(1980, 6, 15)}
+        self.session.add_all(Contact(first_name=name, last_name='Contact', email=f'{name}@example.com',
+                                     birth_date=birth_date, user_id=self.user.id)
+                             for name, birth_date in birth_dates.items())
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def names(self, days, today):
+        contacts = await get_birthday_contacts(days, self.user, self.session, today=today)
+        return [contact.first_name for contact in contacts]
+
+    async def test_window_inside_year(self):
+        self.assertEqual(await self.names(7, date(2023, 6, 10)), ['Jun15'])
+
+    async def test_window_crosses_new_year(self):
+        self.assertEqual(await self.names(7, date(2023, 12, 27)), ['Dec28', 'Dec31', 'Jan01', 'Jan03'])
+
+    async def test_configurable_window(self):
+        self.assertEqual(await self.names(14, date(2023, 12, 27)), ['Dec28', 'Dec31', 'Jan01', 'Jan03', 'Jan10'])
+
+    async def test_leap_day_in_common_year(self):
+        self.assertEqual(await self.names(3, date(2023, 2, 27)), ['Feb29'])
+
+    async def test_today_only(self):
+        self.assertEqual(await self.names(0, date(2024, 12, 31)), ['Dec31'])
+
+    async def test_whole_year_sorted_by_next_occurrence(self):
+        self.assertEqual(await self.names(365, date(2023, 6, 1)),
+                         ['Jun15', 'Dec28', 'Dec31', 'Jan01', 'Jan03', 'Jan10', 'Feb29'])
+
+
+if __name__ == '__main__':
+    unittest.main()
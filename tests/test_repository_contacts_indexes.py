@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import get_contacts, get_contact, get_contacts_page, get_birthday_contacts
+
+
+class TestContactsIndexes(unittest.IsolatedAsyncioTestCase):
+    """Runs the repository queries against SQLite and checks EXPLAIN QUERY PLAN for index usage."""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "indexes.db"))
+        self.statements = []
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            # Postgres LIKE is case sensitive; SQLite only uses an index for LIKE prefixes in this mode
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA case_sensitive_like = ON")
+            cursor.close()
+
+        @event.listens_for(self.engine.sync_engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                self.statements.append((statement, parameters))
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        users = [User(email=f'user{i}@example.com', password='secret') for i in range(10)]
+        self.session.add_all(users)
+        await self.session.flush()
+        self.session.add_all(Contact(first_name=f'First{i}', last_name=f'Last{i}', email=f'contact{i}@example.com',
+                                     birth_date=date(1990, 1, 1), user_id=users[i % 10].id) for i in range(500))
+        await self.session.commit()
+        await self.session.execute(text("ANALYZE"))
+        self.user = users[0]
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def query_plan(self):
+        statement, parameters = self.statements[-1]
+        connection = await self.session.connection()
+        plan = await connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        return " | ".join(row[-1] for row in plan)
+
+    def assertIndexScan(self, plan):
+        self.assertRegex(plan, r"SEARCH contacts USING (COVERING )?(INDEX ix_contacts_user_id_\w+|INTEGER PRIMARY KEY)")
+        self.assertNotIn("SCAN contacts", plan)
+
+    async def test_get_contacts_uses_index(self):
+        await get_contacts(10, 0, None, None, None, None, self.user, self.session)
+        self.assertIndexScan(await self.query_plan())
+
+    async def test_get_contacts_first_name_prefix_uses_index(self):
+        await get_contacts(10, 0, None, 'First1', None, None, self.user, self.session)
+        plan = await self.query_plan()
+        self.assertIndexScan(plan)
+        self.assertIn("first_name>", plan)
+
+    async def test_get_contacts_last_name_prefix_uses_index(self):
+        await get_contacts(10, 0, None, None, 'Last1', None, self.user, self.session)
+        plan = await self.query_plan()
+        self.assertIndexScan(plan)
+        self.assertIn("last_name>", plan)
+
+    async def test_get_contacts_email_prefix_uses_index(self):
+        await get_contacts(10, 0, None, None, None, 'contact1', self.user, self.session)
+        plan = await self.query_plan()
+        self.assertIndexScan(plan)
+        self.assertIn("email>", plan)
+
+    async def test_get_contacts_page_uses_sort_index(self):
+        await get_contacts_page(10, ('Last1', 'First1', 1), None, None, None, None, self.user, self.session)
+        plan = await self.query_plan()
+        self.assertIndexScan(plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    async def test_get_birthday_contacts_uses_index(self):
+        await get_birthday_contacts(7, self.user, self.session, today=date(2023, 3, 1))
+        plan = await self.query_plan()
+        self.assertIndexScan(plan)
+        self.assertIn("birth_day>", plan)
+
+    async def test_get_contact_uses_index(self):
+        await get_contact(1, self.user, self.session)
+        self.assertIndexScan(await self.query_plan())
+
+
+if __name__ == '__main__':
+    unittest.main()
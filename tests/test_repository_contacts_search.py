@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import search_contacts, search_terms
+
+
+class TestSearchContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "search.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user, other = User(email='usertest@gmail.com', password='secret'), User(email='other', password='x')
+        self.session.add_all([self.user, other])
+        await self.session.flush()
+        names = [('John', 'Smith', '380501234567'), ('Jonas', 'Smithers', ''), ('Joe', 'Black', ''),
+                 ('Anna', 'Johnson', '380671112233')]
+        self.session.add_all(Contact(first_name=first, last_name=last, email=f'{first.lower()}@example.com',
+                                     birth_date=date(1990, 1, 1), phone=phone, user_id=self.user.id)
+                             for first, last, phone in names)
+        self.session.add(Contact(first_name='John', last_name='Smith', email='john@example.com',
+                                 birth_date=date(1990, 1, 1), user_id=other.id))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def names(self, q, limit=10, after=None):
+        contacts, next_key = await search_contacts(q, limit, after, self.user, self.session)
+        return [contact.first_name for contact in contacts], next_key
+
+    def test_search_terms(self):
+        self.assertEqual(search_terms('Jo  Smi!'), ['jo', 'smi'])
+        self.assertEqual(search_terms('"*" OR -'), ['or'])
+
+    async def test_every_word_is_a_prefix(self):
+        names, next_key = await self.names('jo smi')
+        self.assertEqual(sorted(names), ['John', 'Jonas'])
+        self.assertIsNone(next_key)
+
+    async def test_best_match_first(self):
+        names, _ = await self.names('john')
+        self.assertEqual(names[0], 'John')
+        self.assertEqual(sorted(names), ['Anna', 'John'])
+
+    async def test_email_and_phone(self):
+        self.assertEqual((await self.names('joe@example'))[0], ['Joe'])
+        self.assertEqual((await self.names('38067'))[0], ['Anna'])
+
+    async def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(await self.names('"*'), ([], None))
+        self.assertEqual((await self.names('smith OR black'))[0], [])
+
+    async def test_keyset_pages(self):
+        seen, after = [], None
+        while True:
+            names, after = await self.names('example', limit=1, after=after)
+            seen += names
+            if after is None:
+                break
+        self.assertEqual(sorted(seen), ['Anna', 'Joe', 'John', 'Jonas'])
+
+    async def test_index_follows_writes(self):
+        await self.session.execute(update(Contact).filter(Contact.first_name == 'Joe').values(last_name='Smithson'))
+        await self.session.execute(delete(Contact).filter(Contact.first_name == 'Jonas'))
+        await self.session.commit()
+        names, _ = await self.names('jo smi')
+        self.assertEqual(sorted(names), ['Joe', 'John'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import create_contact, update_contact, update_favorite_contact, remove_contact, \
+    update_favorite_contacts, update_contacts, remove_contacts
+from src.schemas import ContactModel, ContactFavoriteStatus, ContactBatchItem
+
+
+class ContactWritesTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "writes.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user, self.other = User(email='usertest@gmail.com', password='secret'), User(email='other', password='x')
+        self.session.add_all([self.user, self.other])
+        await self.session.commit()
+        self.body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
+                                 birth_date=date(1990, 12, 24), phone='123')
+        self.statements = []
+        event.listen(self.engine.sync_engine, 'before_cursor_execute', self.record)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.split()[0])
+
+
+class TestContactWrites(ContactWritesTestCase):
+
+    async def test_create_is_one_statement(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.assertEqual(self.statements, ['INSERT'])
+        self.assertEqual((contact.first_name, contact.birth_day, contact.favorite, contact.user_id),
+                         ('User', 1224, False, self.user.id))
+        self.assertIsNotNone(contact.id)
+
+    async def test_update_is_one_statement(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.statements.clear()
+        body = self.body.copy(update={'first_name': 'Changed', 'birth_date': date(1990, 1, 5)})
+        updated = await update_contact(body, contact.id, self.user, self.session)
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertEqual((updated.first_name, updated.birth_day), ('Changed', 105))
+
+    async def test_update_favorite_is_one_statement(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.statements.clear()
+        updated = await update_favorite_contact(ContactFavoriteStatus(favorite=True), contact.id, self.user,
+                                                self.session)
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertTrue(updated.favorite)
+
+    async def test_remove_is_one_statement(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.statements.clear()
+        removed = await remove_contact(contact.id, self.user, self.session)
+        self.assertEqual(self.statements, ['DELETE'])
+        self.assertEqual(removed.email, 'usertest@gmail.com')
+        self.assertIsNone(await remove_contact(contact.id, self.user, self.session))
+
+    async def test_other_users_contact_is_not_found(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.assertIsNone(await update_contact(self.body, contact.id, self.other, self.session))
+        self.assertIsNone(await update_favorite_contact(ContactFavoriteStatus(favorite=True), contact.id, self.other,
+                                                        self.session))
+        self.assertIsNone(await remove_contact(contact.id, self.other, self.session))
+
+    async def test_writes_bump_version(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        self.assertEqual(contact.version, 1)
+        updated = await update_contact(self.body, contact.id, self.user, self.session)
+        self.assertEqual(updated.version, 2)
+        updated = await update_favorite_contact(ContactFavoriteStatus(favorite=True), contact.id, self.user,
+                                                self.session)
+        self.assertEqual(updated.version, 3)
+
+    async def test_write_with_stale_version_changes_nothing(self):
+        contact = await create_contact(self.body, self.user, self.session)
+        body = self.body.copy(update={'first_name': 'Changed'})
+        self.assertIsNone(await update_contact(body, contact.id, self.user, self.session, [2]))
+        self.assertIsNone(await remove_contact(contact.id, self.user, self.session, []))
+        self.statements.clear()
+        updated = await update_contact(body, contact.id, self.user, self.session, [1])
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertEqual((updated.first_name, updated.version), ('Changed', 2))
+        self.assertIsNotNone(await remove_contact(contact.id, self.user, self.session, [2]))
+
+
+class TestContactBatchWrites(ContactWritesTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.contacts = []
+        for i in range(3):
+            body = self.body.copy(update={'email': f'user{i}@example.com'})
+            self.contacts.append(await create_contact(body, self.user, self.session))
+        self.other_contact = await create_contact(self.body, self.other, self.session)
+        self.ids = [contact.id for contact in self.contacts]
+        self.statements.clear()
+
+    async def test_update_favorite_contacts(self):
+        found = await update_favorite_contacts(self.ids + [self.other_contact.id, 999], True, self.user, self.session)
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertEqual(found, set(self.ids))
+        favorites = await self.session.execute(select(Contact.id).filter(Contact.favorite.is_(True)))
+        self.assertEqual(set(favorites.scalars().all()), set(self.ids))
+        versions = await self.session.execute(select(Contact.id, Contact.version))
+        self.assertEqual(dict(versions.all()), {**{contact_id: 2 for contact_id in self.ids},
+                                                self.other_contact.id: 1})
+
+    async def test_update_contacts_with_own_values(self):
+        bodies = [ContactBatchItem(id=contact_id, first_name=f'Name{contact_id}', last_name='Changed',
+                                   email=f'changed{contact_id}@example.com', birth_date=date(2000, 1, contact_id))
+                  for contact_id in self.ids + [self.other_contact.id]]
+        found = await update_contacts(bodies, self.user, self.session)
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertEqual(found, set(self.ids))
+        rows = await self.session.execute(select(Contact.id, Contact.first_name, Contact.birth_day)
+                                          .filter(Contact.user_id == self.user.id))
+        self.assertEqual(set(rows.all()), {(contact_id, f'Name{contact_id}', 100 + contact_id)
+                                           for contact_id in self.ids})
+        other = await self.session.execute(select(Contact.first_name).filter(Contact.id == self.other_contact.id))
+        self.assertEqual(other.scalar(), 'User')
+
+    async def test_remove_contacts(self):
+        found = await remove_contacts(self.ids[:2] + [self.other_contact.id], self.user, self.session)
+        self.assertEqual(self.statements, ['DELETE'])
+        self.assertEqual(found, set(self.ids[:2]))
+        left = await self.session.execute(select(Contact.id))
+        self.assertEqual(set(left.scalars().all()), {self.ids[2], self.other_contact.id})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, User
+from src.repository.users import update_avatar, update_password, update_token
+
+
+class TestUserWrites(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "users.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.SessionLocal = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.SessionLocal() as session:
+            session.add(User(email='usertest@gmail.com', password='secret'))
+            await session.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def load(self, session) -> User:
+        return (await session.execute(select(User))).scalars().one()
+
+    async def test_concurrent_writes_get_their_own_versions(self):
+        async with self.SessionLocal() as first, self.SessionLocal() as second:
+            first_user, second_user = await self.load(first), await self.load(second)
+            self.assertEqual((first_user.version, second_user.version), (1, 1))
+            await update_password(first_user, 'new hash', first)
+            await update_avatar('usertest@gmail.com', 'url', second)
+            second_user = await self.load(second)
+            self.assertEqual((first_user.version, second_user.version), (2, 3))
+        async with self.SessionLocal() as session:
+            user = await self.load(session)
+            self.assertEqual((user.password, user.avatar, user.version), ('new hash', 'url', 3))
+
+    async def test_token_keeps_version(self):
+        async with self.SessionLocal() as session:
+            user = await self.load(session)
+            await update_token(user, 'token', session)
+        async with self.SessionLocal() as session:
+            user = await self.load(session)
+            self.assertEqual((user.refresh_token, user.version), ('token', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 from unittest.mock import MagicMock
 
+from passlib.context import CryptContext
+
 from src.database.models import User
+from src.services.auth import auth_service
 
 
 def test_create_user(client, user, monkeypatch):
@@ -49,6 +52,20 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_rehashes_outdated_cost(client, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(user.get('password'))
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    session.refresh(current_user)
+    assert not auth_service.pwd_context.needs_update(current_user.password)
+    assert auth_service.pwd_context.verify(user.get('password'), current_user.password)
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
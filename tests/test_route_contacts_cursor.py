@@ -0,0 +1,45 @@
+import pytest
+
+from src.services.pagination import encode_cursor
+
+# Cursors that decode but do not hold a sort key; they must be rejected before they reach the query
+MALFORMED_LIST_CURSORS = [({"a": 1}, "x", 1), ("a", "b", [1]), ("a", "b", "1"), ("a", "b")]
+MALFORMED_SEARCH_CURSORS = [({"a": 1}, 1), ("0.5", 1), (0.5, 1.5), (0.5, None), (True, 1), (0.5,)]
+
+
+@pytest.fixture(scope="module")
+def headers(sign_in):
+    return sign_in("cursoruser")
+
+
+@pytest.mark.parametrize("key", MALFORMED_LIST_CURSORS)
+def test_get_contacts_malformed_cursor(client, headers, key):
+    response = client.get("/api/contacts/", params={"cursor": encode_cursor(key)}, headers=headers)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_contacts_valid_cursor(client, headers):
+    response = client.get("/api/contacts/", params={"cursor": encode_cursor(("a", "b", 1))}, headers=headers)
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize("key", MALFORMED_SEARCH_CURSORS)
+def test_search_contacts_malformed_cursor(client, headers, key):
+    response = client.get("/api/contacts/search", params={"q": "user", "cursor": encode_cursor(key)},
+                          headers=headers)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize("key", [(0.5, 1), (1, 1)])
+def test_search_contacts_valid_cursor(client, headers, key):
+    response = client.get("/api/contacts/search", params={"q": "user", "cursor": encode_cursor(key)},
+                          headers=headers)
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_get_contacts_limit_below_one(client, headers, limit):
+    response = client.get("/api/contacts/", params={"cursor": "", "limit": limit}, headers=headers)
+    assert response.status_code == 422, response.text
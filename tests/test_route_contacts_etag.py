@@ -0,0 +1,118 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from src.database.db import get_db
+from src.database.models import User
+from src.services import cache
+from src.services.auth import auth_service
+from src.services.cache import ContactsCache
+from conftest import FakeRedis, async_engine
+
+BODY = {"first_name": "Etag", "last_name": "Contact", "email": "etag@example.com", "birth_date": "1990-05-17"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def contacts_cache():
+    # TestClient runs every request in its own event loop, so a dictionary stands in for Redis
+    with patch.object(cache, "contacts_cache", ContactsCache(FakeRedis(), ttl=60)):
+        yield
+
+
+@pytest.fixture(scope="module")
+def headers(sign_in):
+    return sign_in("etaguser")
+
+
+@pytest.fixture()
+def contact(client, headers):
+    response = client.post("/api/contacts/", json=BODY, headers=headers)
+    assert response.status_code == 201, response.text
+    yield response.json()
+    client.delete(f"/api/contacts/{response.json()['id']}", headers=headers)
+
+
+def test_get_contact_not_modified(client, headers, contact):
+    response = client.get(f"/api/contacts/{contact['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+    assert etag == f'"{contact["id"]}.1"'
+    response = client.get(f"/api/contacts/{contact['id']}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_list_etag_changes_on_write(client, headers, contact):
+    response = client.get("/api/contacts/", headers=headers)
+    etag = response.headers["ETag"]
+    assert client.get("/api/contacts/", headers={**headers, "If-None-Match": etag}).status_code == 304
+    client.patch(f"/api/contacts/{contact['id']}", json={"favorite": True}, headers=headers)
+    response = client.get("/api/contacts/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["favorite"] is True
+
+
+def test_replica_reads_skip_cache_and_etag(client, headers, contact):
+    ReplicaSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False,
+                                             info={"replica": "test.db"})
+    primary_get_db = app.dependency_overrides[get_db]
+
+    async def override_get_db():
+        async with ReplicaSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        client.patch(f"/api/contacts/{contact['id']}", json={"favorite": True}, headers=headers)
+        cached = len(cache.contacts_cache.client.data)
+        response = client.get("/api/contacts/", headers=headers)
+        assert response.status_code == 200, response.text
+        assert "ETag" not in response.headers
+        assert len(cache.contacts_cache.client.data) == cached
+    finally:
+        app.dependency_overrides[get_db] = primary_get_db
+    response = client.get("/api/contacts/", headers=headers)
+    assert "ETag" in response.headers
+    assert len(cache.contacts_cache.client.data) == cached + 1
+
+
+def test_if_match(client, headers, contact):
+    url = f"/api/contacts/{contact['id']}"
+    body = {**BODY, "last_name": "Changed"}
+    response = client.put(url, json=body, headers={**headers, "If-Match": f'"{contact["id"]}.1"'})
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"] == f'"{contact["id"]}.2"'
+    response = client.put(url, json=BODY, headers={**headers, "If-Match": f'"{contact["id"]}.1"'})
+    assert response.status_code == 412, response.text
+    assert response.json()["detail"] == "Precondition Failed"
+    response = client.delete(url, headers={**headers, "If-Match": f'"{contact["id"]}.1"'})
+    assert response.status_code == 412, response.text
+    assert client.get(url, headers=headers).json()["last_name"] == "Changed"
+
+
+def test_if_match_missing_contact(client, headers):
+    response = client.patch("/api/contacts/9999", json={"favorite": True}, headers={**headers, "If-Match": '"9999.1"'})
+    assert response.status_code == 404, response.text
+
+
+def test_read_users_me_not_modified(client, headers):
+    response = client.get("/api/users/me/", headers=headers)
+    etag = response.headers["ETag"]
+    response = client.get("/api/users/me/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_confirmation_changes_users_me(client, session, sign_in):
+    headers = sign_in("etagconfirm")
+    etag = client.get("/api/users/me/", headers=headers).headers["ETag"]
+    session.query(User).filter(User.email == "etagconfirm@example.com").update({"confirmed": False})
+    session.commit()
+    token = auth_service.create_email_token({"sub": "etagconfirm@example.com"})
+    assert client.get(f"/api/auth/confirmed_email/{token}").json()["message"] == "Email confirmed"
+    response = client.get("/api/users/me/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.conf.config import settings
+from src.services import cache
+from src.services.cache import ContactsCache
+from conftest import FakeRedis
+
+QUERIES = [{}, {"limit": 3, "offset": 2}, {"favorite": True}, {"first_name": "Ол"}, {"email": "nobody"},
+           {"cursor": ""}, {"cursor": "", "limit": 4}]
+
+
+@pytest.fixture(scope="module")
+def headers(client, sign_in):
+    headers = sign_in("fastjson")
+    for i in range(10):
+        body = {"first_name": "Олена" if i % 3 else "Andrii", "last_name": f"Contact{i % 4}",
+                "email": f"fast{i}@example.com", "birth_date": f"19{70 + i}-0{i % 9 + 1}-1{i}",
+                "favorite": i % 2 == 0, "phone": f"+3809{i}" if i % 2 else ""}
+        assert client.post("/api/contacts/", json=body, headers=headers).status_code == 201
+    return headers
+
+
+def get_all(client, headers, fast: bool) -> list:
+    responses = []
+    with patch.object(settings, "contacts_fast_json", fast):
+        for params in QUERIES:
+            response = client.get("/api/contacts/", params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            responses.append((response.content, response.headers.get("X-Next-Cursor"),
+                              response.headers["Content-Type"]))
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor:
+                response = client.get("/api/contacts/", params={**params, "cursor": cursor}, headers=headers)
+                responses.append((response.content, response.headers.get("X-Next-Cursor"),
+                                  response.headers["Content-Type"]))
+    return responses
+
+
+def test_fast_json_is_identical(client, headers):
+    expected = get_all(client, headers, fast=False)
+    assert get_all(client, headers, fast=True) == expected
+    assert len(expected[0][0]) > 100
+
+
+def test_fast_json_is_identical_from_cache(client, headers):
+    expected = get_all(client, headers, fast=False)
+    with patch.object(cache, "contacts_cache", ContactsCache(FakeRedis(), ttl=60)):
+        assert get_all(client, headers, fast=True) == expected
+        assert cache.contacts_cache.hits == 0
+        assert get_all(client, headers, fast=True) == expected
+        assert cache.contacts_cache.hits == len(expected)
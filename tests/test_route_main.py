@@ -0,0 +1,30 @@
+def test_pool_status(client):
+    response = client.get("/api/healthchecker/pool")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["pool"] == "MonitoredQueuePool"
+    assert data["checked_out"] >= 0
+
+
+def test_metrics(client):
+    client.get("/api/healthchecker/pool")
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/api/healthchecker/pool",status="200"}' in response.text
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/api/healthchecker/pool"}' \
+        in response.text
+
+
+def test_redis_status(client):
+    response = client.get("/api/healthchecker/redis")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["in_use"] == 0
+    assert data["idle"] == data["connections"]
+
+
+def test_oversized_avatar_is_refused_before_reading(client):
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", b"x" * 10)},
+                            headers={"Content-Length": str(10 ** 9)})
+    assert response.status_code == 413, response.text
@@ -0,0 +1,113 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.conf.config import settings
+from src.database.models import User
+
+# The most SQL statements each route may issue, with a cold user cache. Raise a budget only together with
+# the change that needs the extra query; a route over its budget usually has a lazy load or a query in a loop.
+BUDGETS = {
+    "POST /api/auth/signup": 3,
+    "POST /api/auth/login": 2,
+    "GET /api/auth/refresh_token": 2,
+    "GET /api/users/me/": 1,
+    "POST /api/contacts/": 2,
+    "GET /api/contacts/": 2,
+    "GET /api/contacts/search": 2,
+    "GET /api/contacts/{contact_id}": 2,
+    "PUT /api/contacts/{contact_id}": 2,
+    "PATCH /api/contacts/{contact_id}": 2,
+    "PATCH /api/contacts/batch/favorite": 2,
+    "DELETE /api/contacts/{contact_id}": 2,
+    "GET /api/birthdays/": 2,
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def sql_profile():
+    with patch.object(settings, "sql_profile", True), patch("src.routes.auth.send_email", MagicMock()):
+        yield
+
+
+@pytest.fixture(scope="module")
+def tokens(client, session):
+    user = {"username": "budget", "email": "budget@example.com", "password": "12345678"}
+    response = client.post("/api/auth/signup", json=user)
+    assert_budget(response, "POST /api/auth/signup")
+    session.query(User).filter(User.email == user["email"]).update({"confirmed": True})
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    assert_budget(response, "POST /api/auth/login")
+    return response.json()
+
+
+@pytest.fixture(scope="module")
+def contact(client, tokens):
+    body = {"first_name": "Budget", "last_name": "Contact", "email": "contact@example.com",
+            "birth_date": "1990-05-17"}
+    response = client.post("/api/contacts/", json=body, headers=auth(tokens))
+    assert_budget(response, "POST /api/contacts/")
+    return response.json()
+
+
+def auth(tokens: dict) -> dict:
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def assert_budget(response, route: str):
+    assert response.status_code < 400, response.text
+    queries = int(response.headers["X-SQL-Queries"])
+    assert queries <= BUDGETS[route], f"{route} issued {queries} SQL statements, budget {BUDGETS[route]}"
+    assert response.headers["X-SQL-Suspects"] == "0", f"{route} repeats a statement"
+
+
+def test_refresh_token(client, tokens):
+    response = client.get("/api/auth/refresh_token",
+                          headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert_budget(response, "GET /api/auth/refresh_token")
+    tokens.update(response.json())
+
+
+def test_read_users_me(client, tokens):
+    assert_budget(client.get("/api/users/me/", headers=auth(tokens)), "GET /api/users/me/")
+
+
+def test_get_contacts(client, tokens, contact):
+    assert_budget(client.get("/api/contacts/", headers=auth(tokens)), "GET /api/contacts/")
+    assert_budget(client.get("/api/contacts/", params={"cursor": ""}, headers=auth(tokens)), "GET /api/contacts/")
+
+
+def test_search_contacts(client, tokens, contact):
+    response = client.get("/api/contacts/search", params={"q": "budg"}, headers=auth(tokens))
+    assert_budget(response, "GET /api/contacts/search")
+
+
+def test_get_contact(client, tokens, contact):
+    response = client.get(f"/api/contacts/{contact['id']}", headers=auth(tokens))
+    assert_budget(response, "GET /api/contacts/{contact_id}")
+
+
+def test_update_contact(client, tokens, contact):
+    body = {"first_name": "Budget", "last_name": "Changed", "email": "contact@example.com",
+            "birth_date": "1990-05-17"}
+    response = client.put(f"/api/contacts/{contact['id']}", json=body, headers=auth(tokens))
+    assert_budget(response, "PUT /api/contacts/{contact_id}")
+    response = client.patch(f"/api/contacts/{contact['id']}", json={"favorite": True}, headers=auth(tokens))
+    assert_budget(response, "PATCH /api/contacts/{contact_id}")
+
+
+def test_update_favorite_contacts(client, tokens, contact):
+    response = client.patch("/api/contacts/batch/favorite", json={"ids": [contact["id"]], "favorite": False},
+                            headers=auth(tokens))
+    assert_budget(response, "PATCH /api/contacts/batch/favorite")
+
+
+def test_birthdays(client, tokens, contact):
+    response = client.get("/api/birthdays/", params={"days": 365}, headers=auth(tokens))
+    assert_budget(response, "GET /api/birthdays/")
+
+
+def test_remove_contact(client, tokens, contact):
+    response = client.delete(f"/api/contacts/{contact['id']}", headers=auth(tokens))
+    assert_budget(response, "DELETE /api/contacts/{contact_id}")
@@ -0,0 +1,80 @@
+import io
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import UploadFile
+from PIL import Image
+
+from src.services import avatars
+from src.services.avatars import (
+    AvatarTooLarge,
+    InvalidImage,
+    CloudinaryStorage,
+    LocalStorage,
+    read_upload,
+    resize_image,
+    save_avatar,
+)
+
+
+def image_bytes(width, height, format='PNG'):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, format=format)
+    return output.getvalue()
+
+
+class TestAvatars(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.root = Path(tempfile.mkdtemp())
+        self.storage = LocalStorage(self.root, '/static/avatars/', self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_resize_crops_to_square_jpeg(self):
+        avatar = Image.open(io.BytesIO(resize_image(image_bytes(800, 400), 250, 10_000_000)))
+        self.assertEqual((avatar.format, avatar.size), ('JPEG', (250, 250)))
+
+    def test_resize_rejects_invalid_image(self):
+        with self.assertRaises(InvalidImage):
+            resize_image(b'not an image', 250, 10_000_000)
+
+    def test_resize_rejects_too_many_pixels(self):
+        with self.assertRaises(InvalidImage):
+            resize_image(image_bytes(200, 200), 250, 100 * 100)
+
+    async def test_read_upload_stops_at_cap(self):
+        upload = UploadFile(io.BytesIO(b'x' * 200_000), filename='a.png')
+        with self.assertRaises(AvatarTooLarge):
+            await read_upload(upload, 100_000)
+        self.assertLess(upload.file.tell(), 200_000)
+
+    async def test_local_storage(self):
+        url = await self.storage.save('1', b'jpeg')
+        self.assertTrue(url.startswith('/static/avatars/1.jpg?v='))
+        self.assertEqual((self.root / '1.jpg').read_bytes(), b'jpeg')
+        self.assertNotEqual(await self.storage.save('1', b'other'), url)
+
+    async def test_cloudinary_storage_uploads_in_executor(self):
+        storage = CloudinaryStorage('NotesApp', self.executor)
+        with patch('src.services.avatars.cloudinary.uploader.upload',
+                   return_value={'secure_url': 'https://res.cloudinary.com/x/v1/NotesApp/1.jpg'}) as upload:
+            url = await storage.save('1', b'jpeg')
+        self.assertEqual(url, 'https://res.cloudinary.com/x/v1/NotesApp/1.jpg')
+        self.assertEqual(upload.call_args.kwargs, {'public_id': 'NotesApp/1', 'overwrite': True})
+
+    async def test_save_avatar(self):
+        upload = UploadFile(io.BytesIO(image_bytes(300, 300, 'GIF')), filename='a.gif')
+        with patch.object(avatars, 'avatar_executor', self.executor):
+            url = await save_avatar(upload, '7', self.storage)
+        self.assertTrue(url.startswith('/static/avatars/7.jpg'))
+        self.assertEqual(Image.open(self.root / '7.jpg').size, (250, 250))
+
+
+if __name__ == '__main__':
+    unittest.main()
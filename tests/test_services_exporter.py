@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import stream_contacts
+from src.services.exporter import export_contacts, FIELDS
+
+
+class TestExportContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "export.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user, other = User(email='usertest@gmail.com', password='secret'), User(email='other', password='x')
+        self.session.add_all([self.user, other])
+        await self.session.flush()
+        self.session.add_all(Contact(first_name=f'User{i}', last_name='Contact, "Jr"', email=f'user{i}@example.com',
+                                     birth_date=date(1990, 1, i % 28 + 1), favorite=bool(i % 2), phone='',
+                                     user_id=self.user.id) for i in range(25))
+        self.session.add(Contact(first_name='Other', last_name='Contact', email='other@example.com',
+                                 birth_date=date(1990, 1, 1), user_id=other.id))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def export(self, fmt):
+        chunks = [chunk async for chunk in
+                  export_contacts(stream_contacts(self.user, self.session, batch_size=10), fmt)]
+        return chunks, b''.join(chunks).decode('utf-8')
+
+    async def test_stream_contacts_in_batches(self):
+        batches = [rows async for rows in stream_contacts(self.user, self.session, batch_size=10)]
+        self.assertEqual([len(rows) for rows in batches], [10, 10, 5])
+
+    async def test_export_ndjson(self):
+        chunks, body = await self.export('ndjson')
+        self.assertEqual(len(chunks), 3)
+        contacts = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(contacts), 25)
+        self.assertEqual(list(contacts[1]), FIELDS)
+        self.assertEqual(contacts[1]['birth_date'], '1990-01-02')
+        self.assertTrue(contacts[1]['favorite'])
+
+    async def test_export_csv(self):
+        chunks, body = await self.export('csv')
+        self.assertEqual(len(chunks), 4)
+        contacts = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(contacts), 25)
+        self.assertEqual(contacts[0]['last_name'], 'Contact, "Jr"')
+        self.assertEqual(contacts[0]['email'], 'user0@example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contact, User
+from src.services.importer import get_parser, import_contacts, iter_csv, iter_json_array, iter_ndjson
+
+
+async def stream(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+class TestParsers(unittest.IsolatedAsyncioTestCase):
+
+    async def test_json_array_split_across_chunks(self):
+        data = '[{"first_name": "Ünï"}, {"a": [1, 2]} ,\n {}]'.encode('utf-8')
+        rows = await collect(iter_json_array(stream(data, 3)))
+        self.assertEqual(rows, [(1, {"first_name": "Ünï"}), (2, {"a": [1, 2]}), (3, {})])
+
+    async def test_json_empty_array(self):
+        self.assertEqual(await collect(iter_json_array(stream(b' [ ] '))), [])
+
+    async def test_json_truncated(self):
+        with self.assertRaises(ValueError):
+            await collect(iter_json_array(stream(b'[{"a": 1}, {"b"')))
+
+    async def test_ndjson(self):
+        rows = await collect(iter_ndjson(stream(b'{"a": 1}\r\n\n{"b": 2}\nnot json\n')))
+        self.assertEqual(rows[:2], [(1, {"a": 1}), (3, {"b": 2})])
+        self.assertIsInstance(rows[2][1], ValueError)
+
+    async def test_csv_with_quoted_newline(self):
+        data = b'first_name,last_name,phone\nUser,"Multi\nLine",\nOne,Two\n'
+        rows = await collect(iter_csv(stream(data, 5)))
+        self.assertEqual(rows[0], (1, {"first_name": "User", "last_name": "Multi\nLine"}))
+        self.assertIsInstance(rows[1][1], ValueError)
+
+    def test_get_parser(self):
+        self.assertIs(get_parser('text/csv; charset=utf-8'), iter_csv)
+        self.assertIs(get_parser('application/x-ndjson'), iter_ndjson)
+        self.assertIsNone(get_parser('text/plain'))
+
+
+class TestImportContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "import.db"))
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(email='usertest@gmail.com', password='secret')
+        self.session.add(self.user)
+        await self.session.flush()
+        self.session.add(Contact(first_name='Existing', last_name='Contact', email='existing@example.com',
+                                 birth_date=date(1990, 1, 1), user_id=self.user.id))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_import_reports_row_errors_without_aborting(self):
+        lines = ['first_name,last_name,email,birth_date,favorite']
+        lines += [f'User{i},Contact,user{i}@example.com,1990-12-{i % 28 + 1:02},{i % 2}' for i in range(25)]
+        lines += ['Dup,Contact,existing@example.com,1990-01-01,0',
+                  'No,Contact,not-an-email,1990-01-01,0',
+                  'Again,Contact,user0@example.com,1990-01-01,0']
+        rows = iter_csv(stream('\n'.join(lines).encode()))
+        result = await import_contacts(rows, self.user, self.session, batch_size=10)
+        self.assertEqual(result['created'], 25)
+        self.assertEqual(result['failed'], 3)
+        self.assertEqual([error['row'] for error in result['errors']], [26, 27, 28])
+        self.assertIn('already exists', result['errors'][0]['detail'])
+        self.assertIn('email', result['errors'][1]['detail'])
+        count = await self.session.execute(select(func.count()).select_from(Contact))
+        self.assertEqual(count.scalar(), 26)
+        contact = await self.session.execute(select(Contact).filter(Contact.email == 'user5@example.com'))
+        contact = contact.scalars().first()
+        self.assertEqual(contact.birth_day, 1206)
+        self.assertTrue(contact.favorite)
+
+    async def test_import_stops_at_malformed_stream(self):
+        data = b'[{"first_name": "User", "last_name": "Contact", "email": "a@example.com", "birth_date": "1990-01-01"},'
+        result = await import_contacts(iter_json_array(stream(data)), self.user, self.session, batch_size=10)
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'], [{'row': 2, 'detail': 'Invalid JSON'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+import asyncio
+import socket
+import unittest
+from email.message import EmailMessage
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiosmtpd.controller import Controller
+from aiosmtplib import SMTP, SMTPAuthenticationError
+
+from src.services.email import build_message
+from src.conf.config import settings
+from src.services import mailer
+from src.services.mailer import Mailer
+
+
+class Handler:
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.refuse = {}
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        recipient = envelope.rcpt_tos[0]
+        if self.refuse.get(recipient):
+            code = self.refuse[recipient].pop(0)
+            return f'{code} refused'
+        self.messages.append(recipient)
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def message(recipient: str) -> EmailMessage:
+    message = EmailMessage()
+    message['From'] = 'app@example.com'
+    message['To'] = recipient
+    message['Subject'] = 'Test'
+    message.set_content('Hello')
+    return message
+
+
+class TestMailer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.handler = Handler()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=free_port())
+        self.controller.start()
+        self.mailer = self.create_mailer()
+
+    async def asyncTearDown(self):
+        await self.mailer.stop(timeout=1)
+        self.controller.stop()
+
+    def create_mailer(self, **options):
+        async def connect():
+            smtp = SMTP(hostname=self.controller.hostname, port=self.controller.port, start_tls=False)
+            await smtp.connect()
+            return smtp
+        options = dict(dict(workers=2, queue_size=100, batch_size=20, max_attempts=3, retry_delay=0.01), **options)
+        return Mailer(connect, **options)
+
+    async def test_messages_share_pooled_connections(self):
+        for i in range(30):
+            await self.mailer.send(message(f'user{i}@example.com'))
+        await self.mailer.queue.join()
+        self.assertEqual(len(self.handler.messages), 30)
+        self.assertLessEqual(len(self.handler.sessions), 2)
+        status = self.mailer.status()
+        self.assertEqual((status['queued'], status['sent'], status['failed']), (30, 30, 0))
+        self.assertLessEqual(status['connections'], 2)
+        self.assertLess(status['batches'], 30)
+
+    async def test_temporary_failure_is_retried(self):
+        self.handler.refuse['user@example.com'] = ['451', '451']
+        self.mailer = self.create_mailer(workers=1)
+        await self.mailer.send(message('user@example.com'))
+        for _ in range(100):
+            if self.handler.messages:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.handler.messages, ['user@example.com'])
+        self.assertEqual(self.mailer.stats.retried, 2)
+        self.assertEqual(self.mailer.stats.connections, 1)
+
+    async def test_gives_up_after_max_attempts(self):
+        self.handler.refuse['user@example.com'] = ['451'] * 5
+        await self.mailer.send(message('user@example.com'))
+        for _ in range(100):
+            if self.mailer.stats.failed:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual((self.mailer.stats.retried, self.mailer.stats.failed), (2, 1))
+        self.assertEqual(self.handler.messages, [])
+
+    async def test_permanent_failure_is_not_retried(self):
+        self.handler.refuse['user@example.com'] = ['550']
+        await self.mailer.send(message('user@example.com'))
+        await self.mailer.queue.join()
+        self.assertEqual((self.mailer.stats.retried, self.mailer.stats.failed), (0, 1))
+
+    async def test_server_down_is_retried(self):
+        self.controller.stop()
+        self.mailer = self.create_mailer(max_attempts=5, retry_delay=0.05)
+        await self.mailer.send(message('user@example.com'))
+        await self.mailer.queue.join()
+        self.assertEqual(self.mailer.stats.retried, 1)
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.controller.port)
+        self.controller.start()
+        for _ in range(200):
+            if self.handler.messages:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.handler.messages, ['user@example.com'])
+
+    async def test_send_waits_when_queue_is_full(self):
+        blocked = asyncio.Event()
+
+        async def connect():
+            await blocked.wait()
+        self.mailer = Mailer(connect, workers=1, queue_size=1, batch_size=1, max_attempts=1, retry_delay=0)
+        await self.mailer.send(message('first@example.com'))
+        await asyncio.sleep(0)
+        await self.mailer.send(message('second@example.com'))
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.mailer.send(message('third@example.com')), 0.05)
+        self.mailer.tasks[0].cancel()
+
+    async def test_unexpected_connect_error_is_retried(self):
+        connect = self.create_mailer().connect
+        calls = []
+
+        async def flaky_connect():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('broken')
+            return await connect()
+        self.mailer = Mailer(flaky_connect, workers=1, queue_size=10, batch_size=1, max_attempts=3, retry_delay=0.01)
+        with self.assertLogs('src.services.mailer', 'ERROR'):
+            await self.mailer.send(message('user@example.com'))
+            for _ in range(100):
+                if self.handler.messages:
+                    break
+                await asyncio.sleep(0.01)
+        self.assertEqual(self.handler.messages, ['user@example.com'])
+
+    async def test_unexpected_send_error_keeps_worker(self):
+        connect = self.create_mailer().connect
+
+        async def bad_address_connect():
+            smtp = await connect()
+            send_message = smtp.send_message
+
+            async def checked_send(message):
+                if message['To'] == 'bad@example.com':
+                    raise ValueError('bad address')
+                return await send_message(message)
+            smtp.send_message = checked_send
+            return smtp
+        self.mailer = Mailer(bad_address_connect, workers=1, queue_size=10, batch_size=1, max_attempts=3,
+                             retry_delay=0.01)
+        with self.assertLogs('src.services.mailer', 'ERROR'):
+            await self.mailer.send(message('bad@example.com'))
+            await self.mailer.send(message('user@example.com'))
+            await self.mailer.queue.join()
+        self.assertEqual(self.handler.messages, ['user@example.com'])
+        self.assertEqual((self.mailer.stats.retried, self.mailer.stats.failed), (0, 1))
+
+    async def test_send_replaces_dead_workers(self):
+        self.mailer = self.create_mailer(workers=1)
+        await self.mailer.start()
+        self.mailer.tasks[0].cancel()
+        await asyncio.sleep(0)
+        await self.mailer.send(message('user@example.com'))
+        await asyncio.wait_for(self.mailer.queue.join(), 1)
+        self.assertEqual(self.handler.messages, ['user@example.com'])
+
+    async def test_stop_drains_queue(self):
+        for i in range(5):
+            await self.mailer.send(message(f'user{i}@example.com'))
+        await self.mailer.stop()
+        self.assertEqual(len(self.handler.messages), 5)
+        self.assertEqual(self.mailer.tasks, [])
+
+
+class TestConnectSmtp(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_login_closes_connection(self):
+        smtp = MagicMock(connect=AsyncMock(), login=AsyncMock(side_effect=SMTPAuthenticationError(535, 'denied')))
+        with patch.object(mailer, 'SMTP', return_value=smtp), patch.object(settings, 'mail_use_credentials', True):
+            with self.assertRaises(SMTPAuthenticationError):
+                await mailer.connect_smtp()
+        smtp.close.assert_called_once()
+
+
+class TestBuildMessage(unittest.TestCase):
+
+    def test_confirmation_email(self):
+        email = build_message('user@example.com', 'Confirm your email ', 'email_template.html',
+                              host='http://localhost/', username='<deadpool>', token='token')
+        self.assertEqual(email['To'], 'user@example.com')
+        body = email.get_content()
+        self.assertIn('http://localhost/api/auth/confirmed_email/token', body)
+        self.assertIn('&lt;deadpool&gt;', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.conf.config import settings
+from src.database.pool import MonitoredQueuePool, pool_status
+
+
+class TestPoolStatus(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "pool.db")
+        self.engine = create_async_engine(self.url, poolclass=MonitoredQueuePool,
+                                          pool_size=2, max_overflow=1)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_pool_status_checked_out(self):
+        async with self.engine.connect() as first, self.engine.connect() as second:
+            await first.execute(text("SELECT 1"))
+            await second.execute(text("SELECT 1"))
+            status = pool_status(self.engine.pool)
+            self.assertEqual(status["checked_out"], 2)
+            self.assertEqual(status["idle"], 0)
+            self.assertEqual(status["overflow"], 0)
+        status = pool_status(self.engine.pool)
+        self.assertEqual(status["checked_out"], 0)
+        self.assertEqual(status["idle"], 2)
+        self.assertEqual(status["checkouts"], 2)
+
+    async def test_pool_status_overflow(self):
+        async with self.engine.connect(), self.engine.connect(), self.engine.connect():
+            with patch.object(settings, "db_max_overflow", 1):
+                status = pool_status(self.engine.pool)
+            self.assertEqual(status["checked_out"], 3)
+            self.assertEqual(status["overflow"], 1)
+            self.assertEqual(status["max_overflow"], 1)
+
+    async def test_pool_status_without_queue(self):
+        engine = create_async_engine(self.url, poolclass=NullPool)
+        self.assertEqual(pool_status(engine.pool), {"pool": "NullPool"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fakeredis import FakeServer, aioredis
+from jose import jwt
+from redis.exceptions import ConnectionError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+from src.database import db
+from src.database.replicas import Replica, ReplicaRouter, is_replica_session, token_subject
+
+
+def bearer(email: str) -> str:
+    return "Bearer " + jwt.encode({"sub": email, "scope": "access_token"}, "any key", algorithm="HS256")
+
+
+class TestTokenSubject(unittest.TestCase):
+
+    def test_subject(self):
+        self.assertEqual(token_subject(bearer("usertest@gmail.com")), "usertest@gmail.com")
+
+    def test_no_or_bad_token(self):
+        self.assertIsNone(token_subject(None))
+        self.assertIsNone(token_subject("Basic dXNlcjpwYXNz"))
+        self.assertIsNone(token_subject("Bearer not-a-jwt"))
+
+
+class TestReplicaRouter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        directory = tempfile.mkdtemp()
+        self.replicas = [Replica(create_async_engine("sqlite+aiosqlite:///" + os.path.join(directory, f"{i}.db")))
+                         for i in range(2)]
+        self.client = aioredis.FakeRedis(server=FakeServer())
+        self.router = ReplicaRouter(self.replicas, self.client, max_lag=5, check_interval=60, check_timeout=2,
+                                    sticky=70)
+        await self.router.start()
+
+    async def asyncTearDown(self):
+        await self.router.stop()
+        await self.client.close()
+
+    async def test_reads_take_turns_on_healthy_replicas(self):
+        self.assertTrue(all(replica.healthy and replica.lag == 0 for replica in self.replicas))
+        factories = [await self.router.session_factory("GET", None) for _ in range(4)]
+        self.assertEqual(factories, [self.replicas[0].SessionLocal, self.replicas[1].SessionLocal] * 2)
+        self.assertEqual(self.router.reads["replica"], 4)
+
+    async def test_least_busy_replica_first(self):
+        async with self.replicas[0].engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            for _ in range(2):
+                self.assertIs(await self.router.session_factory("GET", None), self.replicas[1].SessionLocal)
+
+    async def test_writes_go_to_primary_and_stick(self):
+        writer, reader = bearer("writer@example.com"), bearer("reader@example.com")
+        self.assertIsNone(await self.router.session_factory("POST", writer))
+        self.assertIsNone(await self.router.session_factory("GET", writer))
+        self.assertIsNotNone(await self.router.session_factory("GET", reader))
+        self.assertEqual(self.router.reads, {"replica": 1, "sticky": 1, "fallback": 0})
+        self.assertLessEqual(await self.client.pttl(self.router.writer_key("writer@example.com")), 70_000)
+
+    async def test_marker_is_renewed_when_the_write_is_done(self):
+        key = self.router.writer_key("writer@example.com")
+        await self.router.session_factory("POST", bearer("writer@example.com"))
+        await self.client.delete(key)
+        await self.router.request_done("GET", bearer("writer@example.com"))
+        self.assertFalse(await self.client.exists(key))
+        await self.router.request_done("POST", bearer("writer@example.com"))
+        self.assertTrue(await self.client.exists(key))
+
+    async def test_short_sticky_warns(self):
+        router = ReplicaRouter(self.replicas, self.client, max_lag=5, check_interval=60, check_timeout=2, sticky=10)
+        with self.assertLogs("src.database.replicas", "WARNING"):
+            await router.start()
+        router.task.cancel()
+
+    async def test_lagging_replica_gets_no_reads(self):
+        self.replicas[0].lag_query = text("SELECT 60")
+        await self.router.check_all()
+        self.assertEqual(self.replicas[0].lag, 60)
+        for _ in range(2):
+            self.assertIs(await self.router.session_factory("GET", None), self.replicas[1].SessionLocal)
+        self.replicas[1].lag_query = text("SELECT 60")
+        await self.router.check_all()
+        self.assertIsNone(await self.router.session_factory("GET", None))
+        self.assertEqual(self.router.reads["fallback"], 1)
+
+    async def test_unreachable_replica_is_unhealthy(self):
+        broken = Replica(create_async_engine("sqlite+aiosqlite:////nonexistent/dir/replica.db"))
+        self.router.replicas.append(broken)
+        with self.assertLogs("src.database.replicas", "WARNING") as logs:
+            await self.router.check_all()
+            await self.router.check_all()
+        self.assertEqual(len(logs.output), 1)
+        self.assertFalse(broken.healthy)
+        self.assertIsNotNone(broken.error)
+        self.assertFalse(self.router.status()["replicas"][2]["usable"])
+        self.assertNotIn(self.router.choose(), [broken])
+        await broken.engine.dispose()
+
+    async def test_redis_failure_reads_from_primary(self):
+        self.router.client = MagicMock(exists=AsyncMock(side_effect=ConnectionError("down")))
+        with self.assertLogs("src.database.replicas", "WARNING"):
+            self.assertIsNone(await self.router.session_factory("GET", bearer("usertest@gmail.com")))
+
+    async def test_get_db_uses_replica_for_get(self):
+        scope = {"type": "http", "method": "GET", "headers": [], "path": "/api/contacts/"}
+        with patch.object(db, "replica_router", self.router):
+            async for session in db.get_db(Request(scope)):
+                self.assertIs(session.bind, self.replicas[0].engine)
+                self.assertTrue(is_replica_session(session))
+            async for session in db.get_db(Request({**scope, "method": "POST"})):
+                self.assertIs(session.bind, db.engine)
+                self.assertFalse(is_replica_session(session))
+
+
+class TestNoReplicas(unittest.IsolatedAsyncioTestCase):
+
+    async def test_everything_goes_to_primary(self):
+        router = ReplicaRouter([], MagicMock(), max_lag=5, check_interval=60, check_timeout=2, sticky=10)
+        await router.start()
+        self.assertIsNone(await router.session_factory("GET", bearer("usertest@gmail.com")))
+        self.assertIsNone(router.task)
+        router.client.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,13 @@ import unittest
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
 from src.schemas import ContactModel, ContactFavoriteStatus
 from src.repository.contacts import (
     get_contacts,
+    get_contacts_page,
     get_contact,
     create_contact,
     remove_contact,
@@ -20,191 +21,234 @@ from src.repository.contacts import (
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.user = User(id=1, email='usertest@gmail.com')
 
+    def set_result(self, value):
+        result = MagicMock()
+        result.scalars().all.return_value = value
+        result.scalars().first.return_value = value
+        self.session.execute.return_value = result
+
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name=None, last_name=None, email=None,
                                     user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name=None, last_name=None, email=None,
                                     user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_first_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name="User", last_name=None, email=None,
                                     user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_last_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name=None, last_name="Contact", email=None,
                                     user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name=None, last_name=None,
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_first_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name='User', last_name=None, email=None,
                                     user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_last_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name=None, last_name='Contact',
                                     email=None, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name=None, last_name=None,
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_first_name_last_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name='User', last_name='Contact',
                                     email=None, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_first_name_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name='User', last_name=None,
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_last_name_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name=None, last_name="Contact",
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_first_name_last_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name='User', last_name='Contact',
                                     email=None, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_first_name_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name='User', last_name=None,
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_favorite_last_name_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name=None, last_name='Contact',
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_first_name_last_name_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=None, first_name='User', last_name='Contact',
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_with_all(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().filter().filter().filter().filter().limit().offset().all.return_value = contacts
+        self.set_result(contacts)
         result = await get_contacts(limit=10, offset=0, favorite=False, first_name='User', last_name='Contact',
                                     email='usertest@gmail.com', user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_page_last_page(self):
+        contacts = [Contact(id=1), Contact(id=2)]
+        self.set_result(contacts)
+        result, next_key = await get_contacts_page(limit=10, after=None, favorite=None, first_name=None,
+                                                   last_name=None, email=None, user=self.user, db=self.session)
+        self.assertEqual(result, contacts)
+        self.assertIsNone(next_key)
+
+    async def test_get_contacts_page_has_next(self):
+        contacts = [Contact(id=1, first_name='User', last_name='Contact'),
+                    Contact(id=2, first_name='User', last_name='Contact'),
+                    Contact(id=3, first_name='User', last_name='Contact')]
+        self.set_result(contacts)
+        result, next_key = await get_contacts_page(limit=2, after=('Contact', 'User', 0), favorite=False,
+                                                   first_name='User', last_name=None, email=None, user=self.user,
+                                                   db=self.session)
+        self.assertEqual(result, contacts[:2])
+        self.assertEqual(next_key, ('Contact', 'User', 2))
+
+    async def test_get_contacts_page_without_room(self):
+        self.set_result([Contact(id=1, first_name='User', last_name='Contact')])
+        result, next_key = await get_contacts_page(limit=0, after=None, favorite=None, first_name=None,
+                                                   last_name=None, email=None, user=self.user, db=self.session)
+        self.assertEqual((result, next_key), ([], None))
+
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.set_result(contact)
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.set_result(None)
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_create_contact(self):
         body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
                             birth_date=datetime.now())
+        contact = Contact(id=1, **body.dict())
+        self.set_result(contact)
         result = await create_contact(body=body, user=self.user, db=self.session)
-        self.assertEqual(result.first_name, body.first_name)
-        self.assertEqual(result.last_name, body.last_name)
-        self.assertEqual(result.email, body.email)
-        self.assertEqual(result.birth_date, body.birth_date)
-        self.assertTrue(hasattr(result, "id"))
+        self.assertEqual(result, contact)
+        self.session.commit.assert_awaited_once()
+        self.session.refresh.assert_not_called()
 
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.set_result(contact)
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.set_result(None)
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.session.commit.assert_not_called()
 
     async def test_update_contact_found(self):
         body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
                             birth_date=datetime.now())
         contact = Contact(first_name='Contact', last_name='User', email='contacttest@gmail.com',
                           birth_date=datetime.now())
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        self.set_result(contact)
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_update_contact_not_found(self):
         body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
                             birth_date=datetime.now())
-        self.session.query().filter().first.return_value = None
-        self.session.commit.return_value = None
+        self.set_result(None)
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_update_favorite_contact_found(self):
         body = ContactFavoriteStatus(favorite=True)
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        self.set_result(contact)
         result = await update_favorite_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_update_favorite_contact_not_found(self):
         body = ContactFavoriteStatus(done=True)
-        self.session.query().filter().first.return_value = None
-        self.session.commit.return_value = None
+        self.set_result(None)
         result = await update_favorite_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
-    # async def test_get_birthday_contacts(self):
-    #     contacts = [Contact(), Contact(), Contact()]
-    #     result = await get_birthday_contacts(user=self.user, db=self.session)
-    #     self.assertEqual(result, contacts)
+    async def test_get_birthday_contacts(self):
+        contacts = [Contact(), Contact(), Contact()]
+        self.set_result(contacts)
+        result = await get_birthday_contacts(days=7, user=self.user, db=self.session)
+        self.assertEqual(result, contacts)
 
+    async def test_create_contact_sets_birth_day(self):
+        body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
+                            birth_date=datetime(1990, 12, 24))
+        self.set_result(Contact())
+        await create_contact(body=body, user=self.user, db=self.session)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual((params['birth_day'], params['user_id']), (1224, 1))
+
+    async def test_update_contact_sets_birth_day(self):
+        body = ContactModel(first_name='User', last_name='Contact', email='usertest@gmail.com',
+                            birth_date=datetime(1990, 12, 24))
+        self.set_result(Contact())
+        await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
+        self.assertEqual(self.session.execute.call_args.args[0].compile().params['birth_day'], 1224)
 
 if __name__ == '__main__':
     unittest.main()
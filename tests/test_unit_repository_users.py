@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
@@ -9,6 +9,7 @@ from src.repository.users import (
     get_user_by_email,
     create_user,
     update_token,
+    update_password,
     confirmed_email,
     update_avatar
 )
@@ -17,17 +18,23 @@ from src.repository.users import (
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.user = User(id=1, email='usertest@gmail.com', confirmed=False)
 
+    def set_result(self, value):
+        result = MagicMock()
+        result.scalars().first.return_value = value
+        result.scalar_one.return_value = 2
+        self.session.execute.return_value = result
+
     async def test_get_user_by_email_found(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.set_result(user)
         result = await get_user_by_email(email=self.user.email, db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.set_result(None)
         result = await get_user_by_email(email=self.user.email, db=self.session)
         self.assertIsNone(result)
 
@@ -47,12 +54,28 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         await update_token(user=self.user, db=self.session, token=None)
         self.assertIsNone(self.user.refresh_token)
 
+    async def test_update_password(self):
+        await update_password(user=self.user, password='new hash', db=self.session)
+        self.assertEqual(self.user.password, 'new hash')
+        self.session.commit.assert_awaited_once()
+
     async def test_confirmed_email(self):
+        self.set_result(self.user)
         result = await confirmed_email(email=self.user.email, db=self.session)
         self.assertTrue(result.confirmed)
 
+    async def test_profile_writes_bump_version(self):
+        self.set_result(self.user)
+        await update_token(user=self.user, db=self.session, token='token')
+        self.session.execute.assert_not_called()
+        await update_avatar(email=self.user.email, db=self.session, url='url')
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn('version=(users.version +', str(stmt))
+        self.assertEqual(self.user.version, 2)
+
     async def test_update_avatar(self):
         url = 'url'
+        self.set_result(self.user)
         result = await update_avatar(email=self.user.email, db=self.session, url=url)
         self.assertEqual(result.avatar, url)
 
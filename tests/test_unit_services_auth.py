@@ -0,0 +1,160 @@
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from jose import jwt
+from passlib.context import CryptContext
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.services.auth import Auth
+from src.services.lru import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_expires(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=0)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestGetCurrentUser(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.auth = Auth()
+        self.auth.r = AsyncMock()
+        self.auth.r.get.return_value = None
+        self.auth.user_cache = LRUCache(maxsize=10, ttl=60)
+        self.auth.token_cache = LRUCache(maxsize=10, ttl=900)
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', password='hash',
+                         refresh_token='token', created_at=datetime(2023, 3, 1, 12, 0), confirmed=True)
+        self.token = await self.auth.create_access_token(data={"sub": self.user.email})
+
+    async def test_principal_round_trip(self):
+        user = self.auth.load_user(self.auth.dump_user(self.user))
+        self.assertEqual((user.id, user.username, user.email, user.created_at, user.confirmed),
+                         (1, 'deadpool', 'deadpool@example.com', datetime(2023, 3, 1, 12, 0), True))
+        self.assertIsNone(user.password)
+        self.assertIsNone(user.refresh_token)
+
+    async def test_miss_loads_from_database_and_sets_redis_once(self):
+        with patch('src.services.auth.repository_users.get_user_by_email', AsyncMock(return_value=self.user)) as get:
+            first = await self.auth.get_current_user(self.token, MagicMock())
+            second = await self.auth.get_current_user(self.token, MagicMock())
+        get.assert_awaited_once()
+        self.auth.r.set.assert_awaited_once()
+        self.assertEqual(self.auth.r.set.call_args.kwargs, {'ex': 900})
+        self.auth.r.expire.assert_not_called()
+        self.assertEqual(self.auth.r.get.await_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(first.email, self.user.email)
+
+    async def test_redis_hit_skips_database(self):
+        self.auth.r.get.return_value = self.auth.dump_user(self.user).encode()
+        with patch('src.services.auth.repository_users.get_user_by_email', AsyncMock()) as get:
+            user = await self.auth.get_current_user(self.token, MagicMock())
+        get.assert_not_awaited()
+        self.assertEqual(user.id, 1)
+
+    async def test_forget_user(self):
+        self.auth.user_cache.set(self.user.email, self.user)
+        await self.auth.forget_user(self.user.email)
+        self.assertIsNone(self.auth.user_cache.get(self.user.email))
+        self.auth.r.delete.assert_awaited_once_with(f"user:{self.user.email}")
+
+    async def test_redis_down_falls_back_to_database(self):
+        self.auth.r.get.side_effect = ConnectionError()
+        self.auth.r.set.side_effect = ConnectionError()
+        with patch('src.services.auth.repository_users.get_user_by_email', AsyncMock(return_value=self.user)):
+            user = await self.auth.get_current_user(self.token, MagicMock())
+        self.assertEqual(user.id, 1)
+
+
+class TestVerifyAccessToken(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.auth = Auth()
+        self.auth.token_cache = LRUCache(maxsize=10, ttl=900)
+        self.token = await self.auth.create_access_token(data={"sub": "deadpool@example.com"}, expires_delta=60)
+
+    async def test_cache_hit_skips_decoding(self):
+        with patch('src.services.auth.jwt.decode', wraps=jwt.decode) as decode:
+            self.assertEqual(self.auth.verify_access_token(self.token), "deadpool@example.com")
+            self.assertEqual(self.auth.verify_access_token(self.token), "deadpool@example.com")
+        decode.assert_called_once()
+        self.assertEqual(len(self.auth.token_cache), 1)
+
+    async def test_entry_expires_with_token(self):
+        self.auth.verify_access_token(self.token)
+        (email, expires), = self.auth.token_cache.data.values()
+        self.assertLessEqual(expires, time.monotonic() + 60)
+
+    async def test_expired_token_is_rejected(self):
+        token = await self.auth.create_access_token(data={"sub": "deadpool@example.com"}, expires_delta=-1)
+        self.assertIsNone(self.auth.verify_access_token(token))
+        self.assertEqual(len(self.auth.token_cache), 0)
+
+    async def test_refresh_token_is_rejected(self):
+        token = await self.auth.create_refresh_token(data={"sub": "deadpool@example.com"})
+        self.assertIsNone(self.auth.verify_access_token(token))
+        self.assertIsNone(self.auth.verify_access_token(token))
+        self.assertEqual(len(self.auth.token_cache), 0)
+
+    async def test_disabled_cache(self):
+        self.auth.token_cache = LRUCache(maxsize=0, ttl=900)
+        with patch('src.services.auth.jwt.decode', wraps=jwt.decode) as decode:
+            self.auth.verify_access_token(self.token)
+            self.auth.verify_access_token(self.token)
+        self.assertEqual(decode.call_count, 2)
+
+
+def bcrypt_context(rounds):
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+
+
+class TestPasswordHashing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.pwd_context = bcrypt_context(4)
+
+    async def test_hash_and_verify_in_pool(self):
+        with patch.object(self.auth.hash_executor, 'submit', wraps=self.auth.hash_executor.submit) as submit:
+            hashed = await self.auth.get_password_hash('secret')
+            self.assertTrue(await self.auth.verify_password('secret', hashed))
+            self.assertFalse(await self.auth.verify_password('wrong', hashed))
+        self.assertEqual(submit.call_count, 3)
+        self.assertTrue(hashed.startswith('$2b$04$'))
+
+    async def test_current_cost_is_not_rehashed(self):
+        hashed = await self.auth.get_password_hash('secret')
+        self.assertEqual(await self.auth.verify_and_update_password('secret', hashed), (True, None))
+
+    async def test_changed_cost_is_rehashed(self):
+        hashed = bcrypt_context(5).hash('secret')
+        verified, new_hash = await self.auth.verify_and_update_password('secret', hashed)
+        self.assertTrue(verified)
+        self.assertTrue(new_hash.startswith('$2b$04$'))
+        self.assertTrue(await self.auth.verify_password('secret', new_hash))
+
+    async def test_wrong_password_is_not_rehashed(self):
+        hashed = bcrypt_context(5).hash('secret')
+        self.assertEqual(await self.auth.verify_and_update_password('wrong', hashed), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import Contact, User
+from src.services import cache
+from src.services.cache import ContactsCache
+from conftest import FakeRedis
+
+
+class TestContactsCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.user = User(id=1, email='usertest@gmail.com')
+        self.session = MagicMock()
+        self.contact = Contact(id=1, first_name='User', last_name='Contact', email='usertest@gmail.com',
+                               birth_date=date(1990, 1, 1), favorite=False, phone='')
+        self.cache = ContactsCache(FakeRedis(), ttl=60)
+        patcher = patch.object(cache, 'contacts_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_get_contacts_hit_after_miss(self):
+        with patch.object(cache.repository_contacts, 'get_contacts', AsyncMock(return_value=[self.contact])) as get:
+            first = await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+            second = await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+        self.assertEqual(first, [self.contact])
+        self.assertEqual(second, [{'id': 1, 'first_name': 'User', 'last_name': 'Contact',
+                                   'email': 'usertest@gmail.com', 'birth_date': '1990-01-01', 'favorite': False,
+                                   'phone': ''}])
+        get.assert_awaited_once()
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'errors': 0})
+
+    async def test_params_are_part_of_the_key(self):
+        with patch.object(cache.repository_contacts, 'get_contacts', AsyncMock(return_value=[])) as get:
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+            await cache.get_contacts(10, 10, None, None, None, None, self.user, self.session)
+        self.assertEqual(get.await_count, 2)
+
+    async def test_invalidate_bumps_version(self):
+        with patch.object(cache.repository_contacts, 'get_contacts', AsyncMock(return_value=[])) as get:
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+            await self.cache.invalidate(self.user.id)
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+        self.assertEqual(get.await_count, 2)
+
+    async def test_lost_version_is_not_reused(self):
+        version = await self.cache.version(self.user.id)
+        self.assertEqual(await self.cache.version(self.user.id), version)
+        await self.cache.invalidate(self.user.id)
+        self.assertNotEqual(await self.cache.version(self.user.id), version)
+        version = await self.cache.version(self.user.id)
+        self.cache.client.data.clear()
+        self.assertNotIn(await self.cache.version(self.user.id), (version, 0, 1))
+
+    async def test_versions_kept_without_ttl(self):
+        self.cache.ttl = 0
+        version = await self.cache.version(self.user.id)
+        self.assertIsNotNone(version)
+        self.assertEqual(await self.cache.get(self.user.id, 'list', {}, version), (None, None))
+        await self.cache.invalidate(self.user.id)
+        self.assertNotEqual(await self.cache.version(self.user.id), version)
+
+    async def test_get_contacts_page_keeps_next_key(self):
+        page = ([self.contact], ('Contact', 'User', 1))
+        with patch.object(cache.repository_contacts, 'get_contacts_page', AsyncMock(return_value=page)):
+            await cache.get_contacts_page(1, None, None, None, None, None, self.user, self.session)
+            contacts, next_key = await cache.get_contacts_page(1, None, None, None, None, None, self.user,
+                                                               self.session)
+        self.assertEqual(next_key, ('Contact', 'User', 1))
+        self.assertEqual(contacts[0]['id'], 1)
+
+    async def test_get_contact_not_found_is_cached(self):
+        with patch.object(cache.repository_contacts, 'get_contact', AsyncMock(return_value=None)) as get:
+            self.assertIsNone(await cache.get_contact(1, self.user, self.session))
+            self.assertIsNone(await cache.get_contact(1, self.user, self.session))
+        get.assert_awaited_once()
+
+    async def test_replica_reads_are_not_cached(self):
+        replica = MagicMock(info={'replica': 'replica.db'})
+        with patch.object(cache.repository_contacts, 'get_contacts', AsyncMock(return_value=[self.contact])) as get:
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, replica)
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, replica)
+            self.assertEqual(get.await_count, 2)
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, self.session)
+            await cache.get_contacts(10, 0, None, None, None, None, self.user, replica)
+            self.assertEqual(get.await_count, 3)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 3, 'errors': 0})
+
+    async def test_redis_error_falls_through(self):
+        self.cache.client = MagicMock()
+        self.cache.client.get = AsyncMock(side_effect=ConnectionError())
+        with patch.object(cache.repository_contacts, 'get_contact', AsyncMock(return_value=self.contact)):
+            self.assertEqual(await cache.get_contact(1, self.user, self.session), self.contact)
+        self.assertEqual(self.cache.errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import unittest
+import zlib
+from unittest.mock import patch
+
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.conf.config import settings
+from src.services import compression
+from src.services.compression import CompressionMiddleware, choose_encoding
+from src.services.etag import etag_matches, not_modified
+
+BODY = b'{"first_name": "User", "last_name": "Contact"}' * 100
+
+
+class TestChooseEncoding(unittest.TestCase):
+
+    def test_server_preference_among_accepted(self):
+        self.assertEqual(choose_encoding("gzip, deflate, br", ["br", "gzip"]), "br")
+        self.assertEqual(choose_encoding("gzip;q=0.5, br;q=0.1", ["gzip", "br"]), "gzip")
+        self.assertEqual(choose_encoding("deflate, gzip", ["br", "gzip"]), "gzip")
+
+    def test_refused_or_unknown(self):
+        self.assertIsNone(choose_encoding("", ["br", "gzip"]))
+        self.assertIsNone(choose_encoding("identity", ["gzip"]))
+        self.assertIsNone(choose_encoding("gzip;q=0", ["gzip"]))
+        self.assertIsNone(choose_encoding("*, gzip;q=0", ["gzip"]))
+        self.assertEqual(choose_encoding("*", ["gzip"]), "gzip")
+
+    def test_brotli_needs_the_package(self):
+        with patch.object(compression, "brotli", None):
+            self.assertEqual(compression.available_encodings(), ["gzip"])
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware)
+
+        @app.get("/json")
+        def json_body(size: int):
+            return Response(BODY[:size], media_type="application/json")
+
+        @app.get("/image")
+        def image():
+            return Response(BODY, media_type="image/png")
+
+        @app.get("/etag")
+        def with_etag(if_none_match: str = Header(None)):
+            if etag_matches(if_none_match, '"list.1.10"'):
+                return not_modified('"list.1.10"')
+            return Response(BODY, media_type="application/json", headers={"ETag": '"list.1.10"'})
+
+        @app.get("/stream")
+        def stream():
+            async def chunks():
+                for i in range(3):
+                    yield b'{"id": %d}\n' % i * 200
+            return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+        self.client = TestClient(app)
+        patcher = patch.object(settings, "compression_encodings", ["gzip"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_large_body_is_compressed(self):
+        response = self.client.get("/json", params={"size": len(BODY)}, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertLess(int(response.headers["Content-Length"]), len(BODY) // 10)
+        self.assertEqual(response.content, BODY)
+
+    def test_small_body_is_not(self):
+        response = self.client.get("/json", params={"size": 100}, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.headers["Content-Length"], "100")
+
+    def test_not_accepted_or_not_compressible(self):
+        response = self.client.get("/json", params={"size": len(BODY)}, headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        response = self.client.get("/image", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.content, BODY)
+
+    def test_stream_is_compressed(self):
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(response.content, b"".join(b'{"id": %d}\n' % i * 200 for i in range(3)))
+
+    def test_compressed_body_has_its_own_etag(self):
+        response = self.client.get("/etag", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["ETag"], '"list.1.10-gzip"')
+        response = self.client.get("/etag", headers={"Accept-Encoding": "identity"})
+        self.assertEqual(response.headers["ETag"], '"list.1.10"')
+
+    def test_not_modified_with_compressed_etag(self):
+        response = self.client.get("/etag", headers={"Accept-Encoding": "gzip", "If-None-Match": '"list.1.10-gzip"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], '"list.1.10-gzip"')
+        response = self.client.get("/etag", headers={"Accept-Encoding": "gzip", "If-None-Match": '"list.1.9-gzip"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, BODY)
+
+    def test_stream_chunks_decode_on_arrival(self):
+        sent = []
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"text/csv")]})
+            for i in range(3):
+                await send({"type": "http.response.body", "body": b"row %d\n" % i, "more_body": True})
+                # the chunk went out compressed at once, after the start message: nothing is buffered
+                self.assertEqual(len(sent), i + 2)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", b"gzip")]}
+        asyncio.run(CompressionMiddleware(app)(scope, None, send))
+        decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        decoded = [decoder.decompress(message["body"]) for message in sent[1:]]
+        self.assertEqual(decoded, [b"row 0\n", b"row 1\n", b"row 2\n", b""])
+        self.assertEqual(gzip.decompress(b"".join(message["body"] for message in sent[1:])), b"row 0\nrow 1\nrow 2\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from src.database.models import Contact, User
+from src.services.etag import contact_etag, contacts_etag, user_etag, etag_matches, if_match_versions, not_modified, \
+    encoded_etag
+
+
+class TestETag(unittest.TestCase):
+
+    def test_contact_etag(self):
+        self.assertEqual(contact_etag(Contact(id=3, version=2)), '"3.2"')
+        self.assertEqual(contact_etag({'id': 3, 'version': 2}), '"3.2"')
+        self.assertIsNone(contact_etag({'id': 3}))
+
+    def test_contacts_and_user_etag(self):
+        self.assertEqual(contacts_etag(1, 5), '"list.1.5"')
+        self.assertIsNone(contacts_etag(1, None))
+        self.assertEqual(user_etag(User(id=1, version=4)), '"user.1.4"')
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"3.2"', '"3.2"'))
+        self.assertTrue(etag_matches('"1.1", W/"3.2"', '"3.2"'))
+        self.assertTrue(etag_matches('*', '"3.2"'))
+        self.assertFalse(etag_matches('"3.1"', '"3.2"'))
+        self.assertFalse(etag_matches(None, '"3.2"'))
+        self.assertFalse(etag_matches('*', None))
+
+    def test_compressed_etags_match(self):
+        self.assertTrue(etag_matches('"3.2-gzip"', '"3.2"'))
+        self.assertTrue(etag_matches('"1.1", "3.2-br"', '"3.2"'))
+        self.assertFalse(etag_matches('"3.1-gzip"', '"3.2"'))
+        self.assertEqual(if_match_versions('"3.2-gzip", "3.4-br"', 3), [2, 4])
+        self.assertEqual(encoded_etag('"list.1.10"', 'gzip'), '"list.1.10-gzip"')
+
+    def test_if_match_versions(self):
+        self.assertIsNone(if_match_versions(None, 3))
+        self.assertIsNone(if_match_versions('*', 3))
+        self.assertEqual(if_match_versions('"3.2", "3.4"', 3), [2, 4])
+        self.assertEqual(if_match_versions('W/"3.2", "4.1", "list.3.1"', 3), [])
+
+    def test_not_modified(self):
+        response = not_modified('"3.2"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], '"3.2"')
+        self.assertEqual(response.body, b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src.conf.config import settings
+from src.services.metrics import MetricsMiddleware, instrument_engine, registry, sql_operation
+from src.services.sql_profile import SQLProfileMiddleware
+
+
+def sample(name: str, **labels) -> float:
+    return registry.get_sample_value(name, labels) or 0.0
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b"]))
+
+    @app.get("/fail")
+    def fail():
+        raise RuntimeError("boom")
+
+    return app
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(create_app(), raise_server_exceptions=False)
+
+    def test_labels_by_route_template(self):
+        before = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+        for item_id in range(3):
+            self.client.get(f"/items/{item_id}")
+        self.client.get("/items/abc")
+        self.assertEqual(sample("http_requests_total", method="GET", route="/items/{item_id}", status="200"),
+                         before + 3)
+        self.assertGreaterEqual(sample("http_requests_total", method="GET", route="/items/{item_id}", status="422"), 1)
+        self.assertIsNone(registry.get_sample_value("http_requests_total",
+                                                    {"method": "GET", "route": "/items/1", "status": "200"}))
+
+    def test_unmatched_and_wrong_method(self):
+        before = sample("http_requests_total", method="GET", route="<unmatched>", status="404")
+        self.client.get("/nothing/here")
+        self.client.post("/items/1")
+        self.assertEqual(sample("http_requests_total", method="GET", route="<unmatched>", status="404"), before + 1)
+        self.assertGreaterEqual(sample("http_requests_total", method="POST", route="/items/{item_id}", status="405"), 1)
+
+    def test_duration_and_in_progress(self):
+        before = sample("http_request_duration_seconds_count", method="GET", route="/stream")
+        response = self.client.get("/stream")
+        self.assertEqual(response.content, b"ab")
+        self.assertEqual(sample("http_request_duration_seconds_count", method="GET", route="/stream"), before + 1)
+        self.assertEqual(sample("http_requests_in_progress", method="GET", route="/stream"), 0)
+
+    def test_error_counts_as_500(self):
+        before = sample("http_requests_total", method="GET", route="/fail", status="500")
+        self.assertEqual(self.client.get("/fail").status_code, 500)
+        self.assertEqual(sample("http_requests_total", method="GET", route="/fail", status="500"), before + 1)
+        self.assertEqual(sample("http_requests_in_progress", method="GET", route="/fail"), 0)
+
+    def test_route_resolved_once_per_request(self):
+        app = create_app()
+        app.add_middleware(SQLProfileMiddleware)
+        route = next(route for route in app.router.routes if route.path == "/items/{item_id}")
+        with patch.object(settings, "sql_profile", True), \
+                patch.object(route, "matches", wraps=route.matches) as matches:
+            self.assertEqual(TestClient(app).get("/items/1").status_code, 200)
+        # once for both middlewares and once by the router itself
+        self.assertEqual(matches.call_count, 2)
+
+
+class TestDatabaseMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        instrument_engine(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_sql_operation(self):
+        self.assertEqual(sql_operation("  select 1"), "SELECT")
+        self.assertEqual(sql_operation("INSERT INTO contacts VALUES (1)"), "INSERT")
+        self.assertEqual(sql_operation("PRAGMA main.table_info('contacts')"), "OTHER")
+        self.assertEqual(sql_operation(""), "OTHER")
+
+    def test_queries_counted_and_timed(self):
+        queries = sample("db_queries_total", operation="SELECT")
+        observed = sample("db_query_duration_seconds_count", operation="SELECT")
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        self.assertEqual(sample("db_queries_total", operation="SELECT"), queries + 2)
+        self.assertEqual(sample("db_query_duration_seconds_count", operation="SELECT"), observed + 2)
+
+    def test_errors_counted(self):
+        errors = sample("db_query_errors_total", operation="SELECT")
+        with self.engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+            self.assertEqual(conn.info["query_start"], [])
+        self.assertEqual(sample("db_query_errors_total", operation="SELECT"), errors + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
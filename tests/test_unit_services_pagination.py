@@ -0,0 +1,34 @@
+import unittest
+
+from src.services.pagination import encode_cursor, decode_cursor
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        key = ('Contact', 'User', 42)
+        self.assertEqual(decode_cursor(encode_cursor(key), (str, str, int)), key)
+
+    def test_cursor_is_url_safe(self):
+        cursor = encode_cursor(('Ünïcode/+?', 'User', 1))
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor', (str, str, int))
+
+    def test_wrong_size(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor((1,)), (str, str, int))
+
+    def test_wrong_types(self):
+        for key in ({'a': 1}, 'x', 1), ('a', 'b', [1]), ('a', 'b', '1'), ('a', None, 1), ('a', 'b', True):
+            with self.subTest(key=key), self.assertRaises(ValueError):
+                decode_cursor(encode_cursor(key), (str, str, int))
+
+    def test_alternative_types(self):
+        self.assertEqual(decode_cursor(encode_cursor((0.5, 7)), ((int, float), int)), (0.5, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
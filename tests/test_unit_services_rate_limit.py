@@ -0,0 +1,136 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fakeredis import FakeServer, aioredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services import rate_limit
+from src.services.auth import auth_service
+from src.services.lru import LRUCache
+from src.services.metrics import registry
+from src.services.rate_limit import Limiter, RateLimit, client_key, parse_limit
+
+
+def request(authorization: str = None, host: str = '10.0.0.1') -> MagicMock:
+    request = MagicMock()
+    request.headers = {'authorization': authorization} if authorization else {}
+    request.client.host = host
+    return request
+
+
+class TestLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = aioredis.FakeRedis(server=FakeServer())
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_admits_burst_then_denies(self):
+        limiter = Limiter(self.client, local_batch=1, local_size=100)
+        results = [await limiter.acquire('key', 3, 60) for _ in range(4)]
+        self.assertEqual(results[:3], [0, 0, 0])
+        self.assertGreater(results[3], 0)
+        self.assertLessEqual(results[3], 20)
+        self.assertEqual(limiter.stats()['denied'], 1)
+        self.assertEqual(limiter.stats()['redis_calls'], 4)
+
+    async def test_keys_are_independent(self):
+        limiter = Limiter(self.client, local_batch=1, local_size=100)
+        self.assertEqual(await limiter.acquire('first', 1, 60), 0)
+        self.assertGreater(await limiter.acquire('first', 1, 60), 0)
+        self.assertEqual(await limiter.acquire('second', 1, 60), 0)
+
+    async def test_key_expires_with_its_period(self):
+        limiter = Limiter(self.client, local_batch=1, local_size=100)
+        await limiter.acquire('key', 2, 60)
+        ttl = await self.client.pttl('key')
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, 30000)
+
+    async def test_lease_saves_redis_calls(self):
+        limiter = Limiter(self.client, local_batch=5, local_size=100)
+        results = [await limiter.acquire('key', 10, 60) for _ in range(10)]
+        self.assertEqual(results, [0] * 10)
+        self.assertGreater(await limiter.acquire('key', 10, 60), 0)
+        stats = limiter.stats()
+        self.assertEqual(stats['redis_calls'], 3)
+        self.assertEqual(stats['local'], 8)
+        self.assertEqual(stats['allowed'], 10)
+
+    async def test_lease_never_exceeds_limit(self):
+        limiter = Limiter(self.client, local_batch=5, local_size=100)
+        other = Limiter(self.client, local_batch=5, local_size=100)
+        admitted = 0
+        for _ in range(10):
+            admitted += not await limiter.acquire('key', 7, 60)
+            admitted += not await other.acquire('key', 7, 60)
+        self.assertEqual(admitted, 7)
+
+    async def test_decisions_are_exported(self):
+        def decisions(result):
+            return registry.get_sample_value('rate_limit_decisions_total', {'result': result}) or 0.0
+
+        before = {result: decisions(result) for result in ('allowed', 'local', 'denied')}
+        limiter = Limiter(self.client, local_batch=2, local_size=100)
+        for _ in range(3):
+            await limiter.acquire('key', 2, 60)
+        self.assertEqual(decisions('allowed'), before['allowed'] + 1)
+        self.assertEqual(decisions('local'), before['local'] + 1)
+        self.assertEqual(decisions('denied'), before['denied'] + 1)
+
+    async def test_fails_open(self):
+        limiter = Limiter(self.client, local_batch=1, local_size=100)
+        limiter.script = MagicMock(side_effect=ConnectionError('down'))
+        self.assertEqual(await limiter.acquire('key', 1, 60), 0)
+        self.assertEqual(limiter.stats()['errors'], 1)
+
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = aioredis.FakeRedis(server=FakeServer())
+        patcher = patch.object(rate_limit, 'limiter', Limiter(self.client, local_batch=1, local_size=100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth_service.token_cache = LRUCache(maxsize=100, ttl=900)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('10/60'), (10, 60.0))
+        self.assertEqual(parse_limit('0/1'), (0, 1.0))
+
+    async def test_client_key_from_token(self):
+        token = await auth_service.create_access_token(data={'sub': 'user@example.com'})
+        self.assertEqual(client_key(request(f'Bearer {token}')), 'user:user@example.com')
+
+    def test_client_key_from_address(self):
+        self.assertEqual(client_key(request()), 'ip:10.0.0.1')
+        self.assertEqual(client_key(request('Bearer not-a-token')), 'ip:10.0.0.1')
+
+    async def test_users_behind_one_address_have_own_buckets(self):
+        dependency = RateLimit('test')
+        dependency.times, dependency.seconds = 1, 60
+        first = await auth_service.create_access_token(data={'sub': 'first@example.com'})
+        second = await auth_service.create_access_token(data={'sub': 'second@example.com'})
+        await dependency(request(f'Bearer {first}'))
+        await dependency(request(f'Bearer {second}'))
+        with self.assertRaises(HTTPException) as context:
+            await dependency(request(f'Bearer {first}'))
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertGreaterEqual(int(context.exception.headers['Retry-After']), 1)
+
+    async def test_limit_from_settings(self):
+        with patch.object(rate_limit.settings, 'rate_limits', {'test': '0/60'}):
+            dependency = RateLimit('test')
+        self.assertEqual(dependency.times, 0)
+        for _ in range(5):
+            await dependency(request())
+        self.assertEqual(rate_limit.limiter.stats()['redis_calls'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
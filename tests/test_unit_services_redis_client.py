@@ -0,0 +1,76 @@
+import logging
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import redis.asyncio as redis
+from redis.exceptions import ConnectionError
+
+from src.services.metrics import registry
+from src.services import redis_client
+from src.services.redis_client import RedisErrorLog, create_redis, redis_status
+
+
+class TestMonitoredRedis(unittest.IsolatedAsyncioTestCase):
+
+    async def test_command_latency_is_recorded(self):
+        client = create_redis()
+        with patch.object(redis.Redis, 'execute_command', AsyncMock(side_effect=[b'1', b'2', ConnectionError()])):
+            await client.get('a')
+            await client.get('b')
+            with self.assertRaises(ConnectionError):
+                await client.set('a', 1)
+        status = redis_status(client)
+        self.assertEqual(status['commands']['GET']['calls'], 2)
+        self.assertEqual(status['commands']['GET']['errors'], 0)
+        self.assertEqual(status['commands']['SET']['errors'], 1)
+        self.assertEqual(status['in_use'], 0)
+        self.assertGreaterEqual(status['commands']['GET']['max_ms'], status['commands']['GET']['avg_ms'])
+
+    async def test_pool_counts_its_connections(self):
+        client = create_redis()
+        pool = client.connection_pool
+        with patch.object(redis.Connection, 'connect', AsyncMock()), \
+                patch.object(redis.Connection, 'can_read_destructive', AsyncMock(return_value=False)):
+            first = await pool.get_connection('GET')
+            await pool.get_connection('GET')
+            await pool.release(first)
+        status = redis_status(client)
+        self.assertEqual((status['connections'], status['in_use'], status['idle']), (2, 1, 1))
+
+    async def test_failed_connect_is_not_in_use(self):
+        client = create_redis()
+        with patch.object(redis.Connection, 'connect', AsyncMock(side_effect=ConnectionError())):
+            with self.assertRaises(ConnectionError):
+                await client.connection_pool.get_connection('GET')
+        status = redis_status(client)
+        self.assertEqual((status['connections'], status['in_use'], status['idle']), (1, 0, 1))
+
+    async def test_command_metrics_are_exported(self):
+        def sample(name, command):
+            return registry.get_sample_value(name, {'command': command}) or 0.0
+
+        gets = sample('redis_command_duration_seconds_count', 'GET')
+        errors = sample('redis_command_errors_total', 'SET')
+        client = create_redis()
+        with patch.object(redis.Redis, 'execute_command', AsyncMock(side_effect=[b'1', ConnectionError()])):
+            await client.get('a')
+            with self.assertRaises(ConnectionError):
+                await client.set('a', 1)
+        self.assertEqual(sample('redis_command_duration_seconds_count', 'GET'), gets + 1)
+        self.assertEqual(sample('redis_command_errors_total', 'SET'), errors + 1)
+
+
+class TestRedisErrorLog(unittest.TestCase):
+
+    def test_one_warning_per_interval(self):
+        log = RedisErrorLog(logging.getLogger('test_redis'), interval=60)
+        with self.assertLogs('test_redis', 'WARNING') as logs:
+            with patch.object(redis_client.time, 'monotonic', side_effect=[0, 1, 2, 30, 61]):
+                for _ in range(5):
+                    log(ConnectionError('down'))
+        self.assertEqual(logs.output, ['WARNING:test_redis:Redis error: down',
+                                       'WARNING:test_redis:Redis error: down (3 more since the last report)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.conf.config import settings
+from src.services.sql_profile import QueryProfile, SQLProfileMiddleware, current_profile, profile_engine
+
+
+class TestQueryProfile(unittest.TestCase):
+
+    def test_counts_time_and_slowest(self):
+        profile = QueryProfile(slowest=2)
+        for statement, elapsed in (("SELECT 1", 0.001), ("SELECT 2", 0.005), ("SELECT 3", 0.003)):
+            profile.record(statement, elapsed)
+        summary = profile.summary(threshold=3, budget=0)
+        self.assertEqual(summary["queries"], 3)
+        self.assertEqual(summary["time_ms"], 9.0)
+        self.assertEqual([item["statement"] for item in summary["slowest"]], ["SELECT 2", "SELECT 3"])
+        self.assertFalse(summary["over_budget"])
+        self.assertEqual(summary["suspects"], [])
+
+    def test_repeated_statement_is_suspect(self):
+        profile = QueryProfile(slowest=3)
+        profile.record("SELECT * FROM contacts", 0.001)
+        for _ in range(3):
+            profile.record("SELECT * FROM users WHERE id = ?", 0.001)
+        self.assertEqual(profile.suspects(3), {"SELECT * FROM users WHERE id = ?": 3})
+        self.assertEqual(profile.suspects(4), {})
+        self.assertTrue(profile.summary(threshold=3, budget=3)["over_budget"])
+
+
+class TestProfileEngine(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        profile_engine(self.engine.sync_engine)
+        self.SessionLocal = async_sessionmaker(self.engine)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_statements_of_async_session_are_recorded(self):
+        profile = QueryProfile(slowest=3)
+        token = current_profile.set(profile)
+        try:
+            async with self.SessionLocal() as db:
+                for i in range(3):
+                    await db.execute(text("SELECT :i"), {"i": i})
+        finally:
+            current_profile.reset(token)
+        self.assertEqual(profile.queries, 3)
+        self.assertEqual(profile.suspects(3), {"SELECT ?": 3})
+
+    async def test_nothing_recorded_outside_request(self):
+        profile = QueryProfile(slowest=3)
+        async with self.SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        self.assertEqual(profile.queries, 0)
+
+
+class TestSQLProfileMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        profile_engine(engine)
+        self.addCleanup(engine.dispose)
+        app = FastAPI()
+        app.add_middleware(SQLProfileMiddleware)
+
+        @app.get("/items")
+        def items(n: int):
+            with engine.connect() as conn:
+                return [conn.execute(text("SELECT :i"), {"i": i}).scalar() for i in range(n)]
+
+        self.client = TestClient(app)
+
+    def test_headers_and_log(self):
+        with patch.object(settings, "sql_profile", True), self.assertLogs("sql_profile", "INFO") as logs:
+            response = self.client.get("/items", params={"n": 1})
+        self.assertEqual(response.headers["X-SQL-Queries"], "1")
+        self.assertEqual(response.headers["X-SQL-Suspects"], "0")
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        self.assertEqual((entry["method"], entry["route"], entry["status"], entry["queries"]), ("GET", "/items", 200, 1))
+
+    def test_n_plus_one_logged_as_warning(self):
+        with patch.object(settings, "sql_profile", True), self.assertLogs("sql_profile", "WARNING") as logs:
+            response = self.client.get("/items", params={"n": 5})
+        self.assertEqual(response.headers["X-SQL-Queries"], "5")
+        self.assertEqual(response.headers["X-SQL-Suspects"], "1")
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["suspects"], [{"statement": "SELECT ?", "count": 5}])
+
+    def test_disabled(self):
+        response = self.client.get("/items", params={"n": 1})
+        self.assertNotIn("X-SQL-Queries", response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from src.services.uploads import ContentLengthLimitMiddleware
+
+
+class TestContentLengthLimitMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(ContentLengthLimitMiddleware, limits={"/upload": 1000})
+
+        @app.post("/upload")
+        async def upload(file: UploadFile = File()):
+            return {"size": len(await file.read())}
+
+        @app.post("/other")
+        async def other(file: UploadFile = File()):
+            return {"size": len(await file.read())}
+
+        self.client = TestClient(app)
+
+    def test_large_body_is_refused(self):
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 2000)})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {"detail": "Request body is larger than 1000 bytes"})
+
+    def test_small_body_and_other_paths_pass(self):
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 100)})
+        self.assertEqual(response.json(), {"size": 100})
+        response = self.client.post("/other", files={"file": ("a.png", b"x" * 2000)})
+        self.assertEqual(response.json(), {"size": 2000})
+
+    def test_body_is_not_read(self):
+        sent = []
+
+        async def app(scope, receive, send):
+            raise AssertionError("the app must not run")
+
+        async def receive():
+            raise AssertionError("the body must not be read")
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "PATCH", "path": "/upload", "headers": [(b"content-length", b"5000")]}
+        asyncio.run(ContentLengthLimitMiddleware(app, {"/upload": 1000})(scope, receive, send))
+        self.assertEqual(sent[0]["status"], 413)
+
+
+if __name__ == '__main__':
+    unittest.main()